@@ -15,7 +15,7 @@ as an export from the online registry.
 
 The object model builds on [SQLAlchemy](http://sqlalchemy.org) to
 provide persistence and querying of the object model from within a SQL
-database.
+database. SQLAlchemy 0.8 or later is required.
 
 ## Usage
 
@@ -85,6 +85,25 @@ underlying database):
     >>> del epsg4326
     >>> assert registry['urn:ogc:def:crs:EPSG::4326'] == name
 
+### Identifiers
+
+As well as URNs, registry keys can be given in the other common forms
+of EPSG identifier: versioned URNs, OGC HTTP URIs, `EPSG:<code>`
+strings and bare codes:
+
+    >>> crs = registry['urn:ogc:def:crs:EPSG::27700']
+    >>> assert registry['http://www.opengis.net/def/crs/EPSG/0/27700'] is crs
+    >>> assert registry['EPSG:27700'] is crs
+    >>> assert registry[27700] is crs
+    >>> assert 'EPSG:27700' in registry
+
+This applies to `Registry.__getitem__`, `__contains__` and `getMany`.
+The object type of a bare code is ambiguous: it is resolved using an
+index on the codes, preferring coordinate reference systems, then
+datums, coordinate systems, ellipsoids, prime meridians, areas and
+axes. The module `epsg.urn` provides the normalisation as
+`urn.normalise`, which memoises its results.
+
 ### Querying the registry
 
 Complex registry queries can be performed by using the SQLAlchemy API,
@@ -98,10 +117,52 @@ insensitive substring `airy`:
     >>> from epsg import schema
     >>> registry.session.query(schema.Ellipsoid).filter(schema.Ellipsoid.name.ilike('%airy%')).all()
 
+The columns referencing other objects, the names of objects and their
+classes are indexed, so queries filtering on them (e.g.
+`filter(schema.ProjectedCRS.baseGeodeticCRS == crs)` or
+`filter_by(name='OSGB 1936')`) do not scan whole tables.
+
 See
 [querying in SQLAlchemy](http://docs.sqlalchemy.org/en/latest/orm/tutorial.html#querying)
 for further details.
 
+### Searching the registry
+
+Objects can be found by free text using `Registry.search`, which
+matches the words in the names, remarks, scopes and descriptions of
+objects. Search words also match words they are the start of. The
+results can be restricted to particular classes of object and to a
+maximum number of results:
+
+    >>> from epsg import schema
+    >>> registry.search('British National Grid')
+    [<ProjectedCRS('urn:ogc:def:crs:EPSG::27700','OSGB 1936 / British National Grid')>]
+    >>> ellipsoids = registry.search('airy', types=[schema.Ellipsoid], limit=10)
+
+With SQLite the text is indexed in an FTS5 full text index, which is
+maintained by triggers, and the results are ranked by relevance with
+matches in names ranked highest. Other databases fall back to
+scanning the text for substrings and order the results by name. The
+`epsg.fulltext` module provides the underlying queries.
+
+### Spatial queries
+
+The coordinate reference systems and datums whose area of use
+contains a location or intersects a bounding box (given as west,
+south, east and north bounds in degrees) can be found using
+`Registry.findByLocation` and `Registry.findByBBox`. These can be
+restricted to particular classes of object:
+
+    >>> from epsg import schema
+    >>> crss = registry.findByLocation(-1.5, 52.5, types=[schema.ProjectedCRS])
+    >>> datums = registry.findByBBox(170, -50, -170, -40, types=[schema.Datum])
+
+Bounding boxes and areas of use with a west bound greater than their
+east bound cross the antimeridian. With SQLite the areas of use are
+indexed in an R-tree virtual table which is maintained by triggers;
+other databases fall back to scanning the areas of use. The
+`epsg.spatial` module provides the underlying queries.
+
 ### Loading registry data
 
 Registries can be initialised with specific data by using specific
@@ -130,6 +191,27 @@ Loaders can be created from XML files...
     >>> loader = XMLLoader(xml)
     >>> loader.load() # create the objects from the XML
 
+Tools that only need a handful of objects can avoid parsing the whole
+export by using `IndexedXML`. This memory maps the file, indexes the
+position of each entry and only parses the requested entries and the
+entries they reference:
+
+    >>> from epsg.load import IndexedXML
+    >>> xml = IndexedXML.FromFile('./GmlDictionary.xml')
+    >>> crs = XMLLoader(xml)['urn:ogc:def:crs:EPSG::27700']
+
+The index can be saved to a file of your choosing and reused while
+the export is unchanged by passing `indexPath`. The index is pickled,
+so only use a location that is writable by trusted users:
+
+    >>> xml = IndexedXML.FromFile('./GmlDictionary.xml', indexPath='./GmlDictionary.idx')
+
+The number of entries of each type in the XML is available without
+loading any objects:
+
+    >>> xml.stats['ProjectedCRS']
+    1
+
 ...or from XML strings...
 
     >>> xml = XML.FromString(gml)
@@ -140,6 +222,29 @@ Loaders can be created from XML files...
 
     >>> loader = registry.getLoader(gml)
 
+Parsing the GML can be avoided when the same export is loaded
+repeatedly (e.g. by different processes) by caching the loaded objects
+on disk:
+
+    >>> from epsg.cache import LoaderCache
+    >>> cache = LoaderCache('/var/cache/epsg', maxSize=512 * 1024 * 1024)
+    >>> loader = registry.getLoader(gml, cache=cache)
+
+The cached objects are pickled, so the cache directory must only be
+writable by trusted users: entries not owned by the current user or
+writable by group or others are ignored.
+
+Building a DOM of the complete EPSG export requires a lot of
+memory. `StreamingXML` is a drop in replacement for `XML` that scans
+the GML incrementally, retains only the position of each dictionary
+entry in the file and only parses individual entries as they are
+requested by the loader:
+
+    >>> from epsg.load import StreamingXML
+    >>> xml = StreamingXML.FromFile('./GmlDictionary.xml')
+    >>> loader = XMLLoader(xml)
+    >>> loader.load()
+
 ### Updating registries
 
 `Registry` objects implement the `MutableMapping` interface which
@@ -155,6 +260,18 @@ themselves provide the correct interface...
 
     >>> registry2.update(loader)
 
+Populating an empty registry is much faster using `bulkInsert`,
+which writes the database rows directly rather than merging each
+object into the session (`init` does this automatically):
+
+    >>> registry2 = Registry(loader=False)
+    >>> registry2.bulkInsert(loader.itervalues())
+
+Similarly `upsertMany` efficiently updates a populated registry,
+inserting new objects and replacing existing ones in batches:
+
+    >>> registry2.upsertMany(loader)
+
 ### Copying registries
 
 Copying registries is simply a case of initialising a registry with
@@ -163,6 +280,17 @@ another registry or loader:
     >>> registry2 = Registry(loader=registry)
     >>> registry2 = Registry(loader=loader)
 
+### Snapshots
+
+For read only use an immutable in-memory copy of a registry (or
+loader) can be created. This holds compact records mirroring the
+`epsg.schema` classes without any SQLAlchemy overhead, and offers the
+same lookup interface as a registry:
+
+    >>> snapshot = registry.snapshot()
+    >>> crs = snapshot['urn:ogc:def:crs:EPSG::27700']
+    >>> crs.baseGeodeticCRS.geodeticDatum.ellipsoid.name
+
 ### Persisting registries
 
 For efficiency reasons an application will most likely not want to
@@ -175,13 +303,155 @@ cache which can be updated as required:
     >>> engine = create_engine('sqlite:///./epsg-registry.sqlite')
     >>> registry = Registry(engine)
     >>> registry.init() # refresh as required
+
+`init` records the registry metadata: the version of the object
+model, the version of the EPSG dataset, when it was loaded and a hash
+of its content. Opening a registry reads this with a single query,
+and a database initialised by a different version of the object model
+is initialised again:
+
+    >>> registry.getMetadata()['datasetVersion']
+    '7.9.6'
+
+Applications running many processes, such as pre-forking servers,
+can instead build a registry file once and open it read-only from
+every process:
+
+    >>> Registry.Publish('./epsg-registry.sqlite')  # build once
+    >>> registry = Registry.FromFile('./epsg-registry.sqlite', cacheSize=1000)
+
+A published registry is a single file which readers never write to,
+so it can be placed in a read-only directory. Readers memory map the
+file, so opening a registry is quick and the memory mapped data is
+shared between the processes. Read-only registries are never initialised
+and refuse writes. Engines created before a process forks can be
+used by the child process, which opens its own connections.
+
+### Caching lookups
+
+Applications that repeatedly look up the same objects can avoid
+querying the database each time by enabling an in-memory cache of
+the most recently used objects, optionally expiring them after a
+number of seconds:
+
+    >>> registry = Registry(engine, cacheSize=1000, cacheTTL=3600)
+    >>> crs = registry['urn:ogc:def:crs:EPSG::27700'] # cached
+    >>> registry.cache.hits, registry.cache.misses
+
+The cache is discarded whenever the registry is modified.
+
+Many objects can be retrieved at once using `getMany`, which queries
+the database in batches and eagerly loads all the objects they
+reference, so walking the returned objects does not query the
+database further:
+
+    >>> crss = registry.getMany(['urn:ogc:def:crs:EPSG::27700', 'urn:ogc:def:crs:EPSG::4326'])
+
+Objects can also be retrieved by ranges of EPSG codes, the numeric
+part of their identifiers, which are indexed along with the object
+type (e.g. 'crs' or 'datum'):
+
+    >>> utm = registry.getRange('crs', 32601, 32660)
+
+Objects reference each other (e.g. a projected CRS references its
+base geographic CRS which in turn references a datum) and by default
+referenced objects are only retrieved from the database when they are
+accessed. Registries can instead eagerly load them using a loading
+profile: 'definition' loads the objects defining a reference system,
+such as datums, ellipsoids and coordinate systems, while 'full' loads
+everything. The profile can also be specified for individual calls to
+`getMany`:
+
+    >>> registry = Registry(engine, profile='definition')
+    >>> crss = registry.getMany(keys, profile='shallow')
+
+Each class of object is stored in its own table and by default the
+tables other than `Identifier` are only queried once their attributes
+are accessed. The `polymorphic` argument changes this: 'joined'
+queries all tables at once while 'discriminator' looks up the class of
+an object before querying only the tables of that class:
+
+    >>> registry = Registry(engine, polymorphic='discriminator')
+
+Checking for the presence of identifiers (e.g. validating user input)
+can avoid the database entirely by holding all identifiers in memory:
+
+    >>> registry = Registry(engine, cacheKeys=True)
+    >>> 'urn:ogc:def:crs:EPSG::27700' in registry
+
+The number of objects of each class is returned by `stats`. These
+counts, along with `len()`, can also be held in memory:
+
+    >>> registry = Registry(engine, cacheCounts=True)
+    >>> registry.stats()['ProjectedCRS']
+
+### Thread safety
+
+A registry can be shared by the threads of a multithreaded
+application (e.g. a web server) by passing `threadSafe=True`. Each
+thread then uses its own database session and lookup cache, while
+the threads share a pool of database connections. Engines suitable
+for this are created by `Registry.CreateEngine`:
+
+    >>> engine = Registry.CreateEngine('sqlite:///./epsg-registry.sqlite', threadSafe=True)
+    >>> registry = Registry(engine, cacheSize=1000, threadSafe=True)
+
+An in-memory SQLite database only exists as long as its connection,
+so all the threads share a single connection and transaction: it
+should only be written to by one thread at a time.
+
+Objects retrieved in one thread should not be passed to another. A
+thread's session can be discarded when it has finished with it, for
+instance at the end of a request:
+
+    >>> registry.session.remove()
+
+### Non-blocking access
+
+Event driven applications can avoid blocking on database I/O by
+wrapping a thread safe registry in an `epsg.asynchronous.AsyncRegistry`.
+This runs the registry operations on a bounded pool of threads,
+immediately returning a result object for each:
+
+    >>> from epsg.asynchronous import AsyncRegistry
+    >>> registry = AsyncRegistry(Registry(engine, threadSafe=True), workers=4)
+    >>> result = registry.get('EPSG:27700')
+    >>> result.ready()          # poll from the event loop
+    >>> crs = result.get()
+
+`get`, `getMany`, `contains` and `init` are available, and
+`iterValues` returns a result whose value iterates over the results
+of batches of the objects in the registry. Objects are returned as the immutable records of the
+`snapshot` module, as `schema` objects cannot be shared between
+threads.
 """
 
 __version__ = '0.1.5'
 
-import schema, load, service
+import os
+import threading
+import sqlalchemy
+
+# the object model and the `snapshot` records are built from mapper
+# APIs introduced in SQLAlchemy 0.8
+if tuple(int(part) for part in sqlalchemy.__version__.split('.')[:2]) < (0, 8):
+    raise ImportError('SQLAlchemy >= 0.8 is required, found %s' % sqlalchemy.__version__)
+
+import schema, load, service, cache, bulk, snapshot, urn, spatial, fulltext, published
 from collections import MutableMapping
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.exc import InvalidRequestError, DBAPIError
+from sqlalchemy.sql import exists, select
+
+class NullLock(object):
+    """
+    A lock that does nothing, used by registries that are not thread safe
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
 
 class Registry(MutableMapping):
     """
@@ -198,28 +468,111 @@ class Registry(MutableMapping):
 
     >>> from epsg import Registry
     >>> registry = Registry()   # use in-memory database
+
+    Lookups can be cached in memory by specifying the maximum number of
+    objects to retain using `cacheSize` and optionally the number of
+    seconds they are retained for using `cacheTTL`.
+
+    The objects referenced by those that are looked up can be loaded
+    eagerly by specifying a loading `profile`: 'shallow' (the
+    default) loads references lazily, 'definition' loads the objects
+    defining a reference system, such as datums, ellipsoids and
+    coordinate systems, and 'full' loads everything.
+
+    Objects are instances of subclasses of `schema.Identifier`, each
+    class being stored in its own table. The `polymorphic` argument
+    determines how the tables of an object are queried: 'select' (the
+    default) queries the `Identifier` table first and the remaining
+    tables once their attributes are accessed, 'joined' joins every
+    table in one query and 'discriminator' queries the class of the
+    object first and then only the tables of that class.
+
+    If `cacheKeys=True` the identifiers of all objects are held in
+    memory so that looking up absent identifiers never queries the
+    database. Similarly if `cacheCounts=True` the number of objects of
+    each class is held in memory, making `len()` and `stats()` cheap.
+    Both assume the database is only modified through the registry.
+
+    If `threadSafe=True` the registry can be shared by multiple
+    threads: each thread uses its own database session and lookup
+    cache, while updates to the in-memory identifiers, codes and
+    counts are serialised by a lock. Engines for use by multiple
+    threads can be created using `Registry.CreateEngine`.
+
+    If `readOnly=True` the database is never initialised: it must
+    already contain a registry, otherwise a `ValueError` is raised.
+    Read-only registry files can be created using `Registry.Publish`
+    and opened using `Registry.FromFile`.
     """
 
-    def __init__(self, engine=None, loader=None):
-        from sqlalchemy.orm import sessionmaker
+    def __init__(self, engine=None, loader=None, cacheSize=None, cacheTTL=None, profile=None,
+                 polymorphic='select', cacheKeys=False, cacheCounts=False, threadSafe=False,
+                 readOnly=False):
+        from sqlalchemy.orm import sessionmaker, scoped_session
         from sqlalchemy.engine import Engine
 
         if engine is None:
-            from sqlalchemy import create_engine
             # create an in-memory sqlite database as default
-            self.engine = create_engine('sqlite:///:memory:')
+            self.engine = self.CreateEngine(threadSafe=threadSafe)
         elif not isinstance(engine, Engine):
             raise TypeError('Wrong type for `engine` argument: %s' % type(engine))
         else:
             self.engine = engine
 
         Session = sessionmaker(self.engine, autocommit=True)
-        self.session = Session()
+        self.threadSafe = threadSafe
+        self.readOnly = readOnly
+        if threadSafe:
+            # each thread uses its own session through the proxy
+            self.session = scoped_session(Session)
+            # guards the in-memory key set, codes and counts
+            self.lock = threading.RLock()
+        else:
+            self.session = Session()
+            self.lock = NullLock()
+
+        if profile is not None:
+            bulk.getProfile(profile)    # check the profile exists
+        self.profile = profile
+
+        bulk.checkPolymorphic(polymorphic)
+        self.polymorphic = polymorphic
+
+        # the optional set of all identifiers in the registry, and
+        # those identifiers indexed by code, created when first needed
+        self.keySet = None
+        self.keyCodes = None
+
+        # the identifiers resolved from codes without an object type
+        self.codes = {}
+
+        # the optional number of objects of each class, computed on
+        # demand
+        self.cacheCounts = cacheCounts
+        self.counts = None
+
+        # the optional cache of lookups by identifier, including those
+        # of identifiers that are not present
+        self.cache = None
+        if cacheSize:
+            if threadSafe:
+                self.cache = cache.ThreadLocalCache(cacheSize, cacheTTL)
+            else:
+                self.cache = cache.LRUCache(cacheSize, cacheTTL)
 
         # Initialise the database if required
-        if not self.isInitialised() or loader:
+        if readOnly:
+            if loader:
+                raise ValueError('A loader cannot be used with a read-only registry')
+            if not self.isInitialised():
+                raise ValueError('The read-only registry database is not initialised by model version %d: %s' %
+                                 (schema.MODEL_VERSION, self.engine.url))
+        elif not self.isInitialised() or loader:
             self.init(loader)
 
+        if cacheKeys:
+            self.keySet = set(self)
+
     def __repr__(self):
         return '<Registry(%s)>' % repr(str(self.engine.url))
 
@@ -231,14 +584,21 @@ class Registry(MutableMapping):
         """
         Retrieve an item by its identifier
 
-        e.g.
+        As well as URNs, any of the forms of identifier accepted by
+        `normaliseKey` can be used. e.g.
         >>> registry['urn:ogc:def:crs:EPSG::27700']
+        >>> registry['EPSG:27700']
         """
-        if not isinstance(key, (str, unicode)):
-            raise TypeError('String expected for key, found: %s' % type(key))
-
-        value = self.session.query(schema.Identifier).filter_by(identifier=key).first()
-        if not value:
+        value = None
+        if isinstance(key, basestring):
+            # stored identifiers are matched exactly before the key
+            # is normalised
+            value = self.lookup(key)
+        if value is None:
+            identifier = self.normaliseKey(key)
+            if identifier is not None and identifier != key:
+                value = self.lookup(identifier)
+        if value is None:
             raise KeyError(key)
 
         return value
@@ -259,16 +619,45 @@ class Registry(MutableMapping):
             if session and session != self.session:
                 session.refresh(value)
 
+            # the referenced objects may be added or replaced: their
+            # previous classes are only needed to maintain the counts
+            objects = previous = None
+            counted = self.counts is not None
+            if counted or self.keySet is not None:
+                objects = bulk.getObjects([value])
+            if counted:
+                previous = bulk.getExistingClasses(self.session.connection(), objects.keys(), 500)
+
             # use `merge` instead of `add` in case the value comes
             # from another session
             self.session.merge(value, load=True)
 
+        self.invalidate()
+        with self.lock:
+            if self.keySet is not None:
+                self.keySet.update(objects)
+                self.keyCodes = None
+            if previous is not None:
+                self.updateCounts(objects.itervalues(), 1, previous)
+            else:
+                # counts computed while the value was being merged may
+                # not include it
+                self.counts = None
+
     def __delitem__(self, key):
         value = self[key]
         self.session.delete(value)
         self.session.flush()
+        self.invalidate()
+        with self.lock:
+            if self.keySet is not None:
+                self.keySet.discard(value.identifier)
+                self.keyCodes = None
+            self.updateCounts([value], -1)
 
     def __len__(self):
+        if self.cacheCounts:
+            return sum(self.getCounts().itervalues())
         return self.session.query(schema.Identifier).count()
 
     def __iter__(self):
@@ -278,7 +667,7 @@ class Registry(MutableMapping):
     # a more performant override of the default MutableMapping
     # `itervalues` implementation
     def itervalues(self):
-        for value in self.session.query(schema.Identifier):
+        for value in bulk.iterate(self.session, self.polymorphic):
             yield value
 
     # a more performant override of the default MutableMapping
@@ -290,12 +679,352 @@ class Registry(MutableMapping):
     # a more performant override of the default MutableMapping
     # `__contains__` implementation
     def __contains__(self, key):
-        return self.session.query(schema.Identifier).filter_by(identifier=key).count() == 1
+        # stored identifiers are matched exactly before the key is
+        # normalised
+        if isinstance(key, basestring) and self.hasIdentifier(key):
+            return True
+
+        try:
+            identifier = self.normaliseKey(key)
+        except TypeError:
+            return False
+        if identifier is None or identifier == key:
+            return False
+        return self.hasIdentifier(identifier)
+
+    def hasIdentifier(self, key):
+        """
+        Return True if an object has exactly the identifier `key`
+        """
+        if self.keySet is not None:
+            return key in self.keySet
+
+        if self.cache is not None:
+            value = self.cache.get(key, self)
+            if value is not self:
+                return value is not None
+
+        # probe the primary key of the base table only
+        table = schema.Identifier.__table__
+        return self.session.query(exists().where(table.c.identifier == key)).scalar()
 
     # a more performant override of the default MutableMapping `clear`
     # implementation
     def clear(self):
+        self.invalidate()
         self.session.query(schema.Identifier).delete()
+        with self.lock:
+            if self.keySet is not None:
+                self.keySet.clear()
+                self.keyCodes = None
+            if self.cacheCounts:
+                self.counts = {}
+
+    def getMany(self, keys, missing='skip', profile=None):
+        """
+        Retrieve many items by their identifiers
+
+        The items are returned as a list in the order of `keys`. They
+        are retrieved in batches rather than one at a time, along with
+        all the objects they reference. Keys that are not present are
+        omitted if `missing='skip'` (the default), represented by
+        `None` if `missing=None` or cause a `KeyError` if
+        `missing='raise'`.
+
+        The referenced objects loaded are determined by the loading
+        `profile`, which defaults to that of the registry or, if the
+        registry has none, 'full'. e.g.
+
+        >>> registry.getMany(['urn:ogc:def:crs:EPSG::27700', 'urn:ogc:def:crs:EPSG::4326'])
+        """
+        if missing not in ('skip', 'raise', None):
+            raise ValueError('Unknown value for `missing`: %s' % missing)
+
+        if profile is None:
+            profile = self.profile or 'full'
+        bulk.getProfile(profile)        # check the profile exists
+
+        keys = list(keys)
+        identifiers = [self.normaliseKey(key) for key in keys]
+
+        found = {}
+        if self.cache is None:
+            required = set(identifiers)
+        else:
+            required = set()
+            for key in set(identifiers):
+                value = self.cache.get(key, self)
+                if value is self:
+                    required.add(key)
+                elif value is not None:
+                    found[key] = value
+
+        required.discard(None)
+        if self.keySet is not None:
+            required.intersection_update(self.keySet)
+
+        if required:
+            polymorphic = self.getBatchPolymorphic()
+            objects = bulk.select(self.session, required, polymorphic=polymorphic)
+            if profile != 'shallow':
+                bulk.loadReferences(self.session, objects, profile=profile, polymorphic=polymorphic)
+            found.update(objects)
+            if self.cache is not None:
+                for key in required:
+                    self.cache[key] = objects.get(key)
+
+        values = []
+        for key, identifier in zip(keys, identifiers):
+            value = found.get(identifier)
+            if value is None:
+                if missing == 'raise':
+                    raise KeyError(key)
+                elif missing == 'skip':
+                    continue
+            values.append(value)
+
+        return values
+
+    def getRange(self, objectType, start, end, profile=None):
+        """
+        Retrieve the objects of a type with codes in a range
+
+        The objects of the EPSG object type (the type component of
+        their URN e.g. 'crs') with codes from `start` to `end`
+        inclusive are returned as a list ordered by code. The
+        referenced objects loaded are determined by the loading
+        `profile` as with `getMany`. e.g.
+
+        >>> utm = registry.getRange('crs', 32601, 32660)
+        """
+        table = schema.Identifier.__table__
+        query = select([table.c.identifier]).where(
+            (table.c.objectType == objectType) & table.c.code.between(start, end)
+            ).order_by(table.c.code)
+        keys = [row[0] for row in self.session.execute(query)]
+        return self.getMany(keys, profile=profile)
+
+    def findByLocation(self, lon, lat, types=None, profile=None):
+        """
+        Retrieve the objects whose area of use contains a location
+
+        The location is given as a longitude and latitude in degrees.
+        `types` restricts the objects returned to those of a sequence
+        of `schema` classes with a `domainOfValidity` (e.g.
+        `schema.ProjectedCRS` or `schema.Datum`); by default all
+        coordinate reference systems and datums are returned. The
+        objects are returned as a list ordered by identifier, loaded
+        according to `profile` as with `getMany`. e.g.
+
+        >>> crss = registry.findByLocation(-1.5, 52.5, types=[schema.CoordinateReferenceSystem])
+        """
+        return self.findByBBox(lon, lat, lon, lat, types, profile)
+
+    def findByBBox(self, west, south, east, north, types=None, profile=None):
+        """
+        Retrieve the objects whose area of use intersects a bounding box
+
+        The bounding box is given in degrees and crosses the
+        antimeridian if `west` is greater than `east`. Otherwise this
+        behaves like `findByLocation`.
+        """
+        boxes = spatial.splitBBox(west, south, east, north)
+        with self.session.begin(subtransactions=True):
+            keys = spatial.find(self.session.connection(), boxes, types)
+        return self.getMany(keys, profile=profile)
+
+    def search(self, text, types=None, limit=None, profile=None):
+        """
+        Retrieve the objects matching a free text search
+
+        Objects match if their name, remarks, scope or description
+        contain every word in `text`, or words beginning with them.
+        `types` restricts the objects returned to those of a sequence
+        of `schema` classes and `limit` is the maximum number of
+        objects returned. The objects are returned as a list, most
+        relevant first, loaded according to `profile` as with
+        `getMany`. If neither `profile` nor the registry's profile is
+        set the objects are loaded in a single query as they would be
+        when looked up individually, with their references loaded
+        lazily. e.g.
+
+        >>> ellipsoids = registry.search('airy', types=[schema.Ellipsoid])
+        """
+        with self.session.begin(subtransactions=True):
+            keys = fulltext.find(self.session.connection(), text, types, limit)
+        if profile is None:
+            profile = self.profile
+        if profile is not None:
+            return self.getMany(keys, profile=profile)
+
+        objects = bulk.select(self.session, keys, polymorphic=self.polymorphic)
+        return [objects[key] for key in keys if key in objects]
+
+    def normaliseKey(self, key):
+        """
+        Return the identifier of the object a key refers to
+
+        Keys can be EPSG URNs (optionally versioned), OGC HTTP URIs
+        (e.g. 'http://www.opengis.net/def/crs/EPSG/0/4326'), strings
+        of the form 'EPSG:4326' or codes as integers or strings. Codes
+        without an object type are resolved using the index of codes,
+        preferring coordinate reference systems when several objects
+        share a code, and None is returned if no object has the code.
+        Other strings are returned unchanged.
+        """
+        normalised = urn.normalise(key)
+        if normalised is None:
+            if not isinstance(key, basestring):
+                raise TypeError('String or integer expected for key, found: %s' % type(key))
+            return key
+
+        identifier, code = normalised
+        if identifier is not None:
+            return identifier
+
+        try:
+            return self.codes[code]
+        except KeyError:
+            pass
+
+        # resolve and memoise the code while holding the lock so that
+        # a concurrent `invalidate` cannot be overwritten by a stale
+        # resolution
+        with self.lock:
+            if self.keySet is not None:
+                # the codes are parsed from the identifiers in the same
+                # way as those stored in the database
+                if self.keyCodes is None:
+                    self.keyCodes = urn.indexCodes(self.keySet)
+                identifiers = self.keyCodes.get(code)
+            else:
+                table = schema.Identifier.__table__
+                query = select([table.c.identifier]).where(table.c.code == code)
+                identifiers = [row[0] for row in self.session.execute(query)]
+
+            identifier = self.codes[code] = urn.choose(identifiers)
+        return identifier
+
+    def lookup(self, key):
+        """
+        Return the object with an identifier or None if it is absent
+
+        The cache is consulted first if the registry has one.
+        """
+        if self.keySet is not None and key not in self.keySet:
+            return None
+
+        if self.cache is not None:
+            value = self.cache.get(key, self)
+            if value is not self:
+                # `self` is used for uncached keys as it can never be
+                # a value
+                return value
+
+        value = bulk.get(self.session, key, self.polymorphic)
+        if value is not None and self.profile not in (None, 'shallow'):
+            bulk.loadReferences(self.session, {key: value}, profile=self.profile,
+                                polymorphic=self.getBatchPolymorphic())
+
+        if self.cache is not None:
+            self.cache[key] = value
+        return value
+
+    def snapshot(self):
+        """
+        Return an immutable in-memory copy of the registry
+
+        This is a `snapshot.Snapshot` holding records that mirror the
+        objects in the registry without any dependency on the
+        database.
+        """
+        polymorphic = self.getBatchPolymorphic()
+        objects = dict((value.identifier, value) for value in bulk.iterate(self.session, polymorphic))
+        bulk.loadReferences(self.session, objects, polymorphic=polymorphic)
+        return snapshot.Snapshot.FromObjects(objects.itervalues())
+
+    def stats(self):
+        """
+        Return the number of objects of each class in the registry
+
+        A dictionary mapping class names to counts is returned. e.g.
+
+        >>> registry.stats()['ProjectedCRS']
+        """
+        return dict(self.getCounts())
+
+    def getCounts(self):
+        """
+        Return the number of objects of each class
+
+        The counts are retrieved from the database unless they are
+        held in memory.
+        """
+        counts = self.counts
+        if counts is not None:
+            return counts
+
+        with self.lock:
+            with self.session.begin(subtransactions=True):
+                counts = bulk.getCounts(self.session.connection())
+            if self.cacheCounts:
+                self.counts = counts
+        return counts
+
+    def updateCounts(self, values, delta, previous=None):
+        """
+        Adjust the in-memory counts for objects added or removed
+
+        `previous` optionally maps the identifiers of objects that
+        replace existing objects to the class the existing objects
+        had: these are no longer counted.
+        """
+        from sqlalchemy.orm import object_mapper
+
+        with self.lock:
+            counts = self.counts
+            if counts is None:
+                return
+
+            changes = {}
+            for value in values:
+                identity = object_mapper(value).polymorphic_identity
+                replaced = None if previous is None else previous.get(value.identifier)
+                if replaced == identity:
+                    continue
+                changes[identity] = changes.get(identity, 0) + delta
+                if replaced is not None:
+                    changes[replaced] = changes.get(replaced, 0) - delta
+
+            for identity, change in changes.iteritems():
+                count = counts.get(identity, 0) + change
+                if count > 0:
+                    counts[identity] = count
+                else:
+                    counts.pop(identity, None)
+
+    def getBatchPolymorphic(self):
+        """
+        Return the polymorphic loading mode used for batches of objects
+
+        Objects retrieved in batches are always loaded completely, so
+        the 'select' mode, which would query each object's tables
+        separately, is replaced by 'joined'.
+        """
+        if self.polymorphic == 'select':
+            return 'joined'
+        return self.polymorphic
+
+    def invalidate(self):
+        """
+        Discard any cached lookups
+
+        This is called whenever the registry is modified.
+        """
+        if self.cache is not None:
+            self.cache.clear()
+        with self.lock:
+            self.codes.clear()
 
     def init(self, loader=None):
         """
@@ -306,38 +1035,247 @@ class Registry(MutableMapping):
         from the specified registry object loader. If `loader=None`
         (the default) then a default loader is generated from the
         latest version of the online EPSG registry.
+
+        The registry metadata (see `getMetadata`) is then recorded.
         """
+        from datetime import datetime
+        from hashlib import sha1
+
+        if self.readOnly:
+            raise ValueError('A read-only registry cannot be initialised')
 
         if loader is None:
             loader = self.getLoader()
 
+        self.invalidate()
         with self.session.begin(subtransactions=True):
             conn = self.session.connection()
             schema.Base.metadata.drop_all(conn)
             schema.Base.metadata.create_all(conn)
-
+            self.session.expunge_all()
+            with self.lock:
+                if self.keySet is not None:
+                    self.keySet.clear()
+                    self.keyCodes = None
+                if self.cacheCounts:
+                    self.counts = {}
+
+            # the content is hashed from the rows as they are inserted
+            digest = sha1()
             if loader is not False:
-                self.update(loader)
+                self.bulkInsert(loader.itervalues(), digest)
 
-    def isInitialised(self):
+            conn.execute(schema.metadata_table.insert(), {
+                'schemaVersion': schema.MODEL_VERSION,
+                'datasetVersion': getattr(loader, 'version', None),
+                'loaded': datetime.utcnow(),
+                'contentHash': digest.hexdigest()
+                })
+
+    def bulkInsert(self, values, digest=None):
         """
-        Return True if the required database schema is present
+        Insert objects into the registry in bulk
+
+        This is a much faster alternative to `update` for populating
+        an empty registry: instead of merging each object into the
+        session, the rows representing the objects (and the objects
+        they reference) are written table by table in a single
+        transaction. The objects must not already be present in the
+        registry. A dictionary mapping identifiers to the objects
+        inserted is returned. `digest` is as accepted by `bulk.insert`.
         """
+        self.invalidate()
+        with self.session.begin(subtransactions=True):
+            objects = bulk.insert(self.session.connection(), values, digest=digest)
+
+        with self.lock:
+            if self.keySet is not None:
+                self.keySet.update(objects)
+                self.keyCodes = None
+            self.updateCounts(objects.itervalues(), 1)
+        return objects
 
+    def upsertMany(self, mapping):
+        """
+        Insert or update many objects in batches
+
+        `mapping` maps identifiers to objects, as with `update`. Rather
+        than merging each object into the session the rows
+        representing the objects (and the objects they reference) are
+        written table by table using the database's native `INSERT
+        ... ON CONFLICT DO UPDATE` where available, falling back to
+        batched updates and inserts elsewhere.
+        """
+        for key, value in mapping.iteritems():
+            if not isinstance(key, (str, unicode)):
+                raise TypeError('String expected for key, found: %s' % type(key))
+
+            if not isinstance(value, schema.Identifier):
+                raise ValueError('Expected subclass of `schema.Identifier`, found: %s' % type(value))
+
+            if key != value.identifier:
+                raise ValueError('Key does not match the object identifier: %s' % key)
+
+        self.invalidate()
+        previous = {}
         with self.session.begin(subtransactions=True):
-            conn = self.session.connection()
-            for table in schema.Base.metadata.tables.itervalues():
-                if not table.exists(conn):
-                    return False
-        return True
+            objects = bulk.upsert(self.session.connection(), mapping.itervalues(), existing=previous)
 
-    def getLoader(self, gml=None):
+        with self.lock:
+            if self.keySet is not None:
+                self.keySet.update(objects)
+                self.keyCodes = None
+            self.updateCounts(objects.itervalues(), 1, previous)
+
+        # objects in the session may no longer reflect the database
+        self.session.expire_all()
+
+    def getMetadata(self):
+        """
+        Return the metadata recorded when the registry was initialised
+
+        This is a dictionary of the `schemaVersion` (the
+        `schema.MODEL_VERSION` the registry was built by), the
+        `datasetVersion` of the EPSG dataset it was loaded from (if
+        known), the UTC time it was `loaded` and a `contentHash` of the
+        objects loaded (see `bulk.getDigest`). None is returned if the
+        database has no registry metadata.
+        """
+        table = schema.metadata_table
+        try:
+            with self.session.begin(subtransactions=True):
+                row = self.session.connection().execute(table.select()).first()
+        except DBAPIError:
+            # the metadata table does not exist
+            return None
+
+        if row is None:
+            return None
+        return dict((column.key, row[column]) for column in table.columns)
+
+    def isInitialised(self):
+        """
+        Return True if the registry was initialised by this model version
+
+        The registry metadata is read using a single query. Registries
+        initialised by other versions of the object model, or whose
+        schema is not present, are not initialised.
+        """
+        metadata = self.getMetadata()
+        return metadata is not None and metadata['schemaVersion'] == schema.MODEL_VERSION
+
+    @staticmethod
+    def CreateEngine(url='sqlite:///:memory:', threadSafe=False, readOnly=False,
+                     mmapSize=published.MMAP_SIZE, **kwargs):
+        """
+        Create a database engine for a registry
+
+        If `threadSafe=True` the engine's connection pool is
+        configured for use by multiple threads. SQLite file databases
+        then use a pool of connections which may be used by any thread
+        (`check_same_thread` is disabled, which is safe as a connection
+        is only used by one thread at a time). In-memory SQLite
+        databases exist only for the lifetime of their connection so a
+        single connection, and with it a single transaction, is shared
+        by every thread. Statements from different threads are then
+        serialised by SQLite but their transactions are not isolated,
+        so an in-memory database should only be written to by one
+        thread at a time: use a file database if threads write
+        concurrently. Other databases use the default pool.
+        Additional keyword arguments are passed to
+        `sqlalchemy.create_engine`.
+
+        If `readOnly=True` the engine is configured for read-only use
+        by `published.configureEngine`: SQLite connections refuse
+        writes and memory map up to `mmapSize` bytes of the database,
+        and connections created before a process forks are not used
+        by the child process. SQLite file connections are then kept
+        open between queries, by one connection per thread unless
+        `threadSafe=True`.
+        """
+        from sqlalchemy import create_engine
+        from sqlalchemy.engine.url import make_url
+        from sqlalchemy.pool import QueuePool, StaticPool, SingletonThreadPool
+
+        url = make_url(url)
+        if threadSafe and url.drivername.startswith('sqlite'):
+            connectArgs = kwargs.setdefault('connect_args', {})
+            connectArgs.setdefault('check_same_thread', False)
+            if url.database in (None, '', ':memory:'):
+                kwargs.setdefault('poolclass', StaticPool)
+            else:
+                kwargs.setdefault('poolclass', QueuePool)
+        elif readOnly and url.drivername.startswith('sqlite'):
+            # avoid reopening the file for every query
+            kwargs.setdefault('poolclass', SingletonThreadPool)
+        engine = create_engine(url, **kwargs)
+        if readOnly:
+            published.configureEngine(engine, mmapSize)
+        return engine
+
+    @classmethod
+    def Publish(cls, path, loader=None):
+        """
+        Create a SQLite registry file for read-only use
+
+        The file at `path` is populated from `loader`, which defaults
+        to a loader of the latest version of the online EPSG registry
+        (see `init`). The file is built under a temporary name and
+        then renamed, so that processes opening `path` never see a
+        partially built registry. Processes that already have the
+        file open continue to read the file it replaces.
+        """
+        import tempfile
+        from sqlalchemy import create_engine
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp('.sqlite', '.epsg-registry-', directory)
+        os.close(fd)
+        try:
+            engine = create_engine('sqlite:///%s' % tmp)
+            try:
+                registry = cls(engine, loader=loader)
+                registry.session.close()
+                connection = engine.connect()
+                try:
+                    published.finalise(connection)
+                finally:
+                    connection.close()
+            finally:
+                engine.dispose()
+            os.rename(tmp, path)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @classmethod
+    def FromFile(cls, path, mmapSize=published.MMAP_SIZE, **kwargs):
+        """
+        Open a registry file created by `Publish` for read-only use
+
+        Many processes can open the same file. Additional keyword
+        arguments are passed to the `Registry` constructor. e.g.
+
+        >>> registry = Registry.FromFile('epsg-registry.sqlite', cacheSize=1000)
+        """
+        if not os.path.isfile(path):
+            raise IOError('Registry file not found: %s' % path)
+        engine = cls.CreateEngine('sqlite:///%s' % os.path.abspath(path), threadSafe=kwargs.get('threadSafe', False),
+                                  readOnly=True, mmapSize=mmapSize)
+        return cls(engine, readOnly=True, **kwargs)
+
+    def getLoader(self, gml=None, cache=None):
         """
         Create a loader for EPSG objects
 
         By default the loader is created from GML returned by the EPSG
         web service but a custom GML string can be passed in using the
         `gml` parameter.
+
+        If a `cache.LoaderCache` is passed in as `cache` the objects
+        are retrieved from the cache when the same GML has been
+        loaded before, otherwise they are added to it.
         """
 
         if gml is None:
@@ -347,9 +1285,17 @@ class Registry(MutableMapping):
             gml = svc.export()
             svc.close()
 
+        if cache is not None:
+            loader = cache.get(gml)
+            if loader is not None:
+                return loader
+
         # load the gml into the EPSG object structure
         xml = load.XML.FromString(gml)
         loader = load.XMLLoader(xml)
         loader.load()
 
+        if cache is not None:
+            cache.set(gml, loader)
+
         return loader
@@ -0,0 +1,148 @@
+"""
+Non-blocking access to a registry
+
+`AsyncRegistry` runs registry operations on a bounded pool of worker
+threads so that event driven applications are not blocked by database
+I/O. Each operation immediately returns a
+`multiprocessing.pool.AsyncResult`, whose `ready()` method can be
+polled and whose `get()` method returns the result (raising any
+exception of the operation). A `callback` can also be passed to each
+operation, which is called with the result in a pool thread once it is
+available. e.g.
+
+>>> from epsg import Registry
+>>> from epsg.asynchronous import AsyncRegistry
+>>> engine = Registry.CreateEngine('sqlite:///./epsg-registry.sqlite', threadSafe=True)
+>>> registry = AsyncRegistry(Registry(engine, threadSafe=True))
+>>> result = registry.get('urn:ogc:def:crs:EPSG::27700')
+>>> crs = result.get()
+
+Objects are returned as the immutable records of the `snapshot`
+module, along with all the objects they reference, as `schema` objects
+are bound to the session of the thread that retrieved them.
+"""
+
+from multiprocessing.pool import ThreadPool
+import bulk, snapshot
+
+def getRecords(values):
+    """
+    Return records for `schema` objects
+
+    The records are returned as a list in the order of `values`, with
+    None in place of None values.
+    """
+    records = snapshot.createRecords(bulk.getObjects([value for value in values if value is not None]))
+    return [None if value is None else records[value.identifier] for value in values]
+
+class AsyncRegistry(object):
+    """
+    Run the operations of a registry on a pool of threads
+
+    `registry` must be a `Registry` created with `threadSafe=True`.
+    `workers` is the number of threads, which bounds the number of
+    operations running at once; further operations are queued. File
+    databases should be used as registries using in-memory SQLite
+    databases share a single connection between the threads.
+    """
+
+    def __init__(self, registry, workers=4):
+        if not getattr(registry, 'threadSafe', False):
+            raise ValueError('A registry created with `threadSafe=True` is required')
+        if workers < 1:
+            raise ValueError('The number of workers must be at least one: %r' % workers)
+
+        self.registry = registry
+        self.pool = ThreadPool(workers)
+
+    def __repr__(self):
+        return '<AsyncRegistry(%r)>' % self.registry
+
+    def submit(self, func, args=(), callback=None):
+        """
+        Run a function on the pool, returning an `AsyncResult`
+
+        The registry session of the pool thread is closed once the
+        function has returned, so it does not accumulate objects.
+        """
+        def run():
+            try:
+                return func(*args)
+            finally:
+                self.registry.session.remove()
+        return self.pool.apply_async(run, callback=callback)
+
+    def get(self, key, default=None, callback=None):
+        """
+        Retrieve an object by its identifier
+
+        Any of the keys accepted by `Registry` can be used. The object
+        is returned as a record, or `default` if the key is absent.
+        """
+        def get():
+            value = self.registry.get(key)
+            if value is None:
+                return default
+            return getRecords([value])[0]
+        return self.submit(get, callback=callback)
+
+    def getMany(self, keys, missing='skip', profile=None, callback=None):
+        """
+        Retrieve many objects by their identifiers
+
+        This behaves like `Registry.getMany`, returning a list of
+        records.
+        """
+        keys = list(keys)
+        return self.submit(lambda: getRecords(self.registry.getMany(keys, missing, profile)), callback=callback)
+
+    def contains(self, key, callback=None):
+        """
+        Return whether the registry contains an identifier
+        """
+        return self.submit(self.registry.__contains__, (key,), callback=callback)
+
+    def init(self, loader=None, callback=None):
+        """
+        (Re)initialise the registry database
+
+        This behaves like `Registry.init`.
+        """
+        return self.submit(self.registry.init, (loader,), callback=callback)
+
+    def iterValues(self, batchSize=500, prefetch=2, callback=None):
+        """
+        Iterate over the objects in the registry in batches
+
+        The identifiers in the registry are retrieved by the pool and
+        an `AsyncResult` is returned whose value is an iterator. This
+        yields an `AsyncResult` for each batch of at most `batchSize`
+        records, submitting the retrieval of each batch as the
+        iteration reaches it: up to `prefetch` further batches are
+        retrieved while a batch is processed. Neither this method nor
+        the iteration waits for the database. e.g.
+
+        >>> for result in registry.iterValues().get():
+        ...     records = result.get()
+        """
+        if batchSize < 1 or prefetch < 0:
+            raise ValueError('Invalid batch size or prefetch: %r, %r' % (batchSize, prefetch))
+
+        def iterBatches(keys):
+            pending = []
+            for batch in bulk.chunks(keys, batchSize):
+                pending.append(self.getMany(batch, profile='full'))
+                if len(pending) > prefetch:
+                    yield pending.pop(0)
+            for result in pending:
+                yield result
+
+        # the keys are retrieved before the iterator is returned
+        return self.submit(lambda: iterBatches(sorted(self.registry)), callback=callback)
+
+    def close(self):
+        """
+        Stop accepting operations and wait for those queued to finish
+        """
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,501 @@
+"""
+Bulk operations on the database tables underlying the object model
+
+These bypass the SQLAlchemy unit of work: the rows representing the
+objects are derived from the mappers in the `schema` module and
+written table by table using `executemany`.
+"""
+
+from sqlalchemy.orm import object_mapper, with_polymorphic
+from sqlalchemy.orm.interfaces import MANYTOONE
+import schema
+
+def getObjects(values):
+    """
+    Return the objects and all the objects they reference
+
+    A dictionary mapping identifiers to objects is returned.
+    """
+    objects = {}
+    stack = list(values)
+    while stack:
+        obj = stack.pop()
+        if obj is None or obj.identifier in objects:
+            continue
+        objects[obj.identifier] = obj
+
+        for prop in object_mapper(obj).relationships:
+            value = getattr(obj, prop.key)
+            if prop.uselist:
+                stack.extend(value)
+            else:
+                stack.append(value)
+
+    return objects
+
+def getColumnValue(obj, column):
+    """
+    Return the value of the attribute mapped to a column of an object
+    """
+    mapper = object_mapper(obj)
+    return getattr(obj, mapper.get_property_by_column(column).key)
+
+def getRows(objects):
+    """
+    Return the rows representing objects
+
+    A dictionary mapping each table to a list of rows is returned, a
+    row being a dictionary mapping column keys to values.
+    """
+    rows = {}
+    for obj in objects:
+        mapper = object_mapper(obj)
+
+        # the values of the columns mapped to attributes
+        values = {}
+        for prop in mapper.column_attrs:
+            value = getattr(obj, prop.key)
+            for column in prop.columns:
+                values[column] = value
+        if mapper.polymorphic_on is not None:
+            values[mapper.polymorphic_on] = mapper.polymorphic_identity
+
+        for prop in mapper.relationships:
+            value = getattr(obj, prop.key)
+            if prop.direction is MANYTOONE:
+                # foreign keys are derived from the referenced object
+                if value is not None:
+                    for local, remote in prop.local_remote_pairs:
+                        values[local] = getColumnValue(value, remote)
+            elif prop.secondary is not None:
+                # rows in the association table, in collection order
+                for child in value:
+                    row = {}
+                    for column, secondary in prop.synchronize_pairs:
+                        row[secondary.key] = getColumnValue(obj, column)
+                    for column, secondary in prop.secondary_synchronize_pairs:
+                        row[secondary.key] = getColumnValue(child, column)
+                    rows.setdefault(prop.secondary, []).append(row)
+
+        # a row in each table of the inheritance hierarchy
+        for table in mapper.tables:
+            row = dict((column.key, values.get(column)) for column in table.columns)
+            rows.setdefault(table, []).append(row)
+
+    return rows
+
+def insert(connection, values, batchSize=5000, digest=None):
+    """
+    Insert objects and the objects they reference into the database
+
+    The tables are written in dependency order, each with as few
+    `executemany` calls as possible. The objects must not already be
+    present in the database. A dictionary mapping identifiers to the
+    objects inserted is returned. If a hash object (e.g.
+    `hashlib.sha1()`) is passed as `digest` it is updated with the
+    rows inserted, as by `updateDigest`.
+    """
+    objects = getObjects(values)
+    rows = getRows(objects.itervalues())
+    if digest is not None:
+        updateDigest(digest, rows)
+    for table in schema.Base.metadata.sorted_tables:
+        tableRows = rows.get(table)
+        if not tableRows:
+            continue
+
+        statement = table.insert()
+        for i in xrange(0, len(tableRows), batchSize):
+            connection.execute(statement, tableRows[i:i + batchSize])
+
+    return objects
+
+def getDigest(objects):
+    """
+    Return a hash of the content of objects
+
+    `objects` is a dictionary mapping identifiers to objects, as
+    returned by `getObjects`. The SHA-1 hex digest of the rows
+    representing the objects is returned.
+    """
+    from hashlib import sha1
+
+    digest = sha1()
+    updateDigest(digest, getRows(objects.itervalues()))
+    return digest.hexdigest()
+
+def updateDigest(digest, rows):
+    """
+    Update a hash object with the content of rows
+
+    `rows` is as returned by `getRows`. The rows of each table are
+    hashed in a canonical order, so the result does not depend on
+    the order the objects were in.
+    """
+    for table in sorted(rows, key=lambda table: table.name):
+        digest.update(table.name)
+        for row in sorted(repr(sorted(row.iteritems())) for row in rows[table]):
+            digest.update(row)
+
+def getAssociationTables():
+    """
+    Return the association tables of many to many relationships
+
+    A dictionary mapping each association table to the columns
+    referencing the owners of the relationship is returned.
+    """
+    tables = {}
+    for mapper in schema.Identifier.__mapper__.self_and_descendants:
+        for prop in mapper.relationships:
+            if prop.secondary is not None:
+                columns = tables.setdefault(prop.secondary, set())
+                columns.update(secondary for column, secondary in prop.synchronize_pairs)
+    return tables
+
+def chunks(values, size):
+    values = list(values)
+    for i in xrange(0, len(values), size):
+        yield values[i:i + size]
+
+def supportsNativeUpsert(dialect):
+    """
+    Return True if the dialect supports `INSERT ... ON CONFLICT`
+    """
+    version = dialect.server_version_info or ()
+    if dialect.name == 'sqlite':
+        return version >= (3, 24)
+    if dialect.name == 'postgresql':
+        return version >= (9, 5)
+    return False
+
+def getUpsertStatement(table, dialect):
+    """
+    Return an `INSERT ... ON CONFLICT DO UPDATE` statement for a table
+
+    The syntax is shared by SQLite and PostgreSQL.
+    """
+    from sqlalchemy import text
+
+    quote = dialect.identifier_preparer.format_column
+    columns = list(table.columns)
+    keys = [quote(column) for column in table.primary_key.columns]
+    updates = ['%s = excluded.%s' % (quote(column), quote(column))
+               for column in columns if not column.primary_key]
+    if updates:
+        action = 'DO UPDATE SET %s' % ', '.join(updates)
+    else:
+        action = 'DO NOTHING'
+
+    return text('INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) %s' % (
+        dialect.identifier_preparer.format_table(table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join(':%s' % column.key for column in columns),
+        ', '.join(keys),
+        action))
+
+def getCounts(connection):
+    """
+    Return a dictionary mapping class names to the number of objects
+    """
+    from sqlalchemy import select, func
+
+    discriminator = schema.Identifier.__mapper__.polymorphic_on
+    query = select([discriminator, func.count()]).group_by(discriminator)
+    return dict(connection.execute(query).fetchall())
+
+def getExistingClasses(connection, identifiers, batchSize):
+    """
+    Return a dictionary mapping existing identifiers to their class
+    """
+    from sqlalchemy import select
+
+    table = schema.Identifier.__table__
+    discriminator = schema.Identifier.__mapper__.polymorphic_on
+    existing = {}
+    for chunk in chunks(identifiers, batchSize):
+        query = select([table.c.identifier, discriminator]).where(table.c.identifier.in_(chunk))
+        existing.update(connection.execute(query).fetchall())
+    return existing
+
+def upsert(connection, values, batchSize=1000, native=None, existing=None):
+    """
+    Insert or update objects and the objects they reference
+
+    Rows are written in batches, table by table in dependency order.
+    Native `INSERT ... ON CONFLICT DO UPDATE` statements are used
+    where the database supports them (SQLite >= 3.24, PostgreSQL >=
+    9.5), otherwise existing rows are updated and missing rows
+    inserted using separate batched statements. `native` can be
+    used to force either strategy.
+
+    The association rows of the objects' many to many relationships
+    are replaced, as are the rows of objects whose class has changed.
+    A dictionary mapping identifiers to the objects written is
+    returned. If a dictionary is passed as `existing` it is updated
+    with the previous class of the objects that were replaced.
+    """
+    from sqlalchemy import bindparam
+
+    if native is None:
+        native = supportsNativeUpsert(connection.dialect)
+
+    objects = getObjects(values)
+    rows = getRows(objects.itervalues())
+    identifiers = objects.keys()
+    sortedTables = schema.Base.metadata.sorted_tables
+
+    # remove the subclass rows of objects whose class has changed
+    polymorphicMap = schema.Identifier.__mapper__.polymorphic_map
+    stale = {}
+    classes = getExistingClasses(connection, identifiers, batchSize)
+    if existing is not None:
+        existing.update(classes)
+    for identifier, class_ in classes.iteritems():
+        new = object_mapper(objects[identifier])
+        if class_ != new.polymorphic_identity and class_ in polymorphicMap:
+            for table in set(polymorphicMap[class_].tables) - set(new.tables):
+                stale.setdefault(table, []).append(identifier)
+    for table in reversed(sortedTables):
+        for chunk in chunks(stale.get(table, ()), batchSize):
+            connection.execute(table.delete().where(table.c.identifier.in_(chunk)))
+
+    # replace the association rows
+    for table, columns in getAssociationTables().iteritems():
+        for column in columns:
+            for chunk in chunks(identifiers, batchSize):
+                connection.execute(table.delete().where(column.in_(chunk)))
+
+    for table in sortedTables:
+        tableRows = rows.get(table)
+        if not tableRows:
+            continue
+
+        keys = list(table.primary_key.columns)
+        if not keys:
+            # association tables have no primary key
+            for chunk in chunks(tableRows, batchSize):
+                connection.execute(table.insert(), chunk)
+            continue
+
+        if native:
+            statement = getUpsertStatement(table, connection.dialect)
+            for chunk in chunks(tableRows, batchSize):
+                connection.execute(statement, chunk)
+            continue
+
+        # update the existing rows and insert the rest
+        key = keys[0]
+        values = [column for column in table.columns if not column.primary_key]
+        update = None
+        if values:
+            update = table.update().where(key == bindparam('_key')).values(
+                dict((column.key, bindparam(column.key)) for column in values))
+        for chunk in chunks(tableRows, batchSize):
+            query = key.in_([row[key.key] for row in chunk])
+            existing = set(row[0] for row in connection.execute(table.select(query).with_only_columns([key])))
+            updates = [dict(row, _key=row[key.key]) for row in chunk if row[key.key] in existing]
+            inserts = [row for row in chunk if row[key.key] not in existing]
+            if updates and update is not None:
+                connection.execute(update, updates)
+            if inserts:
+                connection.execute(table.insert(), inserts)
+
+    return objects
+
+# Loading profiles: these determine which relationships are followed
+# when eagerly loading objects. Relationships that are not followed are
+# loaded lazily on access as usual.
+PROFILES = {
+    # no references are loaded
+    'shallow': lambda prop: False,
+    # the references defining an object, but not those describing it
+    'definition': lambda prop: prop.key not in ('domainOfValidity', 'descriptionReference'),
+    # all references
+    'full': lambda prop: True
+    }
+
+def getProfile(name):
+    """
+    Return the relationship filter of a loading profile
+    """
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError('Unknown loading profile: %s' % name)
+
+# Polymorphic loading modes: these determine how the columns of the
+# subclass tables are loaded when objects are retrieved by identifier.
+POLYMORPHIC = (
+    # query the `Identifier` table and load the subclass columns with a
+    # further query on access
+    'select',
+    # query the `Identifier` table outer joined to every subclass table
+    'joined',
+    # query the class of the object and then the tables of that class
+    'discriminator'
+    )
+
+def checkPolymorphic(polymorphic):
+    """
+    Raise a ValueError if a polymorphic loading mode is unknown
+    """
+    if polymorphic not in POLYMORPHIC:
+        raise ValueError('Unknown polymorphic loading mode: %s' % polymorphic)
+
+def getClass(identity):
+    """
+    Return the schema class with a polymorphic identity or None
+    """
+    mapper = schema.Identifier.__mapper__.polymorphic_map.get(identity)
+    if mapper is None:
+        return None
+    return mapper.class_
+
+_polymorphicEntity = None
+
+def getPolymorphicEntity():
+    """
+    Return an entity loading every subclass of `schema.Identifier`
+
+    The entity is created once as building the join of the subclass
+    tables is expensive.
+    """
+    global _polymorphicEntity
+    if _polymorphicEntity is None:
+        _polymorphicEntity = with_polymorphic(schema.Identifier, '*')
+    return _polymorphicEntity
+
+def get(session, identifier, polymorphic='select'):
+    """
+    Return the object with an identifier or None if it is absent
+    """
+    if polymorphic == 'discriminator':
+        identity = getExistingClasses(session, [identifier], 1).get(identifier)
+        class_ = getClass(identity)
+        if class_ is None:
+            return None
+        return session.query(class_).get(identifier)
+
+    query = session.query(schema.Identifier)
+    if polymorphic == 'joined':
+        query = query.with_polymorphic('*')
+    return query.filter_by(identifier=identifier).first()
+
+def select(session, identifiers, batchSize=500, polymorphic='joined'):
+    """
+    Return the objects with the specified identifiers
+
+    The objects are retrieved in batches using `IN` queries. A
+    dictionary mapping identifiers to objects is returned: identifiers
+    that are not present are omitted.
+    """
+    objects = {}
+
+    if polymorphic == 'discriminator':
+        classes = {}
+        for identifier, identity in getExistingClasses(session, set(identifiers), batchSize).iteritems():
+            classes.setdefault(getClass(identity), []).append(identifier)
+        classes.pop(None, None)
+
+        for class_, members in classes.iteritems():
+            column = class_.__mapper__.primary_key[0]
+            for chunk in chunks(members, batchSize):
+                for obj in session.query(class_).filter(column.in_(chunk)):
+                    objects[obj.identifier] = obj
+        return objects
+
+    entity = schema.Identifier
+    if polymorphic == 'joined':
+        entity = getPolymorphicEntity()
+    query = session.query(entity)
+    column = entity.identifier
+    for chunk in chunks(set(identifiers), batchSize):
+        for obj in query.filter(column.in_(chunk)):
+            objects[obj.identifier] = obj
+    return objects
+
+def iterate(session, polymorphic='select'):
+    """
+    Iterate over all objects
+
+    In the 'discriminator' polymorphic loading mode the objects are
+    grouped by class.
+    """
+    if polymorphic == 'discriminator':
+        discriminator = schema.Identifier.__mapper__.polymorphic_on
+        for mapper in schema.Identifier.__mapper__.self_and_descendants:
+            query = session.query(mapper.class_).filter(discriminator == mapper.polymorphic_identity)
+            for obj in query:
+                yield obj
+        return
+
+    query = session.query(schema.Identifier)
+    if polymorphic == 'joined':
+        query = query.with_polymorphic('*')
+    for obj in query:
+        yield obj
+
+def loadReferences(session, objects, batchSize=500, profile='full', polymorphic='joined'):
+    """
+    Eagerly load the objects referenced by objects, transitively
+
+    `objects` is a dictionary mapping identifiers to objects attached
+    to `session`. The references are retrieved level by level, using
+    batched `IN` queries for the objects and the association tables of
+    the many to many relationships. The relationships of each object
+    are then populated so that accessing them does not query the
+    database. Only the relationships selected by the named loading
+    `profile` are followed and the objects are retrieved using the
+    `polymorphic` loading mode.
+    """
+    from sqlalchemy import select as selectRows
+    from sqlalchemy.orm.attributes import instance_state, set_committed_value
+
+    follow = getProfile(profile)
+    loaded = dict(objects)
+    pending = objects.values()
+    while pending:
+        references = set()
+        scalars = []                    # (object, key, identifier)
+        collections = {}                # relationship: objects
+
+        for obj in pending:
+            mapper = object_mapper(obj)
+            state = instance_state(obj)
+            for prop in mapper.relationships:
+                if prop.key in state.dict or not follow(prop):
+                    continue            # already loaded or not required
+                if prop.secondary is not None:
+                    collections.setdefault(prop, []).append(obj)
+                    continue
+                local = prop.local_remote_pairs[0][0]
+                identifier = getattr(obj, mapper.get_property_by_column(local).key)
+                scalars.append((obj, prop.key, identifier))
+                if identifier is not None:
+                    references.add(identifier)
+
+        # retrieve the members of the collections
+        members = {}                    # (relationship, owner): identifiers
+        for prop, owners in collections.iteritems():
+            owner = prop.synchronize_pairs[0][1]
+            member = prop.secondary_synchronize_pairs[0][1]
+            for chunk in chunks(set(obj.identifier for obj in owners), batchSize):
+                query = selectRows([owner, member]).where(owner.in_(chunk))
+                for ownerId, memberId in session.execute(query):
+                    members.setdefault((prop, ownerId), []).append(memberId)
+                    references.add(memberId)
+
+        added = select(session, references.difference(loaded), batchSize, polymorphic)
+        loaded.update(added)
+
+        for obj, key, identifier in scalars:
+            set_committed_value(obj, key, loaded.get(identifier))
+
+        for prop, owners in collections.iteritems():
+            for obj in owners:
+                identifiers = members.get((prop, obj.identifier), ())
+                set_committed_value(obj, prop.key, [loaded[i] for i in identifiers if i in loaded])
+
+        pending = added.values()
+
+    return loaded
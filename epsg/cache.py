@@ -0,0 +1,343 @@
+"""
+Caching of loaded EPSG objects
+"""
+
+import os
+import time
+import threading
+import cPickle as pickle
+from hashlib import sha1
+import schema, load
+
+class LoaderCache(object):
+    """
+    A content addressed on-disk cache of loaded EPSG objects
+
+    The objects created from a GML export are stored in a directory,
+    keyed by a hash of the GML, so that loading the same export again
+    deserialises the objects instead of parsing the GML. e.g.
+
+    >>> cache = LoaderCache('/var/cache/epsg')
+    >>> loader = registry.getLoader(gml, cache=cache)
+
+    The total size of the cache is bounded by `maxSize` bytes: the
+    least recently used entries are evicted first. Entries created by
+    a different version of the `schema` object model are ignored and
+    removed.
+
+    Entries are unpickled, and unpickling data can execute arbitrary
+    code: the directory must only be writable by trusted users. As a
+    safeguard, entries that are not owned by the current user or that
+    are writable by group or others are ignored. A missing directory
+    is created accessible only to the current user.
+    """
+
+    suffix = '.pickle'
+
+    def __init__(self, directory, maxSize=256 * 1024 * 1024):
+        self.directory = directory
+        self.maxSize = maxSize
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+
+    def __repr__(self):
+        return '<LoaderCache(%s)>' % repr(self.directory)
+
+    def getDigest(self, gml):
+        """
+        Return the hash identifying some GML
+        """
+        if isinstance(gml, unicode):
+            gml = gml.encode('utf-8')
+        return sha1(gml).hexdigest()
+
+    def getPath(self, digest):
+        """
+        Return the path of the cache entry for a GML hash
+        """
+        name = '%s-v%d%s' % (digest, schema.MODEL_VERSION, self.suffix)
+        return os.path.join(self.directory, name)
+
+    def isTrusted(self, info):
+        """
+        Return whether a cache entry with the `os.stat` result `info`
+        is safe to unpickle
+        """
+        import stat
+        if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+            return False
+        return not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+    def get(self, gml):
+        """
+        Return a loader for GML from the cache or None if it is absent
+
+        None is also returned for an entry that is not trusted.
+        """
+        path = self.getPath(self.getDigest(gml))
+        try:
+            with open(path, 'rb') as fh:
+                # check the opened file so that it can't be swapped
+                if not self.isTrusted(os.fstat(fh.fileno())):
+                    return None
+                version, objects = pickle.load(fh)
+        except IOError:
+            return None
+        except Exception:
+            # a corrupt entry
+            self.remove(path)
+            return None
+
+        os.utime(path, None) # mark the entry as recently used
+        return load.Loader(objects, version)
+
+    def set(self, gml, loader):
+        """
+        Store the objects of a loader created from GML
+
+        The version of the EPSG dataset is stored with the objects.
+        """
+        import tempfile
+
+        path = self.getPath(self.getDigest(gml))
+
+        # write to a temporary file first so that other processes
+        # never see a partially written entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump((loader.version, dict(loader.items())), fh, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, path)
+        except:
+            self.remove(tmp)
+            raise
+
+        self.evict()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def entries(self):
+        """
+        Return the paths of the cache entries, most recently used first
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+
+        entries.sort(reverse=True)
+        return entries
+
+    def evict(self):
+        """
+        Remove stale entries and bound the size of the cache
+
+        Entries from other versions of the object model are removed,
+        followed by the least recently used entries until the cache
+        fits within `maxSize`.
+        """
+        current = '-v%d%s' % (schema.MODEL_VERSION, self.suffix)
+        total = 0
+        for mtime, size, path in self.entries():
+            if not path.endswith(current):
+                self.remove(path)
+            elif total + size > self.maxSize:
+                # this and all less recently used entries are evicted
+                total = self.maxSize + 1
+                self.remove(path)
+            else:
+                total += size
+
+    def clear(self):
+        """
+        Remove all entries from the cache
+        """
+        for mtime, size, path in self.entries():
+            self.remove(path)
+
+class LRUCache(object):
+    """
+    A bounded in-memory cache that discards the least recently used items
+
+    At most `maxSize` items are retained. If `ttl` is specified items
+    also expire that many seconds after they were added. The number of
+    successful and failed lookups are counted in `hits` and `misses`.
+    e.g.
+
+    >>> cache = LRUCache(2)
+    >>> cache['a'] = 1
+    >>> cache.get('a')
+    1
+    >>> cache.hits, cache.misses
+    (1, 0)
+    """
+
+    # indices into the entries of the circular doubly linked list
+    # recording the order of use
+    PREV, NEXT, KEY, VALUE, EXPIRES = 0, 1, 2, 3, 4
+
+    def __init__(self, maxSize=1024, ttl=None):
+        if maxSize < 1:
+            raise ValueError('The cache size must be positive: %s' % maxSize)
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.timer = time.time
+        self.hits = self.misses = 0
+        self.clear()
+
+    def __repr__(self):
+        return '<LRUCache(%d/%d)>' % (len(self), self.maxSize)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and not self.isExpired(entry)
+
+    def __getitem__(self, key):
+        entry = self.entries.get(key)
+        if entry is None or self.isExpired(entry):
+            self.misses += 1
+            if entry is not None:
+                self.unlink(entry)
+            raise KeyError(key)
+
+        self.hits += 1
+
+        # move the entry to the most recently used end
+        self.unlink(entry)
+        self.link(entry)
+        return entry[self.VALUE]
+
+    def __setitem__(self, key, value):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.unlink(entry)
+        elif len(self.entries) >= self.maxSize:
+            # discard the least recently used entry
+            self.unlink(self.root[self.NEXT])
+
+        expires = None
+        if self.ttl is not None:
+            expires = self.timer() + self.ttl
+        self.link([None, None, key, value, expires])
+
+    def __delitem__(self, key):
+        self.unlink(self.entries[key])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def isExpired(self, entry):
+        expires = entry[self.EXPIRES]
+        return expires is not None and self.timer() >= expires
+
+    def link(self, entry):
+        """
+        Add an entry as the most recently used
+        """
+        root = self.root
+        last = root[self.PREV]
+        entry[self.PREV], entry[self.NEXT] = last, root
+        last[self.NEXT] = root[self.PREV] = entry
+        self.entries[entry[self.KEY]] = entry
+
+    def unlink(self, entry):
+        prev, next = entry[self.PREV], entry[self.NEXT]
+        prev[self.NEXT], next[self.PREV] = next, prev
+        del self.entries[entry[self.KEY]]
+
+    def clear(self):
+        """
+        Remove all items from the cache
+
+        The hit and miss counters are left unchanged.
+        """
+        self.entries = {}
+        self.root = root = []
+        root[:] = [root, root, None, None, None]
+
+class ThreadLocalCache(object):
+    """
+    A set of `LRUCache` instances, one for each thread
+
+    This has the same interface as an `LRUCache`, with each thread
+    using its own cache so that objects loaded in one thread's
+    database session are not seen by other threads. Clearing the cache
+    clears the caches of every thread: each is cleared when its thread
+    next uses it. The `hits` and `misses` counters are those of the
+    current thread.
+    """
+
+    def __init__(self, maxSize=1024, ttl=None):
+        if maxSize < 1:
+            raise ValueError('The cache size must be positive: %s' % maxSize)
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.generation = 0
+        self.local = threading.local()
+
+    def __repr__(self):
+        return '<ThreadLocalCache(%d/%d)>' % (len(self), self.maxSize)
+
+    def getCache(self):
+        """
+        Return the cache of the current thread
+        """
+        local = self.local
+        try:
+            cache = local.cache
+        except AttributeError:
+            cache = local.cache = LRUCache(self.maxSize, self.ttl)
+            local.generation = self.generation
+
+        if local.generation != self.generation:
+            cache.clear()
+            local.generation = self.generation
+        return cache
+
+    @property
+    def hits(self):
+        return self.getCache().hits
+
+    @property
+    def misses(self):
+        return self.getCache().misses
+
+    def __len__(self):
+        return len(self.getCache())
+
+    def __contains__(self, key):
+        return key in self.getCache()
+
+    def __getitem__(self, key):
+        return self.getCache()[key]
+
+    def __setitem__(self, key, value):
+        self.getCache()[key] = value
+
+    def __delitem__(self, key):
+        del self.getCache()[key]
+
+    def get(self, key, default=None):
+        return self.getCache().get(key, default)
+
+    def clear(self):
+        """
+        Remove all items from the caches of every thread
+        """
+        self.generation += 1
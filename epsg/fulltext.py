@@ -0,0 +1,241 @@
+"""
+Full text search of the descriptive text of EPSG objects
+
+The names, remarks, scopes and descriptions of `schema.DictionaryEntry`
+objects are searched. With SQLite builds supporting FTS5 the text is
+indexed in a full text search virtual table, which is created along
+with the schema and kept up to date by triggers on the tables holding
+the text. Results are then ranked using BM25 with matches in names
+weighted most highly. Other databases fall back to scanning the text
+columns for substrings, with results ordered by name.
+
+The index is keyed by the `rowid` of the `DictionaryEntry` table, so
+it must be rebuilt using `rebuildIndex` if the database is vacuumed.
+"""
+
+import re
+from sqlalchemy import event
+from sqlalchemy.sql import select, and_, or_
+import schema
+
+FTS_TABLE = 'DictionaryEntry_fts'
+
+# the searched columns and their BM25 weights
+COLUMNS = ('name', 'remarks', 'scope', 'description')
+WEIGHTS = (10.0, 1.0, 2.0, 2.0)
+
+def getColumns():
+    """
+    Return the table columns holding the searched text
+
+    A dictionary mapping each name in `COLUMNS` to the table columns
+    of that name is returned.
+    """
+    columns = dict((name, []) for name in COLUMNS)
+    for mapper in schema.DictionaryEntry.__mapper__.self_and_descendants:
+        for name in COLUMNS:
+            if name in mapper.local_table.c:
+                columns[name].append(mapper.local_table.c[name])
+    return columns
+
+def getTables():
+    """
+    Return the tables holding the searched text, other than the
+    `DictionaryEntry` table
+    """
+    tables = []
+    for columns in getColumns().itervalues():
+        for column in columns:
+            if column.table is not schema.DictionaryEntry.__table__ and column.table not in tables:
+                tables.append(column.table)
+    return tables
+
+def getContentSQL():
+    """
+    Return SQL selecting the `rowid` and text of a `DictionaryEntry`
+
+    The entry is identified by the placeholder `{identifier}`.
+    """
+    fields, joins = ['"DictionaryEntry".rowid'], []
+    for table in getTables():
+        joins.append('LEFT JOIN "%s" ON "%s".identifier = "DictionaryEntry".identifier' % (table.name, table.name))
+    for name, columns in sorted(getColumns().items(), key=lambda item: COLUMNS.index(item[0])):
+        values = ['"%s"."%s"' % (column.table.name, name) for column in columns]
+        fields.append(values[0] if len(values) == 1 else 'COALESCE(%s)' % ', '.join(values))
+
+    return 'SELECT %s FROM "DictionaryEntry" %s WHERE "DictionaryEntry".identifier = {identifier}' % (
+        ', '.join(fields), ' '.join(joins))
+
+def getDDL():
+    """
+    Return the statements creating the full text index and its triggers
+    """
+    content = getContentSQL()
+    columns = ', '.join(COLUMNS)
+    remove = 'DELETE FROM "%s" WHERE rowid = (SELECT rowid FROM "DictionaryEntry" WHERE identifier = {row}.identifier);' % FTS_TABLE
+    add = 'INSERT INTO "%s" (rowid, %s) %s;' % (FTS_TABLE, columns, content.format(identifier='{row}.identifier'))
+
+    statements = ['CREATE VIRTUAL TABLE IF NOT EXISTS "%s" USING fts5(%s)' % (FTS_TABLE, columns)]
+    for table in ['DictionaryEntry'] + [table.name for table in getTables()]:
+        for action in ('insert', 'update', 'delete'):
+            if table == 'DictionaryEntry':
+                # entries are removed by rowid in case the identifier changes
+                rows = {'insert': ['NEW'], 'update': ['OLD', 'NEW'], 'delete': ['OLD']}[action]
+                body = ['DELETE FROM "%s" WHERE rowid = %s.rowid;' % (FTS_TABLE, row) for row in rows]
+                if action != 'delete':
+                    body.append(add.format(row='NEW'))
+            else:
+                row = 'OLD' if action == 'delete' else 'NEW'
+                body = [remove.format(row=row), add.format(row=row)]
+
+            statements.append('CREATE TRIGGER IF NOT EXISTS "%s_%s_%s" AFTER %s ON "%s" BEGIN %s END' % (
+                    FTS_TABLE, table, action, action.upper(), table, ' '.join(body)))
+    return statements
+
+def getTriggers():
+    """
+    Return the names of the triggers maintaining the full text index
+    """
+    return ['%s_%s_%s' % (FTS_TABLE, table, action)
+            for table in ['DictionaryEntry'] + [table.name for table in getTables()]
+            for action in ('insert', 'update', 'delete')]
+
+def supportsFTS(connection):
+    """
+    Return True if a database connection supports FTS5 full text indexes
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = [row[0] for row in connection.execute('PRAGMA compile_options')]
+    return 'ENABLE_FTS5' in options
+
+def hasIndex(connection):
+    """
+    Return True if the database has a full text index
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    return connection.execute(query, (FTS_TABLE,)).scalar() is not None
+
+def createIndex(connection):
+    """
+    Create the full text index, if supported
+
+    This is called when the schema is created. An index added to an
+    existing database is populated from the existing tables.
+    """
+    if supportsFTS(connection) and not hasIndex(connection):
+        for statement in getDDL():
+            connection.execute(statement)
+        rebuildIndex(connection)
+
+def dropIndex(connection):
+    """
+    Drop the full text index and the triggers maintaining it
+
+    This is called when the schema is dropped. Searches fall back to
+    scanning the text columns without the index.
+    """
+    if connection.dialect.name == 'sqlite':
+        for trigger in getTriggers():
+            connection.execute('DROP TRIGGER IF EXISTS "%s"' % trigger)
+        connection.execute('DROP TABLE IF EXISTS "%s"' % FTS_TABLE)
+
+def rebuildIndex(connection):
+    """
+    Repopulate the full text index from the indexed tables
+    """
+    content = getContentSQL().replace('WHERE "DictionaryEntry".identifier = {identifier}', '')
+    connection.execute('DELETE FROM "%s"' % FTS_TABLE)
+    connection.execute('INSERT INTO "%s" (rowid, %s) %s' % (FTS_TABLE, ', '.join(COLUMNS), content))
+
+# the index is created once all the tables holding the text exist
+event.listen(schema.Base.metadata, 'after_create', lambda target, connection, **kw: createIndex(connection))
+event.listen(schema.Base.metadata, 'after_drop', lambda target, connection, **kw: dropIndex(connection))
+
+def getTerms(text):
+    """
+    Return the words in a search string
+    """
+    if not isinstance(text, basestring):
+        raise TypeError('String expected for search text, found: %s' % type(text))
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    return re.findall(r'\w+', text, re.UNICODE)
+
+def getDiscriminators(types):
+    """
+    Return the discriminator values of the `schema` classes in `types`
+    and their subclasses
+    """
+    values = set()
+    for class_ in types:
+        if not isinstance(class_, type) or not issubclass(class_, schema.DictionaryEntry):
+            raise ValueError('DictionaryEntry class expected, found: %r' % (class_,))
+        values.update(mapper.polymorphic_identity for mapper in class_.__mapper__.self_and_descendants)
+    return sorted(values)
+
+def find(connection, text, types=None, limit=None):
+    """
+    Return the identifiers of the objects matching a search string
+
+    Objects match if their text contains every word in `text`,
+    including words that the search words are prefixes of. `types` is
+    a sequence of `schema.DictionaryEntry` classes the objects are
+    restricted to, and `limit` the maximum number of identifiers
+    returned, most relevant first.
+    """
+    terms = getTerms(text)
+    discriminators = None if types is None else getDiscriminators(types)
+    if not terms or discriminators == []:
+        return []
+
+    if hasIndex(connection):
+        return findIndexed(connection, terms, discriminators, limit)
+    return findScanned(connection, terms, discriminators, limit)
+
+def findIndexed(connection, terms, discriminators=None, limit=None):
+    """
+    Search using the full text index
+    """
+    sql = ['SELECT "DictionaryEntry".identifier FROM "%s" JOIN "DictionaryEntry" '
+           'ON "DictionaryEntry".rowid = "%s".rowid' % (FTS_TABLE, FTS_TABLE)]
+    parameters = []
+    if discriminators is not None:
+        sql.append('JOIN "Identifier" ON "Identifier".identifier = "DictionaryEntry".identifier '
+                   'AND "Identifier".class IN (%s)' % ', '.join('?' * len(discriminators)))
+        parameters.extend(discriminators)
+
+    sql.append('WHERE "%s" MATCH ? ORDER BY bm25("%s", %s)' % (
+            FTS_TABLE, FTS_TABLE, ', '.join(str(weight) for weight in WEIGHTS)))
+    parameters.append(' '.join('"%s"*' % term for term in terms))
+    if limit is not None:
+        sql.append('LIMIT ?')
+        parameters.append(limit)
+
+    return [row[0] for row in connection.execute(' '.join(sql), tuple(parameters))]
+
+def findScanned(connection, terms, discriminators=None, limit=None):
+    """
+    Search by scanning the text columns
+    """
+    entry = schema.DictionaryEntry.__table__
+    source = entry
+    for table in getTables():
+        source = source.outerjoin(table, table.c.identifier == entry.c.identifier)
+
+    columns = [column for name in COLUMNS for column in getColumns()[name]]
+    clauses = []
+    for term in terms:
+        pattern = '%%%s%%' % term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append(or_(*[column.ilike(pattern, escape='\\') for column in columns]))
+
+    if discriminators is not None:
+        identifier = schema.Identifier.__table__
+        source = source.join(identifier, identifier.c.identifier == entry.c.identifier)
+        clauses.append(identifier.c['class'].in_(discriminators))
+
+    query = select([entry.c.identifier]).select_from(source).where(and_(*clauses)).\
+        order_by(entry.c.name, entry.c.identifier).limit(limit)
+    return [row[0] for row in connection.execute(query)]
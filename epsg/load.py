@@ -4,7 +4,7 @@ Functionality for reading and manipulating EPSG XML data
 
 from datetime import datetime
 from collections import Mapping
-import schema
+import schema, snapshot
 
 def getText(node, recurse=True):
     """
@@ -18,6 +18,20 @@ def getText(node, recurse=True):
             txt.append(getText(child, recurse))
     return ''.join(txt).strip()
 
+def getDatasetVersion(xml):
+    """
+    Return the version of the EPSG dataset exported as XML
+
+    The version is read from the identifier of the root element of
+    the export (e.g. `release-7.9.6`). None is returned if it is not
+    present.
+    """
+    prefix = 'release-'
+    identifier = getattr(xml, 'identifier', None)
+    if identifier and identifier.startswith(prefix):
+        return identifier[len(prefix):]
+    return None
+
 class XML(Mapping):
     """
     This is a read-only dictionary type mapping URNs to XML objects
@@ -25,11 +39,51 @@ class XML(Mapping):
 
     map = None
     ns = None
+    stats = None
+    identifier = None
 
     def __init__(self, dom):
         self.dom = dom
-        self.ns = self.getNamespaces()
-        self.map = self.createMapping()
+        self.ns, self.map, self.stats = self.createIndex()
+
+    def createIndex(self):
+        """
+        Index the document in a single traversal
+
+        This returns a dictionary of EPSG namespaces, a mapping
+        between URNs and XML objects and a count of the mapped
+        elements by their local name.
+
+        In the namespace dictionary the value (namespace URI) is
+        mapped to a key for referencing by the application. The
+        identifier of the root element is stored as `identifier`.
+        """
+        root = self.dom.documentElement
+        ns = dict(((k[6:], v) for k, v in root.attributes.items() if k.startswith('xmlns:')))
+        gml = ns.get('gml')
+        mapping = {}
+        stats = {}
+
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.nodeType != node.ELEMENT_NODE:
+                continue
+
+            # discover namespaces not declared on the root e.g. gmd
+            if node.prefix and node.prefix not in ns:
+                ns[node.prefix] = node.namespaceURI
+
+            if node.localName == 'identifier' and node.namespaceURI == gml:
+                parent = node.parentNode
+                mapping[getText(node)] = parent
+                stats[parent.localName] = stats.get(parent.localName, 0) + 1
+                if parent is root:
+                    self.identifier = getText(node)
+
+            stack.extend(node.childNodes)
+
+        return ns, mapping, stats
 
     def getNamespaces(self):
         """Return a dictionary of EPSG namespaces
@@ -37,21 +91,13 @@ class XML(Mapping):
         The value (namespace URI) is mapped to a key for referencing by the
         application.
         """
-        ns = dict(((k[6:], v) for k, v in self.dom.firstChild.attributes.items() if k.startswith('xmlns:')))
-        # A hack to find the gmd namespace in use:
-        ns[u'gmd'] = self.dom.getElementsByTagName('gmd:westBoundLongitude')[0].namespaceURI
-        return ns
+        return dict(self.ns)
 
     def createMapping(self):
         """
         Creates a mapping between URNs and XML objects
         """
-        mapping = {}
-        for element in self.getElementsByTagName('identifier'):
-            urn = getText(element)
-            mapping[urn] = element.parentNode
-
-        return mapping
+        return dict(self.map)
 
     def getElementsByTagName(self, name, node=None, ns=None):
         """
@@ -101,6 +147,449 @@ class XML(Mapping):
         dom = parse(xml_file)
         return cls(dom)
 
+class StreamingXML(XML):
+    """
+    A read-only dictionary type mapping URNs to XML objects
+
+    This is an alternative to the `XML` class that never builds a DOM
+    of the whole document. Instead the GML is scanned incrementally
+    using expat and the position of each top level dictionary entry
+    is retained. An entry is only read and parsed into a DOM when it
+    is requested, so peak memory is governed by the largest single
+    entry rather than by the whole document. e.g.
+
+    >>> xml = StreamingXML.FromFile('GmlDictionary.xml')
+    >>> loader = XMLLoader(xml)
+    """
+
+    # the size of the chunks read when streaming from a file
+    chunkSize = 65536
+
+    def __init__(self, chunks, source=None):
+        """
+        Scan an iterable of XML byte strings
+
+        `source` is a seekable file object that the chunks are read
+        from. Entries are read back from it when they are requested;
+        without it the text of every entry has to be retained.
+        """
+        self.dom = None
+        self.source = source
+        self.base = source.tell() if source is not None else 0
+        self.ns = {}
+        self.map = {}
+        self.stats = {}
+        self.entries = []
+        self.parse(chunks)
+
+    def parse(self, chunks):
+        """
+        Index the dictionary entries in the XML
+
+        This records the namespaces declared in the document, the text
+        of each top level element containing an identifier, a mapping
+        between the identifiers and that text and a count of the
+        identified elements by their local name. The identifier of the
+        root element is stored as `identifier`.
+        """
+        from xml.parsers import expat
+
+        gml = 'http://www.opengis.net/gml'
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.namespace_prefixes = True
+
+        # the parsing state shared by the handlers
+        state = {
+            'depth': 0,
+            'buffer': '',       # the unprocessed input
+            'offset': 0,        # the document offset of the buffer
+            'start': None,      # the offset of the current entry
+            'mark': 0,          # the offset of the last event
+            'names': [],        # local names of the open elements
+            'urns': [],         # identifiers in the current entry
+            'text': None        # text of the current identifier
+            }
+        self.encoding = 'UTF-8'
+        self.root = None
+        self.rootNamespaces = []
+        self.identifier = None
+
+        def qualifiedName(name):
+            parts = name.split(' ')
+            if len(parts) == 3:
+                return '%s:%s' % (parts[2], parts[1])
+            return parts[-1]
+
+        def xmlDecl(version, encoding, standalone):
+            if encoding:
+                self.encoding = encoding
+
+        def startNamespace(prefix, uri):
+            if prefix:
+                self.ns.setdefault(prefix, uri)
+            if not state['depth']:
+                self.rootNamespaces.append((prefix, uri))
+
+        def startElement(name, attributes):
+            state['mark'] = parser.CurrentByteIndex
+            depth = state['depth']
+            if not depth:
+                self.root = qualifiedName(name)
+            elif depth == 1:
+                state['start'] = parser.CurrentByteIndex
+                state['urns'] = []
+            parts = name.split(' ')
+            if len(parts) == 1:
+                # an element that is not in a namespace
+                parts.insert(0, None)
+            if parts[:2] == [gml, 'identifier']:
+                state['text'] = []
+            state['names'].append(parts[1])
+            state['depth'] = depth + 1
+
+        def endElement(name):
+            state['mark'] = parser.CurrentByteIndex
+            state['depth'] -= 1
+            state['names'].pop()
+            if state['text'] is not None:
+                state['urns'].append(''.join(state['text']).strip())
+                state['text'] = None
+                parent = state['names'][-1]
+                self.stats[parent] = self.stats.get(parent, 0) + 1
+                if state['depth'] == 1:
+                    self.identifier = state['urns'][-1]
+
+            if state['depth'] != 1 or not state['urns']:
+                return
+
+            # store the completed entry
+            start = state['start'] - state['offset']
+            end = parser.CurrentByteIndex - state['offset']
+            footer = ('</%s>' % qualifiedName(name)).encode(self.encoding)
+            self.addEntry(state['urns'], state['start'], state['buffer'][start:end], footer)
+
+            state['start'] = None
+            state['urns'] = []
+
+        def characterData(data):
+            if state['text'] is not None:
+                state['text'].append(data)
+
+        parser.XmlDeclHandler = xmlDecl
+        parser.StartNamespaceDeclHandler = startNamespace
+        parser.StartElementHandler = startElement
+        parser.EndElementHandler = endElement
+        parser.CharacterDataHandler = characterData
+
+        for chunk in chunks:
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode('utf-8')
+            state['buffer'] += chunk
+            parser.Parse(chunk, False)
+
+            # discard the input that has been processed
+            keep = state['start']
+            if keep is None:
+                keep = state['mark']
+            state['buffer'] = state['buffer'][keep - state['offset']:]
+            state['offset'] = keep
+        parser.Parse('', True)
+
+    def addEntry(self, urns, offset, body, footer):
+        """
+        Store an entry found by `parse`
+
+        `body` is the text of the entry, without its end tag
+        (`footer`), found at `offset` in the document. Only the
+        position of the entry is stored if it can be read back from
+        `source`.
+        """
+        if self.source is None:
+            self.entries.append(body + footer)
+        else:
+            self.entries.append((offset, offset + len(body), footer))
+        for urn in urns:
+            self.map[urn] = len(self.entries) - 1
+
+    def getEntry(self, index):
+        """
+        Return the text of a stored entry
+        """
+        if self.source is None:
+            return self.entries[index]
+
+        start, end, footer = self.entries[index]
+        self.source.seek(self.base + start)
+        return self.source.read(end - start) + footer
+
+    def close(self):
+        """
+        Close the file that entries are read from
+        """
+        if self.source is not None:
+            self.source.close()
+
+    def parseEntry(self, text):
+        """
+        Parse the text of a dictionary entry into a DOM
+        """
+        from xml.dom.minidom import parseString
+        from xml.sax.saxutils import quoteattr
+
+        declarations = []
+        for prefix, uri in self.rootNamespaces:
+            attr = 'xmlns:%s' % prefix if prefix else 'xmlns'
+            declarations.append('%s=%s' % (attr, quoteattr(uri)))
+
+        header = u'<?xml version="1.0" encoding="%s"?>\n<%s %s>' % (
+            self.encoding, self.root, ' '.join(declarations))
+        footer = u'</%s>' % self.root
+        return parseString(header.encode(self.encoding) + text + footer.encode(self.encoding))
+
+    def createMapping(self):
+        """
+        Creates a mapping between URNs and XML objects
+
+        This parses every entry in the document.
+        """
+        return dict((key, self[key]) for key in self.map)
+
+    def __getitem__(self, key):
+        dom = self.parseEntry(self.getEntry(self.map[key]))
+        for element in dom.getElementsByTagNameNS(self.ns['gml'], 'identifier'):
+            if getText(element) == key:
+                return element.parentNode
+        raise KeyError(key)
+
+    @classmethod
+    def FromString(cls, xml_string):
+        """
+        Creates an object from an XML string
+        """
+        from cStringIO import StringIO
+        if isinstance(xml_string, unicode):
+            xml_string = xml_string.encode('utf-8')
+        return cls([xml_string], StringIO(xml_string))
+
+    @classmethod
+    def FromFile(cls, xml_file):
+        """
+        Creates an object from an XML file handle or file name
+
+        The file is kept open to read the entries from: use `close`
+        to release it. A file handle that is not seekable has the
+        text of its entries retained instead.
+        """
+        if isinstance(xml_file, basestring):
+            xml_file = open(xml_file, 'rb')
+
+        try:
+            xml_file.tell()
+            source = xml_file
+        except (AttributeError, IOError):
+            source = None
+
+        return cls(iter(lambda: xml_file.read(cls.chunkSize), ''), source)
+
+class IndexedXML(StreamingXML):
+    """
+    A read-only dictionary type mapping URNs to XML objects in a file
+
+    The file is memory mapped and indexed by the byte range of each
+    dictionary entry. Only the entries that are requested are
+    parsed, so looking up a handful of objects with an `XMLLoader`
+    only parses those objects and the objects they reference. e.g.
+
+    >>> xml = IndexedXML.FromFile('GmlDictionary.xml')
+    >>> loader = XMLLoader(xml)
+    >>> crs = loader['urn:ogc:def:crs:EPSG::27700']
+
+    If `indexPath` is given the index is saved to that file and
+    reused while the XML file is unchanged, so subsequent lookups do
+    not need to scan the file at all. e.g.
+
+    >>> xml = IndexedXML.FromFile('GmlDictionary.xml', indexPath='/var/cache/epsg/gml.idx')
+
+    The index is pickled, so `indexPath` must only be writable by
+    trusted users.
+    """
+
+    # the attributes that are saved in a persistent index
+    indexAttributes = ('ns', 'map', 'stats', 'entries', 'encoding', 'root', 'rootNamespaces', 'identifier')
+
+    def __init__(self, path, indexPath=None):
+        import mmap
+
+        self.path = path
+        self.indexPath = indexPath
+        self.dom = None
+        with open(path, 'rb') as fh:
+            self.mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.source = self.mmap
+        self.base = 0
+
+        if not (indexPath and self.loadIndex()):
+            self.ns = {}
+            self.map = {}
+            self.stats = {}
+            self.entries = []
+            chunks = (self.mmap[i:i + self.chunkSize] for i in xrange(0, len(self.mmap), self.chunkSize))
+            self.parse(chunks)
+            if indexPath:
+                self.saveIndex()
+
+    def getFileSignature(self):
+        """
+        Return the size and modification time of the indexed file
+        """
+        import os
+        info = os.stat(self.path)
+        return info.st_size, info.st_mtime
+
+    def loadIndex(self):
+        """
+        Load a persistent index, returning False if it is not valid
+        """
+        import cPickle as pickle
+
+        try:
+            with open(self.indexPath, 'rb') as fh:
+                index = pickle.load(fh)
+        except Exception:
+            # a missing or unreadable index
+            return False
+
+        if index.get('signature') != self.getFileSignature():
+            return False
+        if any(attr not in index for attr in self.indexAttributes):
+            # an index saved by an earlier version
+            return False
+
+        for attr in self.indexAttributes:
+            setattr(self, attr, index[attr])
+        return True
+
+    def saveIndex(self):
+        """
+        Save the index to `indexPath` if possible
+        """
+        import cPickle as pickle
+        import os, tempfile
+
+        index = dict((attr, getattr(self, attr)) for attr in self.indexAttributes)
+        index['signature'] = self.getFileSignature()
+
+        # write to a temporary file first so that other processes
+        # never see a partially written index
+        path = self.indexPath
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump(index, fh, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            pass
+
+    def getEntry(self, index):
+        start, end, footer = self.entries[index]
+        return self.mmap[start:end] + footer
+
+    @classmethod
+    def FromString(cls, xml_string):
+        """
+        Not supported: the entries are read from a memory mapped file
+        """
+        raise TypeError('An IndexedXML object can only be created from a file')
+
+    @classmethod
+    def FromFile(cls, xml_file, indexPath=None):
+        """
+        Creates an object from an XML file handle or file name
+        """
+        if not isinstance(xml_file, basestring):
+            xml_file = xml_file.name
+        return cls(xml_file, indexPath)
+
+class ElementRecord(object):
+    """
+    An index of the fields contained in an XML element
+
+    The element is traversed once and every descendant element is
+    filed under its namespace URI and local name, in document
+    order. Fields can then be looked up without rescanning the
+    element.
+    """
+
+    __slots__ = ('element', 'ns', 'fields')
+
+    def __init__(self, element, ns):
+        self.element = element
+        self.ns = ns
+
+        fields = {}
+        stack = list(reversed(element.childNodes))
+        while stack:
+            node = stack.pop()
+            if node.nodeType != node.ELEMENT_NODE:
+                continue
+            fields.setdefault((node.namespaceURI, node.localName), []).append(node)
+            stack.extend(reversed(node.childNodes))
+        self.fields = fields
+
+    @property
+    def localName(self):
+        return self.element.localName
+
+    def getElements(self, name, ns=None):
+        """
+        Return the descendant elements with the specified name
+
+        The name is in the GML namespace unless the prefix of
+        another namespace is specified.
+        """
+        if ns is None:
+            ns = 'gml'
+        return self.fields.get((self.ns[ns], name), [])
+
+    def getText(self, name, ns=None):
+        """
+        Return the text of the first descendant element called `name`
+        """
+        try:
+            return getText(self.getElements(name, ns)[0])
+        except IndexError:
+            return None
+
+    def getAttributeValue(self, name, attributeName, ns=None):
+        """
+        Return an attribute of the first descendant element called `name`
+        """
+        try:
+            return self.getElements(name, ns)[0].attributes[attributeName].value
+        except (KeyError, IndexError):
+            return None
+
+    def getReferences(self):
+        """
+        Return the URNs the element refers to
+
+        These are the `xlink:href` values of the descendant elements
+        and the identifiers of nested elements (e.g. the axes of a
+        coordinate system).
+        """
+        xlink = self.ns.get('xlink')
+        urns = []
+        for nodes in self.fields.itervalues():
+            for node in nodes:
+                href = node.getAttributeNS(xlink, 'href')
+                if href:
+                    urns.append(href)
+
+        for node in self.getElements('identifier')[1:]:
+            urns.append(getText(node))
+
+        return urns
+
 # Decorators
 #
 # These add various attributes to created instances by extracting the
@@ -111,9 +600,9 @@ def addType(method):
     """
     Add the type attribute
     """
-    def wrapper(self, element, *args, **kwargs):
-        instance = method(self, element, *args, **kwargs)
-        instance.type = self.getFirstChildNodeText(element, 'type', 'epsg')
+    def wrapper(self, record, *args, **kwargs):
+        instance = method(self, record, *args, **kwargs)
+        instance.type = record.getText('type', 'epsg')
         return instance
     return wrapper
 
@@ -121,9 +610,9 @@ def addScope(method):
     """
     Add the scope attribute
     """
-    def wrapper(self, element, *args, **kwargs):
-        instance = method(self, element, *args, **kwargs)
-        instance.scope = self.getFirstChildNodeText(element, 'scope')
+    def wrapper(self, record, *args, **kwargs):
+        instance = method(self, record, *args, **kwargs)
+        instance.scope = record.getText('scope')
         return instance
     return wrapper
 
@@ -131,36 +620,31 @@ def addDomainOfValidity(method):
     """
     Add the domainOfValidity attribute
     """
-    def wrapper(self, element, *args, **kwargs):
-        instance = method(self, element, *args, **kwargs)
-        instance.domainOfValidity = self[self.getFirstChildAttributeValue(element, 'domainOfValidity', 'xlink:href')]
+    def wrapper(self, record, *args, **kwargs):
+        instance = method(self, record, *args, **kwargs)
+        instance.domainOfValidity = self[record.getAttributeValue('domainOfValidity', 'xlink:href')]
         return instance
     return wrapper
 
-class XMLLoader(Mapping):
+class Loader(Mapping):
     """
-    Create EPSG schema objects from XML
+    A read-only dictionary type mapping URNs to EPSG schema objects
+
+    This is the interface used to populate a registry. Subclasses
+    create the objects from a particular source. `version` is the
+    version of the EPSG dataset the objects come from, if known.
     """
-    xml = None
     objects = None
+    version = None
 
-    def __init__(self, xml):
-        self.xml = xml
-        self.objects = {}
+    def __init__(self, objects=None, version=None):
+        if objects is None:
+            objects = {}
+        self.objects = objects
+        self.version = version
 
     def __getitem__(self, key):
-        try:
-            return self.objects[key]
-        except KeyError:
-            pass
-
-        element = self.xml[key]
-        obj = self.loadElement(element)
-        if obj is None:
-            raise KeyError('The element cannot be loaded: %s' % key)
-
-        self.objects[key] = obj
-        return obj
+        return self.objects[key]
 
     def __len__(self):
         return len(self.objects)
@@ -177,159 +661,292 @@ class XMLLoader(Mapping):
     def items(self):
         return self.objects.items()
 
-    def getFirstChildNodeText(self, node, childName, ns=None):
+    def snapshot(self):
+        """
+        Return an immutable in-memory copy of the loaded objects
+
+        See `snapshot.Snapshot`.
+        """
+        return snapshot.Snapshot.FromObjects(self.itervalues())
+
+class XMLLoader(Loader):
+    """
+    Create EPSG schema objects from XML
+
+    Each element is indexed once into an `ElementRecord` and the
+    `load*` methods read their fields from that record.
+
+    Objects are created in dependency order: the references of an
+    element are resolved from its record before the element itself
+    is loaded, using an explicit stack rather than recursion. Keys
+    that cannot be loaded (because they are missing, have no loader
+    or reference something that cannot be loaded) are recorded in
+    `unloadable`.
+    """
+    xml = None
+    dependencies = None
+    unloadable = None
+
+    def __init__(self, xml):
+        super(XMLLoader, self).__init__(version=getDatasetVersion(xml))
+        self.xml = xml
+        self.dependencies = {}
+        self.unloadable = set()
+
+    def __getitem__(self, key):
         try:
-            return getText(self.xml.getElementsByTagName(childName, node, ns)[0])
-        except IndexError:
-            return None
+            return self.objects[key]
+        except KeyError:
+            pass
+
+        if key not in self.unloadable:
+            self.resolve(key)
 
-    def getFirstChildAttributeValue(self, node, childName, attributeName, ns=None):
         try:
-            return self.xml.getElementsByTagName(childName, node, ns)[0].attributes[attributeName].value
-        except (KeyError, IndexError):
-            return None
+            return self.objects[key]
+        except KeyError:
+            raise KeyError('The element cannot be loaded: %s' % key)
+
+    def resolve(self, key):
+        """
+        Create the object for a key along with the objects it references
+
+        The references are created first, in dependency order. A
+        list of the keys of the objects created is returned in the
+        order they were created. A `ValueError` is raised if the
+        references are cyclic.
+        """
+        created = []
+        visiting = set()
+        stack = [(key, None)]
+        while stack:
+            urn, record = stack[-1]
+
+            if record is None:
+                # first visit: queue the references of the element
+                if urn in self.objects or urn in self.unloadable:
+                    stack.pop()
+                    continue
+
+                try:
+                    element = self.xml[urn]
+                except KeyError:
+                    element = None
+                if element is None or not hasattr(self, 'load' + element.localName):
+                    self.unloadable.add(urn)
+                    stack.pop()
+                    continue
+
+                record = self.getRecord(element)
+                stack[-1] = (urn, record)
+                visiting.add(urn)
+
+                dependencies = [ref for ref in record.getReferences() if ref in self.xml]
+                self.dependencies[urn] = dependencies
+                for dependency in dependencies:
+                    if dependency in visiting:
+                        raise ValueError('Cyclic reference between %s and %s' % (urn, dependency))
+                    if dependency not in self.objects and dependency not in self.unloadable:
+                        stack.append((dependency, None))
+                continue
+
+            # second visit: the references have been resolved
+            stack.pop()
+            visiting.discard(urn)
+            try:
+                obj = self.loadRecord(record)
+            except KeyError:
+                obj = None
+
+            if obj is None:
+                self.unloadable.add(urn)
+            else:
+                self.objects[urn] = obj
+                created.append(urn)
+
+        return created
+
+    def getLevels(self):
+        """
+        Group the keys of the loaded objects by dependency level
+
+        A list of levels is returned: the objects in each level only
+        reference objects in previous levels, so the levels can be
+        processed in batches (e.g. bulk database inserts).
+        """
+        levels = {}
+        for key in self.objects:
+            if key in levels:
+                continue
+
+            stack = [key]
+            while stack:
+                urn = stack[-1]
+                pending = [dep for dep in self.dependencies.get(urn, ())
+                           if dep in self.objects and dep not in levels]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                depths = [levels[dep] for dep in self.dependencies.get(urn, ()) if dep in levels]
+                levels[urn] = max(depths) + 1 if depths else 0
+
+        batches = []
+        for key, level in levels.iteritems():
+            while len(batches) <= level:
+                batches.append([])
+            batches[level].append(key)
+        return batches
+
+    def getRecord(self, element):
+        """
+        Index the fields of an element
+        """
+        return ElementRecord(element, self.xml.ns)
 
     def loadElement(self, element):
+        return self.loadRecord(self.getRecord(element))
+
+    def loadRecord(self, record):
         try:
-            loader = getattr(self, 'load' + element.localName)
+            loader = getattr(self, 'load' + record.localName)
         except AttributeError:
             return None
 
-        return loader(element)
+        return loader(record)
+
+    def getIdentifier(self, record):
+        return record.getText('identifier')
 
-    def getIdentifier(self, element):
-        return self.getFirstChildNodeText(element, 'identifier')
-    
-    def loadDictionaryEntry(self, element, class_=schema.DictionaryEntry):
-        identifier = self.getIdentifier(element)
-        name = self.getFirstChildNodeText(element, 'name')
+    def loadDictionaryEntry(self, record, class_=schema.DictionaryEntry):
+        identifier = self.getIdentifier(record)
+        name = record.getText('name')
 
         instance = class_(identifier, name)
-        instance.remarks = self.getFirstChildNodeText(element, 'remarks')
-        instance.anchorDefinition = self.getFirstChildNodeText(element, 'anchorDefinition')
-        instance.informationSource = self.getFirstChildNodeText(element, 'informationSource', 'epsg')
+        instance.remarks = record.getText('remarks')
+        instance.anchorDefinition = record.getText('anchorDefinition')
+        instance.informationSource = record.getText('informationSource', 'epsg')
 
         return instance
 
     @addType
     @addScope
     @addDomainOfValidity
-    def loadDatum(self, element, class_):
-        instance = self.loadDictionaryEntry(element, class_)
-        instance.realizationEpoch = self.getFirstChildNodeText(element, 'realizationEpoch')
+    def loadDatum(self, record, class_):
+        instance = self.loadDictionaryEntry(record, class_)
+        instance.realizationEpoch = record.getText('realizationEpoch')
         return instance
-        
-    def loadGeodeticDatum(self, element):
-        instance = self.loadDatum(element, schema.GeodeticDatum)
-        instance.primeMeridian = self[self.getFirstChildAttributeValue(element, 'primeMeridian', 'xlink:href')]
-        instance.ellipsoid = self[self.getFirstChildAttributeValue(element, 'ellipsoid', 'xlink:href')]
+
+    def loadGeodeticDatum(self, record):
+        instance = self.loadDatum(record, schema.GeodeticDatum)
+        instance.primeMeridian = self[record.getAttributeValue('primeMeridian', 'xlink:href')]
+        instance.ellipsoid = self[record.getAttributeValue('ellipsoid', 'xlink:href')]
         return instance
 
-    def loadVerticalDatum(self, element):
-        return self.loadDatum(element, schema.VerticalDatum)
+    def loadVerticalDatum(self, record):
+        return self.loadDatum(record, schema.VerticalDatum)
 
-    def loadEngineeringDatum(self, element):
-        return self.loadDatum(element, schema.EngineeringDatum)
+    def loadEngineeringDatum(self, record):
+        return self.loadDatum(record, schema.EngineeringDatum)
 
-    def loadEllipsoid(self, element):
-        instance = self.loadDictionaryEntry(element, schema.Ellipsoid)
-        instance.semiMajorAxis = self.getFirstChildNodeText(element, 'semiMajorAxis')
-        instance.semiMinorAxis = self.getFirstChildNodeText(element, 'semiMinorAxis')
-        instance.inverseFlattening = self.getFirstChildNodeText(element, 'inverseFlattening')
-        instance.isSphere = self.getFirstChildNodeText(element, 'isSphere')
+    def loadEllipsoid(self, record):
+        instance = self.loadDictionaryEntry(record, schema.Ellipsoid)
+        instance.semiMajorAxis = record.getText('semiMajorAxis')
+        instance.semiMinorAxis = record.getText('semiMinorAxis')
+        instance.inverseFlattening = record.getText('inverseFlattening')
+        instance.isSphere = record.getText('isSphere')
 
         return instance
 
-    def loadPrimeMeridian(self, element):
-        instance = self.loadDictionaryEntry(element, schema.PrimeMeridian)
-        instance.greenwichLongitude = self.getFirstChildNodeText(element, 'greenwichLongitude')
+    def loadPrimeMeridian(self, record):
+        instance = self.loadDictionaryEntry(record, schema.PrimeMeridian)
+        instance.greenwichLongitude = record.getText('greenwichLongitude')
 
         return instance
 
-    def loadAreaOfUse(self, element):
-        instance = self.loadDictionaryEntry(element, schema.AreaOfUse)
-        instance.description = self.getFirstChildNodeText(element, 'description', 'gmd')
-        instance.westBoundLongitude = self.getFirstChildNodeText(element, 'westBoundLongitude', 'gmd')
-        instance.eastBoundLongitude = self.getFirstChildNodeText(element, 'eastBoundLongitude', 'gmd')
-        instance.southBoundLatitude = self.getFirstChildNodeText(element, 'southBoundLatitude', 'gmd')
-        instance.northBoundLatitude = self.getFirstChildNodeText(element, 'northBoundLatitude', 'gmd')
+    def loadAreaOfUse(self, record):
+        instance = self.loadDictionaryEntry(record, schema.AreaOfUse)
+        instance.description = record.getText('description', 'gmd')
+        instance.westBoundLongitude = record.getText('westBoundLongitude', 'gmd')
+        instance.eastBoundLongitude = record.getText('eastBoundLongitude', 'gmd')
+        instance.southBoundLatitude = record.getText('southBoundLatitude', 'gmd')
+        instance.northBoundLatitude = record.getText('northBoundLatitude', 'gmd')
 
         return instance
 
     @addType
     @addScope
     @addDomainOfValidity
-    def loadCoordinateReferenceSystem(self, element, class_):
-        instance = self.loadDictionaryEntry(element, class_)
+    def loadCoordinateReferenceSystem(self, record, class_):
+        instance = self.loadDictionaryEntry(record, class_)
         return instance
 
-    def loadCoordinateSystemAxis(self, element):
-        identifier = self.getIdentifier(element)
+    def loadCoordinateSystemAxis(self, record):
+        identifier = self.getIdentifier(record)
         instance = schema.CoordinateSystemAxis(identifier)
-        instance.axisAbbrev = self.getFirstChildNodeText(element, 'axisAbbrev')
-        instance.axisDirection = self.getFirstChildNodeText(element, 'axisDirection')
-        instance.descriptionReference = self[self.getFirstChildAttributeValue(element, 'descriptionReference', 'xlink:href')]
+        instance.axisAbbrev = record.getText('axisAbbrev')
+        instance.axisDirection = record.getText('axisDirection')
+        instance.descriptionReference = self[record.getAttributeValue('descriptionReference', 'xlink:href')]
 
         return instance
 
-    def loadAxisName(self, element):
-        instance = self.loadDictionaryEntry(element, schema.AxisName)
-        instance.description = self.getFirstChildNodeText(element, 'description')
+    def loadAxisName(self, record):
+        instance = self.loadDictionaryEntry(record, schema.AxisName)
+        instance.description = record.getText('description')
         return instance
 
     @addType
-    def loadCoordinateSystem(self, element, class_):
-        instance = self.loadDictionaryEntry(element, class_)
+    def loadCoordinateSystem(self, record, class_):
+        instance = self.loadDictionaryEntry(record, class_)
         axes = []
-        for axisNode in self.xml.getElementsByTagName('axis', element):
-            node = self.xml.getElementsByTagName('identifier', axisNode)[0]
-            urn = getText(node)
+        for axisNode in record.getElements('axis'):
+            urn = self.getIdentifier(self.getRecord(axisNode))
             axis = self[urn]
             axes.append(axis)
         instance.axes = axes
         return instance
 
-    def loadEllipsoidalCS(self, element):
-        return self.loadCoordinateSystem(element, schema.EllipsoidalCS)
+    def loadEllipsoidalCS(self, record):
+        return self.loadCoordinateSystem(record, schema.EllipsoidalCS)
 
-    def loadCartesianCS(self, element):
-        return self.loadCoordinateSystem(element, schema.CartesianCS)
+    def loadCartesianCS(self, record):
+        return self.loadCoordinateSystem(record, schema.CartesianCS)
 
-    def loadVerticalCS(self, element):
-        return self.loadCoordinateSystem(element, schema.VerticalCS)
+    def loadVerticalCS(self, record):
+        return self.loadCoordinateSystem(record, schema.VerticalCS)
 
-    def loadSphericalCS(self, element):
-        return self.loadCoordinateSystem(element, schema.SphericalCS)
+    def loadSphericalCS(self, record):
+        return self.loadCoordinateSystem(record, schema.SphericalCS)
 
-    def loadGeodeticCRS(self, element):
-        instance = self.loadCoordinateReferenceSystem(element, schema.GeodeticCRS)
-        instance.geodeticDatum = self[self.getFirstChildAttributeValue(element, 'geodeticDatum', 'xlink:href')]
-        instance.ellipsoidalCS = self[self.getFirstChildAttributeValue(element, 'ellipsoidalCS', 'xlink:href')]
+    def loadGeodeticCRS(self, record):
+        instance = self.loadCoordinateReferenceSystem(record, schema.GeodeticCRS)
+        instance.geodeticDatum = self[record.getAttributeValue('geodeticDatum', 'xlink:href')]
+        instance.ellipsoidalCS = self[record.getAttributeValue('ellipsoidalCS', 'xlink:href')]
 
         return instance
 
-    def loadProjectedCRS(self, element):
-        instance = self.loadCoordinateReferenceSystem(element, schema.ProjectedCRS)
-        instance.baseGeodeticCRS = self[self.getFirstChildAttributeValue(element, 'baseGeodeticCRS', 'xlink:href')]
-        instance.cartesianCS = self[self.getFirstChildAttributeValue(element, 'cartesianCS', 'xlink:href')]
+    def loadProjectedCRS(self, record):
+        instance = self.loadCoordinateReferenceSystem(record, schema.ProjectedCRS)
+        instance.baseGeodeticCRS = self[record.getAttributeValue('baseGeodeticCRS', 'xlink:href')]
+        instance.cartesianCS = self[record.getAttributeValue('cartesianCS', 'xlink:href')]
         return instance
 
-    def loadVerticalCRS(self, element):
-        instance = self.loadCoordinateReferenceSystem(element, schema.VerticalCRS)
-        instance.verticalDatum = self[self.getFirstChildAttributeValue(element, 'verticalDatum', 'xlink:href')]
-        instance.verticalCS = self[self.getFirstChildAttributeValue(element, 'verticalCS', 'xlink:href')]
+    def loadVerticalCRS(self, record):
+        instance = self.loadCoordinateReferenceSystem(record, schema.VerticalCRS)
+        instance.verticalDatum = self[record.getAttributeValue('verticalDatum', 'xlink:href')]
+        instance.verticalCS = self[record.getAttributeValue('verticalCS', 'xlink:href')]
         return instance
 
-    def loadEngineeringCRS(self, element):
-        instance = self.loadCoordinateReferenceSystem(element, schema.EngineeringCRS)
-        instance.coordinateSystem = self[self.getFirstChildAttributeValue(element, 'coordinateSystem', 'xlink:href')]
-        instance.engineeringDatum = self[self.getFirstChildAttributeValue(element, 'engineeringDatum', 'xlink:href')]
+    def loadEngineeringCRS(self, record):
+        instance = self.loadCoordinateReferenceSystem(record, schema.EngineeringCRS)
+        instance.coordinateSystem = self[record.getAttributeValue('coordinateSystem', 'xlink:href')]
+        instance.engineeringDatum = self[record.getAttributeValue('engineeringDatum', 'xlink:href')]
         return instance
-    
-    def loadCompoundCRS(self, element):
-        instance = self.loadCoordinateReferenceSystem(element, schema.CompoundCRS)
+
+    def loadCompoundCRS(self, record):
+        instance = self.loadCoordinateReferenceSystem(record, schema.CompoundCRS)
         components = []
-        for componentNode in self.xml.getElementsByTagName('componentReferenceSystem', element):
+        for componentNode in record.getElements('componentReferenceSystem'):
             urn = componentNode.attributes['xlink:href'].value
             crs = self[urn]
             components.append(crs)
@@ -337,10 +954,11 @@ class XMLLoader(Mapping):
         return instance
 
     def load(self):
-        # iterate through all available keys
+        """
+        Create the objects for all the keys in the XML
+        """
+        # create the objects for all available keys, along with
+        # their references
         for key in self.xml.keys():
-            try:
-                # try and retrieve a related object for the key
-                self[key]
-            except KeyError:
-                pass
+            if key not in self.objects:
+                self.resolve(key)
@@ -0,0 +1,77 @@
+"""
+Read-only registry files shared by many processes
+
+A registry can be published as a SQLite file which is built once and
+then opened read-only by any number of processes, such as the workers
+of a pre-forking server. The file uses a rollback journal, so it is
+a single self-contained file: readers only take shared locks and,
+never writing, create no journal or WAL files and do not need write
+access to its directory. The connections of readers are configured
+to refuse writes (`PRAGMA query_only`) and to memory map the file
+(`PRAGMA mmap_size`). Memory mapped pages are shared through
+the operating system's page cache, so the memory used by each process
+does not grow with the size of the registry.
+
+Connections are not shared across `os.fork`: a connection created in
+another process is discarded rather than used when it is checked out
+of the pool, so engines created before forking remain usable in the
+child processes.
+"""
+
+import os
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError
+
+# the default number of bytes of a registry file to memory map
+MMAP_SIZE = 256 * 1024 * 1024
+
+def finalise(connection):
+    """
+    Prepare a populated SQLite registry database for publication
+
+    The query planner statistics are gathered and the database is
+    left using a rollback journal rather than WAL, which would
+    require every reader to create `-wal` and `-shm` files alongside
+    it.
+    """
+    connection.execute('ANALYZE')
+    connection.execute('PRAGMA journal_mode = DELETE')
+
+def configureEngine(engine, mmapSize=MMAP_SIZE):
+    """
+    Configure an engine for read-only use of a registry database
+
+    SQLite connections are made read-only and memory map up to
+    `mmapSize` bytes of the database. Connections of all databases
+    are made fork safe.
+    """
+    if engine.dialect.name == 'sqlite':
+        def connect(dbapiConnection, connectionRecord):
+            cursor = dbapiConnection.cursor()
+            cursor.execute('PRAGMA query_only = 1')
+            cursor.execute('PRAGMA mmap_size = %d' % int(mmapSize))
+            cursor.close()
+        event.listen(engine, 'connect', connect)
+
+    event.listen(engine, 'connect', setProcess)
+    event.listen(engine, 'checkout', checkProcess)
+
+def setProcess(dbapiConnection, connectionRecord):
+    """
+    Record the process a connection is created in
+    """
+    connectionRecord.info['pid'] = os.getpid()
+
+def checkProcess(dbapiConnection, connectionRecord, connectionProxy):
+    """
+    Discard a connection checked out in a process it was not created in
+
+    The connection is detached without being closed, as closing it
+    would affect the process it belongs to. Raising
+    `DisconnectionError` causes the pool to create a new connection.
+    """
+    pid = os.getpid()
+    if connectionRecord.info.get('pid', pid) != pid:
+        connectionRecord.connection = connectionProxy.connection = None
+        raise DisconnectionError('Connection record belongs to pid %s, attempting to check out in pid %s' %
+                                 (connectionRecord.info['pid'], pid))
@@ -3,9 +3,15 @@ Classes representing the EPSG data schema
 """
 
 from sqlalchemy.ext.declarative import declarative_base, declared_attr, DeclarativeMeta
-from sqlalchemy import Table, Column, Integer, String, Date, Float, ForeignKey, event
+from sqlalchemy import Table, Column, Integer, String, Date, DateTime, Float, ForeignKey, Index, event
 from sqlalchemy.orm import relationship
 import datetime
+import urn
+
+# The version of the object model. This must be incremented whenever a
+# change to the model invalidates objects or databases created by a
+# previous version.
+MODEL_VERSION = 6
 
 # see http://stackoverflow.com/questions/4460830/enhance-sqlalchemy-syntax-for-polymorphic-identity
 class MetaBase(DeclarativeMeta):
@@ -54,6 +60,17 @@ class MetaBase(DeclarativeMeta):
 # Create a SQLAlchemy declarative base class using our metaclass
 Base = declarative_base(metaclass=MetaBase)
 
+# The registry metadata, a single row written when a registry is
+# initialised recording the model version it was built by, the
+# version of the EPSG dataset it was loaded from, when it was loaded
+# and a hash of its content.
+metadata_table = Table('registry_metadata', Base.metadata,
+    Column('schemaVersion', Integer, nullable=False),
+    Column('datasetVersion', String(255)),
+    Column('loaded', DateTime, nullable=False),
+    Column('contentHash', String(40))
+)
+
 # Attribute Event Validators
 #
 # See <http://docs.sqlalchemy.org/en/latest/orm/events.html> for
@@ -75,6 +92,12 @@ def _validate_date(target, value, oldvalue, initiator):
     else:
         raise TypeError('Expected a date or datetime instance or a date string: %s' % value)
 
+def _set_identifier(target, value, oldvalue, initiator):
+    """
+    Set the object type and code from an identifier
+    """
+    target.objectType, target.code = urn.parse(value)
+
 def _validate_float(target, value, oldvalue, initiator):
     """
     Ensure a value is a float
@@ -112,7 +135,7 @@ class DomainOfValidityMixin(object):
     """
     @declared_attr
     def _domainOfValidity_id(cls):
-        return Column(String(255), ForeignKey('AreaOfUse.identifier'))
+        return Column(String(255), ForeignKey('AreaOfUse.identifier'), index=True)
 
     @declared_attr
     def domainOfValidity(cls):
@@ -158,8 +181,18 @@ class Identifier(Base):
     """
     identifier = Column(String(255), primary_key=True)
 
-    _discriminator = Column('class', String(50))
+    # the components of EPSG URN identifiers, allowing objects to be
+    # queried by ranges of codes
+    objectType = Column(String(50))
+    code = Column(Integer)
+
+    _discriminator = Column('class', String(50), index=True)
     __mapper_args__ = {'polymorphic_on': _discriminator}
+    __table_args__ = (
+        Index('ix_Identifier_objectType_code', 'objectType', 'code'),
+        # for resolving codes of unknown type
+        Index('ix_Identifier_code', 'code')
+        )
 
     @declared_attr
     def __tablename__(cls):
@@ -174,8 +207,10 @@ class Identifier(Base):
     def __repr__(self):
         return "<%s('%s')>" % (self.__class__.__name__, self.identifier)
 
+event.listen(Identifier.identifier, 'set', _set_identifier, propagate=True)
+
 class DictionaryEntry(IdentifierJoinMixin('Identifier'), Identifier):
-    name = Column(String(255), nullable=False)
+    name = Column(String(255), nullable=False, index=True)
     remarks = Column(String)
     informationSource = Column(String)
     anchorDefinition = Column(String)
@@ -215,14 +250,14 @@ class Datum(TypeMixin, ScopeMixin, DomainOfValidityMixin, IdentifierJoinMixin('D
 event.listen(Datum.realizationEpoch, 'set', _validate_date, propagate=True, retval=True)
 
 class GeodeticDatum(IdentifierJoinMixin('Datum'), Datum):
-    _primeMeridian_id = Column(String(255), ForeignKey('PrimeMeridian.identifier'))
+    _primeMeridian_id = Column(String(255), ForeignKey('PrimeMeridian.identifier'), index=True)
     primeMeridian = relationship(
         "PrimeMeridian",
         primaryjoin = 'GeodeticDatum._primeMeridian_id==PrimeMeridian.identifier',
         uselist=False
         )
 
-    _ellipsoid_id = Column(String(255), ForeignKey('Ellipsoid.identifier'))
+    _ellipsoid_id = Column(String(255), ForeignKey('Ellipsoid.identifier'), index=True)
     ellipsoid = relationship(
         "Ellipsoid",
         primaryjoin = 'GeodeticDatum._ellipsoid_id==Ellipsoid.identifier',
@@ -244,14 +279,14 @@ class CoordinateReferenceSystem(TypeMixin, ScopeMixin, DomainOfValidityMixin, Id
     """
 
 class GeodeticCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateReferenceSystem):
-    _ellipsoidalCS_id = Column(String(255), ForeignKey('EllipsoidalCS.identifier'))
+    _ellipsoidalCS_id = Column(String(255), ForeignKey('EllipsoidalCS.identifier'), index=True)
     ellipsoidalCS = relationship(
         "EllipsoidalCS",
         primaryjoin = 'GeodeticCRS._ellipsoidalCS_id==EllipsoidalCS.identifier',
         uselist=False
         )
 
-    _geodeticDatum_id = Column(String(255), ForeignKey('GeodeticDatum.identifier'))
+    _geodeticDatum_id = Column(String(255), ForeignKey('GeodeticDatum.identifier'), index=True)
     geodeticDatum = relationship(
         "GeodeticDatum",
         primaryjoin = 'GeodeticCRS._geodeticDatum_id==GeodeticDatum.identifier',
@@ -261,8 +296,8 @@ class GeodeticCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateRe
 # Many to Many association between `CoordinateSystem` and
 # `CoordinateSystemAxis`
 _axes_association_table = Table('axes_association', Base.metadata,
-    Column('left_id', String(255), ForeignKey('CoordinateSystem.identifier')),
-    Column('right_id', String(255), ForeignKey('CoordinateSystemAxis.identifier'))
+    Column('left_id', String(255), ForeignKey('CoordinateSystem.identifier'), index=True),
+    Column('right_id', String(255), ForeignKey('CoordinateSystemAxis.identifier'), index=True)
 )
 
 class CoordinateSystem(TypeMixin, IdentifierJoinMixin('DictionaryEntry'), DictionaryEntry):
@@ -288,7 +323,7 @@ class CoordinateSystemAxis(IdentifierJoinMixin('Identifier'), Identifier):
     axisAbbrev = Column(String(50), nullable=False)
     axisDirection = Column(String(50), nullable=False)
 
-    _descriptionReference_id = Column(String(255), ForeignKey('AxisName.identifier'))
+    _descriptionReference_id = Column(String(255), ForeignKey('AxisName.identifier'), index=True)
     descriptionReference = relationship(
         "AxisName",
         primaryjoin = 'CoordinateSystemAxis._descriptionReference_id==AxisName.identifier',
@@ -300,7 +335,7 @@ class AxisName(DescriptionMixin, IdentifierJoinMixin('DictionaryEntry'), Diction
 
 class ProjectedCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateReferenceSystem):
     #conversion is not yet implemented
-    _baseGeodeticCRS_id = Column(String(255), ForeignKey('GeodeticCRS.identifier'))
+    _baseGeodeticCRS_id = Column(String(255), ForeignKey('GeodeticCRS.identifier'), index=True)
     baseGeodeticCRS = relationship(
         "CoordinateReferenceSystem",
         primaryjoin = 'ProjectedCRS._baseGeodeticCRS_id==CoordinateReferenceSystem.identifier',
@@ -308,7 +343,7 @@ class ProjectedCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateR
         uselist=False
         )
 
-    _cartesianCS_id = Column(String(255), ForeignKey('CartesianCS.identifier'))
+    _cartesianCS_id = Column(String(255), ForeignKey('CartesianCS.identifier'), index=True)
     cartesianCS = relationship(
         "CartesianCS",
         primaryjoin = 'ProjectedCRS._cartesianCS_id==CartesianCS.identifier',
@@ -318,7 +353,7 @@ class ProjectedCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateR
 
 class VerticalCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateReferenceSystem):
 
-    _verticalDatum_id = Column(String(255), ForeignKey('VerticalDatum.identifier'))
+    _verticalDatum_id = Column(String(255), ForeignKey('VerticalDatum.identifier'), index=True)
     verticalDatum = relationship(
         "VerticalDatum",
         primaryjoin = 'VerticalCRS._verticalDatum_id==VerticalDatum.identifier',
@@ -326,7 +361,7 @@ class VerticalCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateRe
         uselist=False
         )
 
-    _verticalCS_id = Column(String(255), ForeignKey('VerticalCS.identifier'))
+    _verticalCS_id = Column(String(255), ForeignKey('VerticalCS.identifier'), index=True)
     verticalCS = relationship(
         "VerticalCS",
         primaryjoin = 'VerticalCRS._verticalCS_id==VerticalCS.identifier',
@@ -336,7 +371,7 @@ class VerticalCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateRe
 
 class EngineeringCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateReferenceSystem):
 
-    _coordinateSystem_id = Column(String(255), ForeignKey('CoordinateSystem.identifier'))
+    _coordinateSystem_id = Column(String(255), ForeignKey('CoordinateSystem.identifier'), index=True)
     coordinateSystem = relationship(
         "CoordinateSystem",
         primaryjoin = 'EngineeringCRS._coordinateSystem_id==CoordinateSystem.identifier',
@@ -344,7 +379,7 @@ class EngineeringCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), Coordinat
         uselist=False
         )
 
-    _engineeringDatum_id = Column(String(255), ForeignKey('EngineeringDatum.identifier'))
+    _engineeringDatum_id = Column(String(255), ForeignKey('EngineeringDatum.identifier'), index=True)
     engineeringDatum = relationship(
         "EngineeringDatum",
         primaryjoin = 'EngineeringCRS._engineeringDatum_id==EngineeringDatum.identifier',
@@ -355,8 +390,8 @@ class EngineeringCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), Coordinat
 # Many to Many association between `CompoundCRS` and
 # `CoordinateReferenceSystem`
 _compoundcrs_association_table = Table('compoundcrs_association', Base.metadata,
-    Column('left_id', String(255), ForeignKey('CompoundCRS.identifier')),
-    Column('right_id', String(255), ForeignKey('CoordinateReferenceSystem.identifier'))
+    Column('left_id', String(255), ForeignKey('CompoundCRS.identifier'), index=True),
+    Column('right_id', String(255), ForeignKey('CoordinateReferenceSystem.identifier'), index=True)
 )
 
 class CompoundCRS(IdentifierJoinMixin('CoordinateReferenceSystem'), CoordinateReferenceSystem):
@@ -0,0 +1,226 @@
+"""
+Immutable in-memory snapshots of EPSG objects
+
+A snapshot is a frozen copy of a set of `schema` objects held as
+compact records, for read only use where the overhead of SQLAlchemy
+(instrumented attributes, sessions and identity maps) is not needed.
+Each class in the `schema` module is mirrored by a record class of the
+same name in this module, with the same public attributes. Records
+reference each other in the same way as the `schema` objects and
+collections are represented as tuples. e.g.
+
+>>> snapshot = registry.snapshot()
+>>> crs = snapshot['urn:ogc:def:crs:EPSG::27700']
+>>> crs.baseGeodeticCRS.geodeticDatum.ellipsoid.name
+"""
+
+from collections import Mapping
+from sqlalchemy.orm import object_mapper
+import schema, bulk, urn
+
+class Record(object):
+    """
+    The base class of the immutable records mirroring `schema` classes
+
+    `fields` lists the names of the attributes of a record class and
+    `references` the subset of those that reference other records.
+    """
+
+    __slots__ = ()
+    fields = ()
+    references = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s records are immutable' % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError('%s records are immutable' % self.__class__.__name__)
+
+    def __eq__(self, other):
+        if self.__class__ is not other.__class__:
+            return False
+        for field in self.fields:
+            if getattr(self, field) != getattr(other, field):
+                return False
+        return True
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.identifier)
+
+    def __repr__(self):
+        return "<%s('%s')>" % (self.__class__.__name__, self.identifier)
+
+def createRecordClasses():
+    """
+    Return a dictionary mapping `schema` classes to record classes
+
+    The record classes are created from the mappers of the `schema`
+    classes, mirroring their inheritance hierarchy.
+    """
+    classes = {}
+    for mapper in schema.Identifier.__mapper__.self_and_descendants:
+        if mapper.inherits is None:
+            base = Record
+        else:
+            base = classes[mapper.inherits.class_]
+
+        columns = [prop.key for prop in mapper.column_attrs if not prop.key.startswith('_')]
+        references = [prop.key for prop in mapper.relationships]
+        slots = tuple(field for field in columns + references if field not in base.fields)
+
+        classes[mapper.class_] = type(mapper.class_.__name__, (base,), {
+                '__slots__': slots,
+                '__module__': __name__,
+                '__doc__': 'An immutable record mirroring `schema.%s`' % mapper.class_.__name__,
+                'fields': base.fields + slots,
+                'references': base.references + tuple(field for field in slots if field in references)
+                })
+
+    return classes
+
+recordClasses = createRecordClasses()
+
+# make the record classes available from this module
+globals().update((class_.__name__, record) for class_, record in recordClasses.iteritems())
+
+def createRecords(objects):
+    """
+    Return records for `schema` objects
+
+    `objects` is a dictionary mapping identifiers to objects, which
+    must include every object that is referenced. A dictionary
+    mapping identifiers to records is returned.
+    """
+    setField = object.__setattr__
+    records = {}
+
+    for identifier, obj in objects.iteritems():
+        mapper = object_mapper(obj)
+        record = recordClasses[mapper.class_].__new__(recordClasses[mapper.class_])
+        records[identifier] = record
+        for prop in mapper.column_attrs:
+            if not prop.key.startswith('_'):
+                setField(record, prop.key, getattr(obj, prop.key))
+
+    # link the records once they all exist
+    for identifier, obj in objects.iteritems():
+        record = records[identifier]
+        for prop in object_mapper(obj).relationships:
+            value = getattr(obj, prop.key)
+            if prop.uselist:
+                value = tuple(records[child.identifier] for child in value)
+            elif value is not None:
+                value = records[value.identifier]
+            setField(record, prop.key, value)
+
+    return records
+
+class Snapshot(Mapping):
+    """
+    A read-only dictionary type mapping URNs to immutable records
+
+    This provides the same lookup interface as a `Registry`,
+    including the forms of key accepted by `Registry.normaliseKey`.
+    """
+
+    # the identifiers of the records indexed by code, created when
+    # first needed
+    codes = None
+
+    def __init__(self, records):
+        self.records = records
+
+    def __repr__(self):
+        return '<Snapshot(%d)>' % len(self.records)
+
+    def normaliseKey(self, key):
+        """
+        Return the identifier of the record a key refers to
+
+        This behaves like `Registry.normaliseKey`.
+        """
+        normalised = urn.normalise(key)
+        if normalised is None:
+            if not isinstance(key, basestring):
+                raise TypeError('String or integer expected for key, found: %s' % type(key))
+            return key
+
+        identifier, code = normalised
+        if identifier is not None:
+            return identifier
+
+        if self.codes is None:
+            self.codes = urn.indexCodes(self.records)
+        return urn.choose(self.codes.get(code))
+
+    def __getitem__(self, key):
+        # stored identifiers are matched exactly before the key is
+        # normalised
+        if isinstance(key, basestring) and key in self.records:
+            return self.records[key]
+
+        identifier = self.normaliseKey(key)
+        try:
+            return self.records[identifier]
+        except KeyError:
+            raise KeyError(key)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def keys(self):
+        return self.records.keys()
+
+    def values(self):
+        return self.records.values()
+
+    def items(self):
+        return self.records.items()
+
+    def getMany(self, keys, missing='skip'):
+        """
+        Retrieve many items by their identifiers
+
+        This behaves like `Registry.getMany`.
+        """
+        if missing not in ('skip', 'raise', None):
+            raise ValueError('Unknown value for `missing`: %s' % missing)
+
+        values = []
+        for key in keys:
+            value = self[key] if missing == 'raise' else self.get(key)
+            if value is not None or missing is None:
+                values.append(value)
+        return values
+
+    def stats(self):
+        """
+        Return the number of records of each class
+
+        This behaves like `Registry.stats`.
+        """
+        counts = {}
+        for record in self.records.itervalues():
+            name = record.__class__.__name__
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    @classmethod
+    def FromObjects(cls, values):
+        """
+        Create a snapshot of `schema` objects and the objects they reference
+        """
+        return cls(createRecords(bulk.getObjects(values)))
@@ -0,0 +1,258 @@
+"""
+Spatial queries of the areas of use of EPSG objects
+
+With SQLite the bounding boxes of `schema.AreaOfUse` objects are
+indexed in an R-tree virtual table, which is created along with the
+`AreaOfUse` table and kept up to date by triggers. Other databases,
+and SQLite builds without the R-tree module, fall back to scanning the
+`AreaOfUse` table.
+
+EPSG areas crossing the antimeridian have a west bound longitude
+greater than the east bound longitude. These are indexed as two boxes,
+either side of the antimeridian. Every area is given a stable integer
+key in a table alongside the R-tree, and the entries in the R-tree
+are keyed by twice that key, plus one for the second box.
+"""
+
+from sqlalchemy import event
+from sqlalchemy.sql import select, table, column, bindparam, and_, or_, union
+import schema
+
+RTREE_TABLE = 'AreaOfUse_rtree'
+
+# the table mapping area identifiers to integer R-tree keys
+RTREE_KEY_TABLE = 'AreaOfUse_rtree_key'
+
+# the R-tree entries of an area and their bounds, given the area
+# as `{row}`
+_RTREE_ENTRIES = """
+SELECT id * 2, {row}."westBoundLongitude",
+       CASE WHEN {row}."westBoundLongitude" > {row}."eastBoundLongitude" THEN 180 ELSE {row}."eastBoundLongitude" END,
+       {row}."southBoundLatitude", {row}."northBoundLatitude"
+FROM "{key}" WHERE identifier = {row}.identifier
+AND {row}."westBoundLongitude" IS NOT NULL AND {row}."eastBoundLongitude" IS NOT NULL
+AND {row}."southBoundLatitude" IS NOT NULL AND {row}."northBoundLatitude" IS NOT NULL
+UNION ALL
+SELECT id * 2 + 1, -180, {row}."eastBoundLongitude", {row}."southBoundLatitude", {row}."northBoundLatitude"
+FROM "{key}" WHERE identifier = {row}.identifier
+AND {row}."westBoundLongitude" > {row}."eastBoundLongitude"
+AND {row}."southBoundLatitude" IS NOT NULL AND {row}."northBoundLatitude" IS NOT NULL
+"""
+
+_RTREE_REMOVE = """
+DELETE FROM "{rtree}" WHERE id IN (
+  SELECT id * 2 FROM "{key}" WHERE identifier = {row}.identifier
+  UNION ALL
+  SELECT id * 2 + 1 FROM "{key}" WHERE identifier = {row}.identifier
+);"""
+
+_RTREE_ADD = """
+INSERT OR IGNORE INTO "{key}" (identifier) VALUES ({row}.identifier);
+INSERT OR REPLACE INTO "{rtree}" %s;""" % _RTREE_ENTRIES
+
+_RTREE_DELETE_KEY = """
+DELETE FROM "{key}" WHERE identifier = {row}.identifier;"""
+
+RTREE_DDL = [
+    'CREATE TABLE "{key}" (id INTEGER PRIMARY KEY, identifier VARCHAR(255) NOT NULL UNIQUE)',
+    'CREATE VIRTUAL TABLE "{rtree}" USING rtree(id, minX, maxX, minY, maxY)',
+    'CREATE TRIGGER "{rtree}_insert" AFTER INSERT ON "AreaOfUse" BEGIN %s %s END' % (
+        _RTREE_REMOVE.replace('{row}', 'NEW'), _RTREE_ADD.replace('{row}', 'NEW')),
+    'CREATE TRIGGER "{rtree}_update" AFTER UPDATE ON "AreaOfUse" BEGIN %s %s %s END' % (
+        _RTREE_REMOVE.replace('{row}', 'OLD'), _RTREE_DELETE_KEY.replace('{row}', 'OLD'),
+        _RTREE_ADD.replace('{row}', 'NEW')),
+    'CREATE TRIGGER "{rtree}_delete" AFTER DELETE ON "AreaOfUse" BEGIN %s %s END' % (
+        _RTREE_REMOVE.replace('{row}', 'OLD'), _RTREE_DELETE_KEY.replace('{row}', 'OLD'))
+    ]
+
+def supportsRTree(connection):
+    """
+    Return True if a database connection supports R-tree indexes
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    options = [row[0] for row in connection.execute('PRAGMA compile_options')]
+    return 'ENABLE_RTREE' in options
+
+def hasRTree(connection):
+    """
+    Return True if the database has an R-tree index of areas of use
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    return connection.execute(query, (RTREE_KEY_TABLE,)).scalar() is not None
+
+def createRTree(connection):
+    """
+    Create the R-tree index of areas of use, if supported
+
+    This is called when the `AreaOfUse` table is created.
+    """
+    if supportsRTree(connection):
+        for statement in RTREE_DDL:
+            connection.execute(statement.replace('{rtree}', RTREE_TABLE).replace('{key}', RTREE_KEY_TABLE))
+
+def dropRTree(connection):
+    """
+    Drop the R-tree index of areas of use and the triggers maintaining it
+
+    This is called when the `AreaOfUse` table is dropped. Queries fall
+    back to scanning the `AreaOfUse` table without the index.
+    """
+    if connection.dialect.name == 'sqlite':
+        for suffix in ('insert', 'update', 'delete'):
+            connection.execute('DROP TRIGGER IF EXISTS "%s_%s"' % (RTREE_TABLE, suffix))
+        connection.execute('DROP TABLE IF EXISTS "%s"' % RTREE_TABLE)
+        connection.execute('DROP TABLE IF EXISTS "%s"' % RTREE_KEY_TABLE)
+
+event.listen(schema.AreaOfUse.__table__, 'after_create', lambda target, connection, **kw: createRTree(connection))
+event.listen(schema.AreaOfUse.__table__, 'after_drop', lambda target, connection, **kw: dropRTree(connection))
+
+def splitBBox(west, south, east, north):
+    """
+    Return the boxes a bounding box is composed of
+
+    A bounding box crossing the antimeridian (where `west > east`) is
+    split into two boxes. Each box is a tuple of `(west, south, east,
+    north)`.
+    """
+    for value in (west, south, east, north):
+        if not isinstance(value, (int, long, float)) or isinstance(value, bool):
+            raise TypeError('Number expected for coordinate, found: %s' % type(value))
+    if south > north:
+        raise ValueError('South bound latitude is greater than north: %s > %s' % (south, north))
+
+    if west > east:
+        return [(west, south, 180, north), (-180, south, east, north)]
+    return [(west, south, east, north)]
+
+def getIntersection(boxes):
+    """
+    Return a clause selecting the areas of use intersecting boxes
+    """
+    area = schema.AreaOfUse.__table__
+    clauses = []
+    for west, south, east, north in boxes:
+        latitude = and_(area.c.southBoundLatitude <= north, area.c.northBoundLatitude >= south)
+        clauses.append(and_(latitude, or_(
+                    and_(area.c.westBoundLongitude <= area.c.eastBoundLongitude,
+                         area.c.westBoundLongitude <= east, area.c.eastBoundLongitude >= west),
+                    and_(area.c.westBoundLongitude > area.c.eastBoundLongitude,
+                         or_(area.c.westBoundLongitude <= east, area.c.eastBoundLongitude >= west))
+                    )))
+    return or_(*clauses)
+
+def getAreaQuery(boxes, rtree=False):
+    """
+    Return a query selecting the identifiers of the areas of use
+    intersecting boxes
+
+    If `rtree` is True the candidate areas are selected from the
+    R-tree index, otherwise the `AreaOfUse` table is scanned. The
+    candidates are checked against the exact bounds of the areas in
+    both cases, as the R-tree stores approximate bounds.
+    """
+    area = schema.AreaOfUse.__table__
+    intersection = getIntersection(boxes)
+    if not rtree:
+        return select([area.c.identifier]).where(intersection)
+
+    index = table(RTREE_TABLE, column('id'), column('minX'), column('maxX'), column('minY'), column('maxY'))
+    candidates = union(*[
+            select([index.c.id / 2]).where(and_(
+                    index.c.minX <= east, index.c.maxX >= west,
+                    index.c.minY <= north, index.c.maxY >= south))
+            for west, south, east, north in boxes])
+
+    keys = table(RTREE_KEY_TABLE, column('id'), column('identifier'))
+    return select([area.c.identifier]).select_from(
+        keys.join(area, area.c.identifier == keys.c.identifier)
+        ).where(and_(keys.c.id.in_(candidates), intersection))
+
+def getTypes(types):
+    """
+    Return the tables and discriminator values selected by `types`
+
+    `types` is a sequence of `schema` classes that have a
+    `domainOfValidity`, or None for all such classes. A dictionary
+    mapping the tables holding the `domainOfValidity` of the classes
+    to the discriminator values selected from them (or None for all
+    values) is returned.
+    """
+    tables = {}
+    if types is None:
+        for mapper in schema.Identifier.__mapper__.self_and_descendants:
+            if mapper.inherits and issubclass(mapper.class_, schema.DomainOfValidityMixin) and \
+                    not issubclass(mapper.inherits.class_, schema.DomainOfValidityMixin):
+                tables[mapper.local_table] = None
+        return tables
+
+    for class_ in types:
+        if not isinstance(class_, type) or not issubclass(class_, schema.DomainOfValidityMixin):
+            raise ValueError('Class with a domainOfValidity expected, found: %r' % (class_,))
+        mapper = class_.__mapper__
+        owner = mapper
+        while issubclass(owner.inherits.class_, schema.DomainOfValidityMixin):
+            owner = owner.inherits
+        values = tables.setdefault(owner.local_table, set())
+        values.update(m.polymorphic_identity for m in mapper.self_and_descendants)
+    return tables
+
+# queries cached by `getQuery`, along with their compiled forms
+_queries = {}
+_compiledCache = {}
+
+def getQuery(count, rtree, types=None):
+    """
+    Return a query selecting the identifiers of objects whose area of
+    use intersects `count` boxes
+
+    The bounds of the boxes are the bound parameters `west<n>`,
+    `south<n>`, `east<n>` and `north<n>`. `rtree` is as accepted by
+    `getAreaQuery` and `types` as by `getTypes`. The queries are
+    cached so that they are only compiled once, or None is returned
+    if no types are selected.
+    """
+    key = (count, rtree, None if types is None else tuple(sorted(set(types))))
+    try:
+        return _queries[key]
+    except KeyError:
+        pass
+
+    boxes = [tuple(bindparam('%s%d' % (name, i)) for name in ('west', 'south', 'east', 'north'))
+             for i in xrange(count)]
+    areas = getAreaQuery(boxes, rtree)
+
+    identifier = schema.Identifier.__table__
+    queries = []
+    for owner, values in getTypes(types).iteritems():
+        query = select([owner.c.identifier]).where(owner.c._domainOfValidity_id.in_(areas))
+        if values is not None:
+            query = query.select_from(owner.join(identifier, identifier.c.identifier == owner.c.identifier)).\
+                where(identifier.c['class'].in_(sorted(values)))
+        queries.append(query)
+
+    query = union(*queries) if queries else None
+    _queries[key] = query
+    return query
+
+def find(connection, boxes, types=None):
+    """
+    Return the identifiers of objects whose area of use intersects
+    boxes
+
+    `boxes` are as returned by `splitBBox` and `types` as accepted by
+    `getTypes`. The identifiers are returned as a sorted list.
+    """
+    query = getQuery(len(boxes), hasRTree(connection), types)
+    if query is None:
+        return []
+
+    parameters = {}
+    for i, box in enumerate(boxes):
+        for name, value in zip(('west', 'south', 'east', 'north'), box):
+            parameters['%s%d' % (name, i)] = value
+
+    connection = connection.execution_options(compiled_cache=_compiledCache)
+    return sorted(row[0] for row in connection.execute(query, parameters))
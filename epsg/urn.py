@@ -0,0 +1,143 @@
+"""
+Parsing of EPSG identifiers
+
+Objects in the EPSG registry are identified by URNs of the form
+`urn:ogc:def:<object type>:EPSG:<version>:<code>`, where the version is
+usually empty. e.g.
+
+>>> from epsg import urn
+>>> urn.parse('urn:ogc:def:crs:EPSG::27700')
+('crs', 27700)
+
+Clients commonly use other forms of identifier which can be converted
+to URNs using `normalise`. This returns the URN and the code, or None
+in place of the URN if the object type is ambiguous:
+
+>>> urn.normalise('http://www.opengis.net/def/crs/EPSG/0/4326')
+('urn:ogc:def:crs:EPSG::4326', 4326)
+>>> urn.normalise('EPSG:4326')
+(None, 4326)
+"""
+
+import re
+
+URN_PATTERN = re.compile(r'^urn:ogc:def:([\w-]+):EPSG:[\d.]*:(\d+)$')
+
+# the alternative forms of identifier accepted by `normalise`
+NORMALISE_PATTERNS = (
+    # URNs, including the deprecated `x-ogc` form
+    re.compile(r'^urn:(?:x-)?ogc:def:([\w-]+):EPSG:[\d.]*:(\d+)$', re.I),
+    # OGC HTTP URIs
+    re.compile(r'^https?://www\.opengis\.net/def/([\w-]+)/EPSG/[\d.]+/(\d+)$', re.I),
+    # EPSG:<code> and bare codes
+    re.compile(r'^()(?:EPSG::?)?(\d+)$', re.I)
+    )
+
+# the object types preferred when a code is ambiguous, most preferred
+# first
+TYPE_PREFERENCE = ('crs', 'datum', 'cs', 'ellipsoid', 'meridian', 'area', 'axis', 'axis-name')
+
+# the maximum number of memoised results of `normalise`
+NORMALISE_CACHE_SIZE = 10000
+_normaliseCache = {}
+
+def parse(identifier):
+    """
+    Return the object type and code of an EPSG URN
+
+    `(None, None)` is returned for identifiers that are not EPSG URNs.
+    """
+    match = URN_PATTERN.match(identifier or '')
+    if not match:
+        return None, None
+    return match.group(1), int(match.group(2))
+
+def format(objectType, code):
+    """
+    Return the EPSG URN of an object type and code
+    """
+    return 'urn:ogc:def:%s:EPSG::%d' % (objectType, code)
+
+def normalise(key):
+    """
+    Return the URN and code identified by a key
+
+    Keys can be EPSG URNs (optionally versioned), OGC HTTP URIs,
+    strings of the form `EPSG:<code>` or codes as integers or
+    strings. A tuple of the unversioned URN and the integer code is
+    returned, where the URN is None for the latter two as the object
+    type is ambiguous. None is returned if a key is not recognised.
+    The `urn:ogc:def:` prefix and the authority are matched without
+    regard to case, but the case of the object type is kept.
+
+    The results for strings are memoised.
+    """
+    if isinstance(key, (int, long)) and not isinstance(key, bool):
+        if key < 0:
+            return None
+        return None, key
+
+    if not isinstance(key, basestring):
+        return None
+
+    try:
+        return _normaliseCache[key]
+    except KeyError:
+        pass
+
+    result = _normalise(key)
+    if len(_normaliseCache) >= NORMALISE_CACHE_SIZE:
+        _normaliseCache.clear()
+    _normaliseCache[key] = result
+    return result
+
+def _normalise(key):
+    """
+    Normalise a string key without memoisation
+    """
+    stripped = key.strip()
+    for pattern in NORMALISE_PATTERNS:
+        match = pattern.match(stripped)
+        if match:
+            objectType, code = match.group(1), match.group(2)
+            if not objectType:
+                return None, int(code)
+            identifier = 'urn:ogc:def:%s:EPSG::%s' % (objectType, code)
+            if identifier == key:
+                identifier = key        # share the existing string
+            return identifier, int(code)
+    return None
+
+def indexCodes(identifiers):
+    """
+    Return a dictionary mapping codes to the identifiers with them
+
+    Codes are parsed from the identifiers as by `parse`, which is also
+    how the codes of stored objects are set, and identifiers that are
+    not EPSG URNs are omitted.
+    """
+    codes = {}
+    for identifier in identifiers:
+        code = parse(identifier)[1]
+        if code is not None:
+            codes.setdefault(code, []).append(identifier)
+    return codes
+
+def choose(identifiers):
+    """
+    Return the preferred identifier from those sharing a code
+
+    Identifiers are preferred by object type in the order of
+    `TYPE_PREFERENCE`, then alphabetically. None is returned if there
+    are no identifiers.
+    """
+    def rank(identifier):
+        objectType = parse(identifier)[0]
+        try:
+            return TYPE_PREFERENCE.index(objectType), identifier
+        except ValueError:
+            return len(TYPE_PREFERENCE), identifier
+
+    if not identifiers:
+        return None
+    return min(identifiers, key=rank)
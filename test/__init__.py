@@ -16,12 +16,147 @@ if version_info[0] == 2 and version_info[1] < 7:
 else:    
     import unittest
 
+import os
 import os.path
-from epsg import schema
+import re
+import sys
+import time
+from epsg import load, schema, snapshot
 
 def getTestFile():
     return os.path.join(os.path.dirname(__file__), 'test.xml')
 
+class LoaderTestCase(unittest.TestCase):
+    """
+    Base class for tests sharing a loader of the test data
+
+    The loader is created once per class as `cls.loader`.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        xml = load.XML.FromFile(getTestFile())
+        cls.loader = load.XMLLoader(xml)
+        cls.loader.load()
+
+# Benchmarks are slow and timing dependent so they are only run when
+# the `EPSG_BENCHMARK` environment variable is set. Its value is the
+# number of copies of the test data used to synthesise a dataset of
+# realistic size e.g. `EPSG_BENCHMARK=400` approximates the full EPSG
+# export.
+BENCHMARK_COPIES = int(os.environ.get('EPSG_BENCHMARK') or 0)
+
+def skipUnlessBenchmark(cls):
+    """
+    Class decorator that skips a benchmark unless benchmarks are enabled
+    """
+    return unittest.skipUnless(BENCHMARK_COPIES, 'set EPSG_BENCHMARK to run benchmarks')(cls)
+
+def getSyntheticGML(copies=None):
+    """
+    Return GML containing renumbered copies of the test data
+
+    Every EPSG code in each copy is offset so that the copies do not
+    collide, while references between the entries of a copy are
+    preserved.
+    """
+    if copies is None:
+        copies = max(BENCHMARK_COPIES, 1)
+
+    with open(getTestFile(), 'rb') as fh:
+        gml = fh.read()
+
+    start = gml.index('<dictionaryEntry')
+    end = gml.rindex('</Dictionary>')
+    header, entries, footer = gml[:start], gml[start:end], gml[end:]
+
+    urn = re.compile(r'(urn:ogc:def:[\w-]+:EPSG:[\d.]*:)(\d+)')
+    parts = [header]
+    for copy in xrange(copies):
+        offset = copy * 100000
+        parts.append(urn.sub(lambda m: m.group(1) + str(int(m.group(2)) + offset), entries))
+    parts.append(footer)
+
+    return ''.join(parts)
+
+def timeit(func, repeat=3):
+    """
+    Return the best wall clock time in seconds of calling `func`
+    """
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(name, **results):
+    """
+    Write benchmark results to stderr
+    """
+    values = ', '.join('%s=%s' % (k, ('%.4f' % v) if isinstance(v, float) else v) for k, v in sorted(results.items()))
+    sys.stderr.write('\n%s: %s\n' % (name, values))
+
+class StatementRecorder(object):
+    """
+    Records the SQL statements executed by a database engine
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.statements = []
+        self.parameters = []
+        event.listen(engine, 'before_cursor_execute', self.record)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def record(self, conn, cursor, statement, parameters, *args):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+def explain(engine, statement, parameters=()):
+    """
+    Return the SQLite query plan of a statement as a single string
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return '\n'.join(row[-1] for row in cursor.fetchall())
+    finally:
+        connection.close()
+
+def walk(obj, visited=None):
+    """
+    Access every object referenced by an object or snapshot record,
+    transitively
+
+    The identifiers of the objects visited are returned.
+    """
+    from sqlalchemy.orm import object_mapper
+
+    if visited is None:
+        visited = set()
+    if obj is None or obj.identifier in visited:
+        return visited
+    visited.add(obj.identifier)
+
+    if isinstance(obj, snapshot.Record):
+        for field in obj.references:
+            value = getattr(obj, field)
+            for child in (value if isinstance(value, tuple) else [value]):
+                walk(child, visited)
+        return visited
+
+    for prop in object_mapper(obj).relationships:
+        value = getattr(obj, prop.key)
+        for child in (value if prop.uselist else [value]):
+            walk(child, visited)
+    return visited
+
 class SchemaBuilder(object):
     """
     Creates schema objects for use in the tests
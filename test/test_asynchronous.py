@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+from epsg import Registry, snapshot
+from epsg.asynchronous import AsyncRegistry
+from test import unittest, LoaderTestCase
+
+class TestAsyncRegistry(LoaderTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        url = 'sqlite:///%s' % os.path.join(self.directory, 'registry.sqlite')
+        engine = Registry.CreateEngine(url, threadSafe=True)
+        self.registry = AsyncRegistry(Registry(engine, loader=self.loader, threadSafe=True), workers=2)
+
+    def tearDown(self):
+        self.registry.close()
+        self.registry.registry.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def testInvalidArguments(self):
+        with self.assertRaises(ValueError):
+            AsyncRegistry(Registry(loader=False))
+        with self.assertRaises(ValueError):
+            AsyncRegistry(self.registry.registry, workers=0)
+
+    def testGet(self):
+        crs = self.registry.get('EPSG:27700').get()
+        self.assertIsInstance(crs, snapshot.ProjectedCRS)
+        self.assertEqual('urn:ogc:def:crs:EPSG::27700', crs.identifier)
+        self.assertEqual(u'OSGB 1936 / British National Grid', crs.name)
+        self.assertEqual(u'Airy 1830', crs.baseGeodeticCRS.geodeticDatum.ellipsoid.name)
+
+        self.assertIsNone(self.registry.get('urn:ogc:def:crs:EPSG::0').get())
+        self.assertEqual(1, self.registry.get('urn:ogc:def:crs:EPSG::0', 1).get())
+
+    def testCallback(self):
+        results = []
+        done = threading.Event()
+        def callback(value):
+            results.append(value)
+            done.set()
+        self.registry.contains('urn:ogc:def:crs:EPSG::27700', callback)
+        done.wait(10)
+        self.assertEqual([True], results)
+
+    def testGetMany(self):
+        keys = ['urn:ogc:def:crs:EPSG::27700', 'urn:ogc:def:crs:EPSG::0', 'EPSG:4277']
+        values = self.registry.getMany(keys).get()
+        self.assertEqual(['urn:ogc:def:crs:EPSG::27700', 'urn:ogc:def:crs:EPSG::4277'],
+                         [value.identifier for value in values])
+        self.assertIs(values[0].baseGeodeticCRS, values[1])
+
+        values = self.registry.getMany(keys, missing=None).get()
+        self.assertIsNone(values[1])
+
+        with self.assertRaises(KeyError):
+            self.registry.getMany(keys, missing='raise').get()
+
+    def testContains(self):
+        results = [self.registry.contains(key) for key in ('EPSG:27700', 'urn:ogc:def:crs:EPSG::0')]
+        self.assertEqual([True, False], [result.get() for result in results])
+
+    def testIterValues(self):
+        batches = self.registry.iterValues(batchSize=10, prefetch=1)
+        results = list(batches.get())
+        values = [value for result in results for value in result.get()]
+        self.assertEqual(sorted(self.loader.keys()), [value.identifier for value in values])
+        self.assertTrue(all(len(result.get()) <= 10 for result in results))
+
+        with self.assertRaises(ValueError):
+            list(self.registry.iterValues(batchSize=0))
+
+    def testInit(self):
+        self.registry.init(False).get()
+        self.assertFalse(self.registry.contains('urn:ogc:def:crs:EPSG::27700').get())
+        self.registry.init(self.loader).get()
+        self.assertTrue(self.registry.contains('urn:ogc:def:crs:EPSG::27700').get())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
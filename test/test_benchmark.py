@@ -0,0 +1,702 @@
+# -*- coding: utf-8 -*-
+
+"""
+Performance benchmarks
+
+These are skipped unless the `EPSG_BENCHMARK` environment variable is
+set to the number of copies of the test data to benchmark against
+e.g.
+
+    EPSG_BENCHMARK=400 python -m unittest test.test_benchmark
+"""
+
+import sys
+from sqlalchemy.sql import bindparam
+from epsg import Registry, load, bulk
+from test import unittest, BENCHMARK_COPIES, skipUnlessBenchmark, getSyntheticGML, timeit, report, StatementRecorder, walk
+
+@skipUnlessBenchmark
+class TestXMLLoaderBenchmark(unittest.TestCase):
+
+    # the fields read by the loader from a typical element
+    fields = [
+        ('identifier', None),
+        ('name', None),
+        ('remarks', None),
+        ('anchorDefinition', None),
+        ('informationSource', 'epsg'),
+        ('type', 'epsg'),
+        ('scope', None),
+        ('domainOfValidity', None),
+        ('baseGeodeticCRS', None),
+        ('cartesianCS', None)
+        ]
+
+    def setUp(self):
+        self.xml = load.XML.FromString(getSyntheticGML())
+        self.elements = [self.xml[key] for key in self.xml.keys()]
+
+    def testElementRecord(self):
+        xml = self.xml
+
+        def scan():
+            # a subtree scan for each field
+            for element in self.elements:
+                for name, ns in self.fields:
+                    xml.getElementsByTagName(name, element, ns)
+
+        def index():
+            # a single pass per element
+            for element in self.elements:
+                record = load.ElementRecord(element, xml.ns)
+                for name, ns in self.fields:
+                    record.getElements(name, ns)
+
+        scanTime = timeit(scan)
+        indexTime = timeit(index)
+        report('ElementRecord', elements=len(self.elements), scan=scanTime, record=indexTime, speedup=scanTime / indexTime)
+        self.assertLess(indexTime, scanTime)
+
+    def testIndex(self):
+        dom = self.xml.dom
+        report('XML index', elements=len(self.elements), seconds=timeit(lambda: load.XML(dom)))
+
+    def testLoad(self):
+        def load_():
+            loader = load.XMLLoader(self.xml)
+            loader.load()
+
+        report('XMLLoader.load', elements=len(self.elements), seconds=timeit(load_))
+
+@skipUnlessBenchmark
+class TestIndexedXMLBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        import os, tempfile
+        fd, self.path = tempfile.mkstemp(suffix='.xml')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(getSyntheticGML())
+
+    def tearDown(self):
+        import os
+        for path in (self.path, self.path + '.idx'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def testColdLookup(self):
+        key = 'urn:ogc:def:crs:EPSG::27700'
+
+        def lookup(class_, **kwargs):
+            xml = class_.FromFile(self.path, **kwargs)
+            return load.XMLLoader(xml)[key]
+
+        indexPath = self.path + '.idx'
+        load.IndexedXML.FromFile(self.path, indexPath).close() # build the index
+        full = timeit(lambda: lookup(load.XML), 1)
+        indexed = timeit(lambda: lookup(load.IndexedXML, indexPath=indexPath))
+        report('IndexedXML cold lookup', full=full, indexed=indexed, speedup=full / indexed)
+        self.assertLess(indexed, full)
+
+@skipUnlessBenchmark
+class TestLoaderCacheBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from epsg.cache import LoaderCache
+        self.cache = LoaderCache(tempfile.mkdtemp())
+        self.gml = getSyntheticGML()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.cache.directory)
+
+    def testHit(self):
+        def parse():
+            loader = load.XMLLoader(load.XML.FromString(self.gml))
+            loader.load()
+            return loader
+
+        parseTime = timeit(parse, 1)
+        self.cache.set(self.gml, parse())
+        hitTime = timeit(lambda: self.cache.get(self.gml))
+        report('LoaderCache', parse=parseTime, hit=hitTime, speedup=parseTime / hitTime)
+        self.assertLess(hitTime, parseTime)
+
+@skipUnlessBenchmark
+class TestRegistryBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = load.XMLLoader(load.XML.FromString(getSyntheticGML()))
+        cls.loader.load()
+
+    def testBulkInsert(self):
+        def update():
+            registry = Registry(loader=False)
+            registry.update(self.loader)
+
+        def bulkInsert():
+            registry = Registry(loader=False)
+            registry.bulkInsert(self.loader.itervalues())
+
+        updateTime = timeit(update, 1)
+        bulkTime = timeit(bulkInsert, 1)
+        report('Registry.bulkInsert', objects=len(self.loader), update=updateTime,
+               bulkInsert=bulkTime, speedup=updateTime / bulkTime)
+        self.assertLess(bulkTime, updateTime)
+
+    def testUpsertMany(self):
+        # every object already exists so each one is updated
+        registry = Registry(loader=self.loader)
+        connection = registry.engine.connect()
+
+        def upsert(native):
+            with connection.begin():
+                bulk.upsert(connection, self.loader.itervalues(), native=native)
+
+        updateTime = timeit(lambda: registry.update(self.loader), 1)
+        nativeTime = timeit(lambda: upsert(True), 1)
+        genericTime = timeit(lambda: upsert(False), 1)
+        count = len(self.loader)
+        report('Registry.upsertMany', objects=count, update=updateTime,
+               native=nativeTime, generic=genericTime,
+               updateRate=count / updateTime, nativeRate=count / nativeTime,
+               genericRate=count / genericTime)
+        self.assertLess(nativeTime, updateTime)
+        self.assertLess(genericTime, updateTime)
+
+    def testCachedLookup(self):
+        keys = self.loader.keys()[:1000]
+        uncached = Registry(loader=self.loader)
+        cached = Registry(loader=self.loader, cacheSize=len(keys))
+
+        def lookup(registry):
+            for key in keys:
+                registry[key]
+
+        lookup(cached)          # warm the cache
+        uncachedTime = timeit(lambda: lookup(uncached))
+        cachedTime = timeit(lambda: lookup(cached))
+        report('Registry cache', lookups=len(keys), uncached=uncachedTime,
+               cached=cachedTime, speedup=uncachedTime / cachedTime)
+        self.assertLess(cachedTime, uncachedTime)
+
+    def testGetMany(self):
+        registry = Registry(loader=self.loader)
+        keys = [key for key in self.loader.keys() if ':crs:' in key][:500]
+        statements = StatementRecorder(registry.engine)
+
+        def getItems():
+            registry.session.expunge_all()
+            for key in keys:
+                walk(registry[key])
+
+        def getMany():
+            registry.session.expunge_all()
+            for value in registry.getMany(keys):
+                walk(value)
+
+        itemTime = timeit(getItems, 1)
+        itemQueries = len(statements)
+        manyTime = timeit(getMany, 1)
+        manyQueries = len(statements) - itemQueries
+        report('Registry.getMany', keys=len(keys), getitem=itemTime, getitemQueries=itemQueries,
+               getMany=manyTime, getManyQueries=manyQueries, speedup=itemTime / manyTime)
+        self.assertLess(manyQueries, itemQueries)
+        self.assertLess(manyTime, itemTime)
+
+    def testContains(self):
+        from epsg import schema
+
+        registry = Registry(loader=self.loader)
+        keyed = Registry(loader=self.loader, cacheKeys=True)
+        keys = self.loader.keys()[:500]
+        absent = ['urn:ogc:def:crs:EPSG::%d' % i for i in xrange(500)]
+
+        def count(registry, keys):
+            # the previous implementation
+            query = registry.session.query(schema.Identifier)
+            for key in keys:
+                query.filter_by(identifier=key).count() == 1
+
+        def contains(registry, keys):
+            for key in keys:
+                key in registry
+
+        results = {}
+        for name, check in (('count', count), ('exists', contains)):
+            results[name] = timeit(lambda: check(registry, keys + absent))
+        results['keySet'] = timeit(lambda: contains(keyed, keys + absent))
+        report('Registry.__contains__', lookups=len(keys + absent), **results)
+        self.assertLess(results['exists'], results['count'])
+        self.assertLess(results['keySet'], results['exists'])
+
+    def testCounts(self):
+        registry = Registry(loader=self.loader)
+        counted = Registry(loader=self.loader, cacheCounts=True)
+
+        def count(registry):
+            for i in xrange(100):
+                len(registry)
+                registry.stats()
+
+        uncachedTime = timeit(lambda: count(registry))
+        cachedTime = timeit(lambda: count(counted))
+        report('Registry.__len__ and stats', calls=100, uncached=uncachedTime,
+               cached=cachedTime, speedup=uncachedTime / cachedTime)
+        self.assertLess(cachedTime, uncachedTime)
+
+    def testGetRange(self):
+        from epsg import urn
+
+        registry = Registry(loader=self.loader)
+        start, end = 4000, 4000 + BENCHMARK_COPIES * 100000 / 2
+
+        def scan():
+            # filter the identifiers without the code index
+            keys = []
+            for key in registry:
+                objectType, code = urn.parse(key)
+                if objectType == 'crs' and start <= code <= end:
+                    keys.append(key)
+            return registry.getMany(keys, profile='shallow')
+
+        rangeTime = timeit(lambda: registry.getRange('crs', start, end, profile='shallow'))
+        scanTime = timeit(scan)
+        report('Registry.getRange', objects=len(self.loader), range=rangeTime, scan=scanTime,
+               speedup=scanTime / rangeTime)
+        self.assertLess(rangeTime, scanTime)
+
+    def testPolymorphicLookup(self):
+        from sqlalchemy.orm import object_mapper
+
+        # one key of each concrete class
+        keys = {}
+        for key, value in self.loader.iteritems():
+            keys.setdefault(type(value).__name__, key)
+
+        for polymorphic in ('select', 'joined', 'discriminator'):
+            registry = Registry(loader=self.loader, polymorphic=polymorphic)
+            statements = StatementRecorder(registry.engine)
+
+            def lookup(key):
+                registry.session.expunge_all()
+                value = registry[key]
+                for prop in object_mapper(value).column_attrs:
+                    getattr(value, prop.key)
+
+            results = {}
+            for name, key in sorted(keys.items()):
+                count = len(statements)
+                lookup(key)
+                queries = len(statements) - count
+                elapsed = timeit(lambda: lookup(key), 20)
+                results[name] = '%d/%.2fms' % (queries, elapsed * 1000)
+            report('Registry(polymorphic=%r) queries/latency' % polymorphic, **results)
+
+    def testNormalise(self):
+        from epsg import urn
+
+        keys = []
+        for key in self.loader.keys():
+            objectType, code = urn.parse(key)
+            keys.extend([key, 'EPSG:%d' % code, 'http://www.opengis.net/def/%s/EPSG/0/%d' % (objectType, code), code])
+
+        def normalise(func):
+            for key in keys:
+                func(key)
+
+        def unmemoised(key):
+            if isinstance(key, basestring):
+                urn._normalise(key)
+
+        normalise(urn.normalise)        # populate the memo
+        memoTime = timeit(lambda: normalise(urn.normalise))
+        parseTime = timeit(lambda: normalise(unmemoised))
+
+        # lookups by code in a cached registry with and without a key set
+        codes = [urn.parse(key)[1] for key in self.loader.keys() if key.startswith('urn:ogc:def:crs:')]
+        results = {}
+        for cacheKeys in (False, True):
+            registry = Registry(loader=self.loader, cacheSize=len(codes), cacheKeys=cacheKeys)
+            lookup = lambda: [registry[code] for code in codes]
+            lookup()
+            results['keySet' if cacheKeys else 'query'] = timeit(lookup)
+
+        report('urn.normalise', keys=len(keys), memoised=memoTime, unmemoised=parseTime,
+               speedup=parseTime / memoTime)
+        report('Registry lookup by code', lookups=len(codes), **results)
+        self.assertLess(memoTime, parseTime)
+
+    def testFindByLocation(self):
+        import random
+        from epsg import schema, spatial
+
+        # the copies of the test data share areas of use, so scatter
+        # them into small boxes around the world
+        random.seed(42)
+        rows = []
+        for key, value in self.loader.iteritems():
+            if isinstance(value, schema.AreaOfUse):
+                west, south = random.uniform(-180, 175), random.uniform(-90, 85)
+                rows.append(dict(key=key, west=west, east=west + 5, south=south, north=south + 5))
+        update = schema.AreaOfUse.__table__.update().where(
+            schema.AreaOfUse.identifier == bindparam('key')).values(
+            westBoundLongitude=bindparam('west'), eastBoundLongitude=bindparam('east'),
+            southBoundLatitude=bindparam('south'), northBoundLatitude=bindparam('north'))
+
+        # add as many areas again as the EPSG dataset has, without
+        # EPSG codes
+        boxes = []
+        for i in xrange(4000):
+            west, south = random.uniform(-180, 175), random.uniform(-90, 85)
+            boxes.append((west, south, west + 5, south + 5))
+
+        def getAreas():
+            for i, (west, south, east, north) in enumerate(boxes):
+                area = schema.AreaOfUse('urn:example:area:%d' % i, 'Area %d' % i)
+                area.westBoundLongitude, area.southBoundLatitude = west, south
+                area.eastBoundLongitude, area.northBoundLatitude = east, north
+                yield area
+
+        registry = Registry(loader=self.loader)
+        scanned = Registry(loader=self.loader)
+        spatial.dropRTree(scanned.engine)
+        for r in (registry, scanned):
+            r.engine.execute(update, rows)
+            r.bulkInsert(getAreas())
+        locations = [(random.uniform(-180, 180), random.uniform(-90, 90)) for i in xrange(100)]
+
+        def find(registry):
+            for lon, lat in locations:
+                registry.findByLocation(lon, lat, types=[schema.ProjectedCRS], profile='shallow')
+
+        def scan():
+            # the ORM query from the README
+            query = scanned.session.query(schema.ProjectedCRS).join(schema.ProjectedCRS.domainOfValidity)
+            for lon, lat in locations:
+                query.filter(schema.AreaOfUse.westBoundLongitude <= lon, schema.AreaOfUse.eastBoundLongitude >= lon,
+                             schema.AreaOfUse.southBoundLatitude <= lat, schema.AreaOfUse.northBoundLatitude >= lat).all()
+
+        self.assertEqual([value.identifier for value in registry.findByBBox(-180, -90, 180, 90)],
+                         [value.identifier for value in scanned.findByBBox(-180, -90, 180, 90)])
+        def query(registry):
+            # the spatial query alone
+            connection = registry.session.connection()
+            for lon, lat in locations:
+                spatial.find(connection, spatial.splitBBox(lon, lat, lon, lat), [schema.ProjectedCRS])
+
+        rtreeTime = timeit(lambda: find(registry))
+        tableTime = timeit(lambda: find(scanned))
+        scanTime = timeit(scan)
+        rtreeQueryTime = timeit(lambda: query(registry))
+        tableQueryTime = timeit(lambda: query(scanned))
+        report('Registry.findByLocation', areas=len(rows) + len(boxes), locations=len(locations), rtree=rtreeTime,
+               table=tableTime, orm=scanTime, speedup=scanTime / rtreeTime)
+        report('spatial.find', areas=len(rows) + len(boxes), locations=len(locations), rtree=rtreeQueryTime,
+               table=tableQueryTime, speedup=tableQueryTime / rtreeQueryTime)
+        self.assertLess(rtreeTime, scanTime)
+        self.assertLess(rtreeQueryTime, tableQueryTime)
+
+    def testSearch(self):
+        from epsg import schema, fulltext
+
+        registry = Registry(loader=self.loader)
+        queries = ['British National Grid', 'airy', 'geodesy', 'Comodoro Rivadavia', 'unknown']
+
+        def search():
+            for text in queries:
+                registry.search(text, limit=10)
+
+        def scan():
+            # the ilike query from the README
+            for text in queries:
+                registry.session.query(schema.DictionaryEntry).filter(
+                    schema.DictionaryEntry.name.ilike('%%%s%%' % text)).limit(10).all()
+
+        def query():
+            # the search query alone
+            connection = registry.session.connection()
+            for text in queries:
+                fulltext.find(connection, text, limit=10)
+
+        searchTime = timeit(search)
+        queryTime = timeit(query)
+        scanTime = timeit(scan)
+        report('Registry.search', objects=len(self.loader), queries=len(queries), search=searchTime,
+               query=queryTime, ilike=scanTime, speedup=scanTime / searchTime)
+        self.assertLess(queryTime, scanTime)
+
+    def testQueryPlans(self):
+        from test import explain
+        from epsg import schema
+
+        indexed = Registry(loader=self.loader)
+        unindexed = Registry(loader=self.loader)
+        for table in schema.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if [column for column in index.columns if column.foreign_keys or column.name in ('name', 'class')]:
+                    index.drop(unindexed.engine)
+
+        crs = self.loader['urn:ogc:def:crs:EPSG::4277']
+        # typical query shapes: reverse lookups of references, names
+        # and classes
+        queries = {
+            'baseGeodeticCRS': lambda session: session.query(schema.ProjectedCRS).filter(
+                schema.ProjectedCRS.baseGeodeticCRS == crs).all(),
+            'domainOfValidity': lambda session: session.query(schema.CoordinateReferenceSystem).filter(
+                schema.CoordinateReferenceSystem.domainOfValidity == crs.domainOfValidity).all(),
+            'ellipsoid': lambda session: session.query(schema.GeodeticDatum).filter(
+                schema.GeodeticDatum.ellipsoid == crs.geodeticDatum.ellipsoid).all(),
+            'axes': lambda session: session.query(schema.CoordinateSystem).filter(
+                schema.CoordinateSystem.axes.contains(crs.ellipsoidalCS.axes[0])).all(),
+            'componentReferenceSystems': lambda session: session.query(schema.CompoundCRS).filter(
+                schema.CompoundCRS.componentReferenceSystems.contains(crs)).all(),
+            'DictionaryEntry.name': lambda session: session.query(schema.DictionaryEntry).filter_by(name='OSGB 1936').all(),
+            'Identifier.class': lambda session: session.query(schema.Identifier).filter(
+                schema.Identifier._discriminator == 'CompoundCRS').all()
+            }
+
+        def execute(registry, statement, parameters):
+            # execute the SQL alone, without the ORM overhead
+            connection = registry.engine.raw_connection()
+            try:
+                for i in xrange(100):
+                    connection.cursor().execute(statement, parameters).fetchall()
+            finally:
+                connection.close()
+
+        results = {}
+        scans = []
+        for name, query in sorted(queries.items()):
+            statements = StatementRecorder(indexed.engine)
+            query(indexed.session)
+            statement, parameters = statements.statements[0], statements.parameters[0]
+            plan = explain(indexed.engine, statement, parameters)
+            if 'SCAN' in plan:
+                scans.append((name, plan))
+            self.assertIn('SCAN', explain(unindexed.engine, statement, parameters))
+
+            indexedTime = timeit(lambda: execute(indexed, statement, parameters))
+            unindexedTime = timeit(lambda: execute(unindexed, statement, parameters))
+            results[name] = '%.3fms/%.3fms' % (unindexedTime * 10, indexedTime * 10)
+
+        report('Query latency unindexed/indexed', **results)
+        self.assertEqual([], scans)
+
+    def testThreadedLookup(self):
+        import os, shutil, tempfile, threading
+
+        directory = tempfile.mkdtemp()
+        try:
+            url = 'sqlite:///%s' % os.path.join(directory, 'registry.sqlite')
+            registry = Registry(Registry.CreateEngine(url, threadSafe=True, pool_size=8),
+                                loader=self.loader, threadSafe=True)
+            keys = self.loader.keys()
+
+            errors = []
+            def lookup(keys):
+                try:
+                    session = registry.session
+                    for key in keys:
+                        session.expunge_all()
+                        registry[key].identifier
+                except Exception, e:
+                    errors.append(e)
+                finally:
+                    registry.session.remove()
+
+            results = {}
+            for count in (1, 2, 4, 8):
+                # the keys are shared between the threads
+                parts = [keys[i::count] for i in xrange(count)]
+                def run():
+                    threads = [threading.Thread(target=lookup, args=(part,)) for part in parts]
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    if errors:
+                        raise errors[0]
+                elapsed = timeit(run)
+                results['threads%d' % count] = '%d/s' % (len(keys) / elapsed)
+
+            report('Threaded Registry lookups', lookups=len(keys), **results)
+            registry.engine.dispose()
+        finally:
+            shutil.rmtree(directory)
+
+    def testAsyncLookup(self):
+        import os, shutil, tempfile, time
+        from epsg.asynchronous import AsyncRegistry
+
+        directory = tempfile.mkdtemp()
+        try:
+            url = 'sqlite:///%s' % os.path.join(directory, 'registry.sqlite')
+            registry = Registry(Registry.CreateEngine(url, threadSafe=True),
+                                loader=self.loader, threadSafe=True)
+            keys = [key for key in self.loader.keys() if ':crs:' in key]
+            asyncRegistry = AsyncRegistry(registry, workers=4)
+
+            def blocking():
+                # an event loop serving the lookups itself is stalled
+                # for as long as they take
+                start = time.time()
+                for key in keys:
+                    registry.getMany([key])
+                registry.session.remove()
+                return time.time() - start, time.time() - start
+
+            def nonBlocking():
+                # an event loop polling for the results ticks every
+                # millisecond: record the longest gap between ticks
+                start = last = time.time()
+                results = [asyncRegistry.getMany([key]) for key in keys]
+                stall = 0
+                while not all(result.ready() for result in results):
+                    time.sleep(0.001)
+                    now = time.time()
+                    stall = max(stall, now - last)
+                    last = now
+                for result in results:
+                    result.get()
+                return time.time() - start, stall
+
+            blockingTime, blockingStall = min(blocking() for i in xrange(3))
+            asyncTime, asyncStall = min(nonBlocking() for i in xrange(3))
+            asyncRegistry.close()
+            registry.engine.dispose()
+
+            report('AsyncRegistry concurrent lookups', lookups=len(keys),
+                   blocking=blockingTime, blockingStall=blockingStall,
+                   pooled=asyncTime, pooledStall=asyncStall)
+            self.assertLess(asyncStall, blockingStall)
+        finally:
+            shutil.rmtree(directory)
+
+    def testPublishedWorkers(self):
+        import os, shutil, tempfile, time, resource
+        if not hasattr(os, 'fork'):
+            self.skipTest('os.fork is not available')
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'registry.sqlite')
+            Registry.Publish(path, self.loader)
+            keys = [key for key in self.loader.keys() if ':crs:' in key]
+
+            def worker(create):
+                # report the startup time and memory growth of a
+                # forked worker looking up every CRS
+                read, write = os.pipe()
+                pid = os.fork()
+                if not pid:
+                    try:
+                        os.close(read)
+                        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                        start = time.time()
+                        registry = create()
+                        startup = time.time() - start
+                        for key in keys:
+                            registry[key].name
+                        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+                        os.write(write, '%f %d' % (startup, growth))
+                    finally:
+                        os._exit(0)
+                os.close(write)
+                result = os.read(read, 100)
+                os.close(read)
+                os.waitpid(pid, 0)
+                startup, growth = result.split()
+                return float(startup), int(growth)
+
+            memoryStartup, memoryGrowth = worker(lambda: Registry(loader=self.loader))
+            fileStartup, fileGrowth = worker(lambda: Registry.FromFile(path))
+            report('Published registry workers', lookups=len(keys),
+                   memoryStartup=memoryStartup, memoryRSSKiB=memoryGrowth,
+                   publishedStartup=fileStartup, publishedRSSKiB=fileGrowth)
+            self.assertLess(fileStartup, memoryStartup)
+        finally:
+            shutil.rmtree(directory)
+
+    def testStartup(self):
+        from epsg import schema
+
+        registry = Registry(loader=self.loader)
+        engine = registry.engine
+
+        def probe():
+            # the previous check for every table of the schema
+            connection = engine.connect()
+            try:
+                for table in schema.Base.metadata.tables.itervalues():
+                    table.exists(connection)
+            finally:
+                connection.close()
+
+        statements = StatementRecorder(engine)
+        registry.isInitialised()
+        queries = len(statements)
+
+        probeTime = timeit(lambda: [probe() for i in xrange(100)])
+        stampTime = timeit(lambda: [registry.isInitialised() for i in xrange(100)])
+        report('Registry.isInitialised x100', tables=len(schema.Base.metadata.tables), queries=queries,
+               probe=probeTime, stamp=stampTime, speedup=probeTime / stampTime)
+        self.assertEqual(1, queries)
+        self.assertLess(stampTime, probeTime)
+
+@skipUnlessBenchmark
+class TestSnapshotBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = load.XMLLoader(load.XML.FromString(getSyntheticGML()))
+        cls.loader.load()
+        cls.registry = Registry(loader=cls.loader)
+
+    def getOverhead(self, value):
+        """
+        Return the bytes used by an object excluding its attribute values
+        """
+        from sqlalchemy.orm.attributes import instance_state
+
+        size = sys.getsizeof(value)
+        if hasattr(value, '__dict__'):
+            size += sys.getsizeof(value.__dict__)
+            state = instance_state(value)
+            size += sys.getsizeof(state) + sys.getsizeof(state.committed_state)
+            if state.callables:
+                size += sys.getsizeof(state.callables)
+        return size
+
+    def testMemory(self):
+        values = list(self.registry.itervalues())
+        for value in values:
+            walk(value)
+        copy = self.registry.snapshot()
+
+        ormSize = sum(self.getOverhead(value) for value in values) / float(len(values))
+        snapshotSize = sum(self.getOverhead(value) for value in copy.itervalues()) / float(len(copy))
+        report('Registry.snapshot memory per object (bytes)', objects=len(values),
+               orm=ormSize, snapshot=snapshotSize, ratio=ormSize / snapshotSize)
+        self.assertLess(snapshotSize, ormSize)
+
+    def testLookup(self):
+        keys = [key for key in self.loader.keys() if ':crs:' in key]
+        cached = Registry(loader=self.loader, cacheSize=len(keys), profile='full')
+        copy = self.registry.snapshot()
+
+        def lookup(mapping):
+            for key in keys:
+                walk(mapping[key])
+
+        lookup(cached)              # warm the cache
+        registryTime = timeit(lambda: lookup(self.registry), 1)
+        cachedTime = timeit(lambda: lookup(cached))
+        snapshotTime = timeit(lambda: lookup(copy))
+        report('Registry.snapshot lookups', keys=len(keys), registry=registryTime,
+               cachedRegistry=cachedTime, snapshot=snapshotTime)
+        self.assertLess(snapshotTime, cachedTime)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+from epsg import Registry, cache, load, schema
+from test import unittest, getTestFile
+
+class TestLoaderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.LoaderCache(self.directory)
+
+        with open(getTestFile(), 'rb') as fh:
+            self.gml = fh.read()
+        self.loader = load.XMLLoader(load.XML.FromString(self.gml))
+        self.loader.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testMiss(self):
+        self.assertIsNone(self.cache.get(self.gml))
+
+    def testHit(self):
+        self.cache.set(self.gml, self.loader)
+        loader = self.cache.get(self.gml)
+        self.assertIsInstance(loader, load.Loader)
+        self.assertEqual('7.9.6', loader.version)
+        self.assertEqual(sorted(loader.keys()), sorted(self.loader.keys()))
+        for key, value in self.loader.items():
+            self.assertEqual(loader[key], value)
+
+        # shared references are preserved
+        crs = loader['urn:ogc:def:crs:EPSG::27700']
+        self.assertIs(crs.domainOfValidity, loader['urn:ogc:def:area:EPSG::1264'])
+
+    def testContentAddressed(self):
+        self.cache.set(self.gml, self.loader)
+        self.assertIsNone(self.cache.get(self.gml + ' '))
+
+    def testModelVersion(self):
+        self.cache.set(self.gml, self.loader)
+        version = schema.MODEL_VERSION
+        schema.MODEL_VERSION = version + 1
+        try:
+            self.assertIsNone(self.cache.get(self.gml))
+            self.cache.evict()
+            self.assertEqual(self.cache.entries(), [])
+        finally:
+            schema.MODEL_VERSION = version
+
+    def testEviction(self):
+        self.cache.set(self.gml, self.loader)
+        size = self.cache.entries()[0][1]
+
+        # only the most recently used entry fits
+        self.cache.maxSize = size + size / 2
+        os.utime(self.cache.entries()[0][2], (0, 0))
+        self.cache.set(self.gml + ' ', self.loader)
+        self.assertEqual(len(self.cache.entries()), 1)
+        self.assertIsNone(self.cache.get(self.gml))
+        self.assertIsNotNone(self.cache.get(self.gml + ' '))
+
+    def testCorruptEntry(self):
+        self.cache.set(self.gml, self.loader)
+        with open(self.cache.entries()[0][2], 'wb') as fh:
+            fh.write('corrupt')
+        self.assertIsNone(self.cache.get(self.gml))
+        self.assertEqual(self.cache.entries(), [])
+
+    def testUntrustedEntry(self):
+        self.cache.set(self.gml, self.loader)
+        path = self.cache.entries()[0][2]
+        os.chmod(path, 0666)
+        self.assertIsNone(self.cache.get(self.gml))
+        os.chmod(path, 0644)
+        self.assertIsNotNone(self.cache.get(self.gml))
+
+    def testRegistryGetLoader(self):
+        registry = Registry(loader=False)
+        loader = registry.getLoader(self.gml, cache=self.cache)
+        self.assertIsInstance(loader, load.XMLLoader)
+        self.assertEqual(len(self.cache.entries()), 1)
+
+        cached = registry.getLoader(self.gml, cache=self.cache)
+        self.assertNotIsInstance(cached, load.XMLLoader)
+        registry.init(cached)
+        self.assertEqual(len(registry), len(loader))
+
+class TestLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = cache.LRUCache(2)
+
+    def testGet(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache['a'] = 1
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual(1, self.cache['a'])
+        with self.assertRaises(KeyError):
+            self.cache['b']
+        self.assertEqual((2, 2), (self.cache.hits, self.cache.misses))
+
+    def testEviction(self):
+        self.cache['a'] = 1
+        self.cache['b'] = 2
+        self.cache['a']     # `b` is now the least recently used
+        self.cache['c'] = 3
+        self.assertEqual(2, len(self.cache))
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertIn('c', self.cache)
+
+        # replacing an item does not evict another
+        self.cache['c'] = 4
+        self.assertEqual(4, self.cache['c'])
+        self.assertIn('a', self.cache)
+
+    def testTTL(self):
+        now = [0]
+        self.cache = cache.LRUCache(2, ttl=10)
+        self.cache.timer = lambda: now[0]
+        self.cache['a'] = 1
+        now[0] = 9
+        self.assertEqual(1, self.cache['a'])
+        now[0] = 10
+        self.assertNotIn('a', self.cache)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(0, len(self.cache))
+
+    def testDelete(self):
+        self.cache['a'] = 1
+        del self.cache['a']
+        self.assertNotIn('a', self.cache)
+        self.cache['b'] = 2
+        self.cache.clear()
+        self.assertEqual(0, len(self.cache))
+
+    def testInvalidSize(self):
+        with self.assertRaises(ValueError):
+            cache.LRUCache(0)
+
+class TestThreadLocalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = cache.ThreadLocalCache(2)
+
+    def inThread(self, func):
+        """
+        Return the result of calling a function in another thread
+        """
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def testThreads(self):
+        self.cache['a'] = 1
+        self.assertEqual(1, self.cache['a'])
+        self.assertIsNone(self.inThread(lambda: self.cache.get('a')))
+        self.inThread(lambda: self.cache.__setitem__('a', 2))
+        self.assertEqual(1, self.cache['a'])
+        self.assertEqual((2, 0), (self.cache.hits, self.cache.misses))
+
+    def testClear(self):
+        filled, cleared = threading.Event(), threading.Event()
+        sizes = []
+        def worker():
+            self.cache['b'] = 2
+            filled.set()
+            cleared.wait()
+            sizes.append(len(self.cache))
+        thread = threading.Thread(target=worker)
+        thread.start()
+        filled.wait()
+
+        # clearing the cache in one thread clears it in every thread
+        self.cache['a'] = 1
+        self.cache.clear()
+        self.assertNotIn('a', self.cache)
+        cleared.set()
+        thread.join()
+        self.assertEqual([0], sizes)
+
+    def testInvalidSize(self):
+        with self.assertRaises(ValueError):
+            cache.ThreadLocalCache(0)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+from epsg import Registry, schema, fulltext
+from test import unittest, LoaderTestCase, SchemaBuilder
+
+class TestFullText(LoaderTestCase):
+
+    def setUp(self):
+        self.registry = Registry(loader=self.loader)
+        self.connection = self.registry.engine.connect()
+        if not fulltext.supportsFTS(self.connection):
+            self.skipTest('FTS5 full text indexes are not supported')
+
+    def tearDown(self):
+        self.connection.close()
+
+    def getIndexed(self, key):
+        query = 'SELECT name, remarks, scope, description FROM "%s" WHERE rowid = ' \
+            '(SELECT rowid FROM "DictionaryEntry" WHERE identifier = ?)' % fulltext.FTS_TABLE
+        return [tuple(row) for row in self.connection.execute(query, (key,))]
+
+    def testGetTerms(self):
+        self.assertEqual([u'OSGB', u'1936', u'British'], fulltext.getTerms('OSGB 1936 / "British'))
+        self.assertEqual([u'Caf\xe9'], fulltext.getTerms(u'Caf\xe9'))
+        self.assertEqual([], fulltext.getTerms(' % '))
+        with self.assertRaises(TypeError):
+            fulltext.getTerms(None)
+
+    def testCreateIndex(self):
+        self.assertTrue(fulltext.hasIndex(self.connection))
+        # every object other than the axes is a dictionary entry
+        self.assertEqual(len(self.registry) - 10, self.connection.execute(
+                'SELECT count(*) FROM "%s"' % fulltext.FTS_TABLE).scalar())
+        self.assertEqual([(u'OSGB 1936 / British National Grid', None,
+                           u'Large and medium scale topographic mapping and engineering survey.', None)],
+                         self.getIndexed('urn:ogc:def:crs:EPSG::27700'))
+
+        # an index added to an existing database is populated
+        fulltext.dropIndex(self.connection)
+        self.assertFalse(fulltext.hasIndex(self.connection))
+        fulltext.createIndex(self.connection)
+        self.assertEqual(1, len(self.getIndexed('urn:ogc:def:crs:EPSG::27700')))
+
+        schema.Base.metadata.drop_all(self.connection)
+        self.assertFalse(fulltext.hasIndex(self.connection))
+
+    def testMaintainIndex(self):
+        area = self.registry['urn:ogc:def:area:EPSG::1264']
+        area.name = 'Changed'
+        area.description = 'Changed description.'
+        self.registry.session.flush()
+        self.assertEqual([(u'Changed', None, None, u'Changed description.')],
+                         self.getIndexed('urn:ogc:def:area:EPSG::1264'))
+
+        crs = SchemaBuilder().buildProjectedCRS()
+        crs.scope = 'Changed scope.'
+        self.registry.upsertMany({crs.identifier: crs})
+        self.assertEqual(u'Changed scope.', self.getIndexed(crs.identifier)[0][2])
+
+        del self.registry[crs.identifier]
+        self.assertEqual([], self.getIndexed(crs.identifier))
+
+    def testFind(self):
+        self.assertEqual(['urn:ogc:def:crs:EPSG::27700'], fulltext.find(self.connection, 'british national grid'))
+        self.assertEqual(['urn:ogc:def:ellipsoid:EPSG::7001'], fulltext.find(self.connection, 'Airy'))
+
+        # names are ranked above other text
+        self.assertEqual('urn:ogc:def:crs:EPSG::27700', fulltext.find(self.connection, 'Brit')[0])
+        self.assertEqual(['urn:ogc:def:crs:EPSG::4277', 'urn:ogc:def:crs:EPSG::27700'],
+                         fulltext.find(self.connection, 'OSGB', [schema.CoordinateReferenceSystem]))
+        self.assertEqual(['urn:ogc:def:crs:EPSG::4277'],
+                         fulltext.find(self.connection, 'OSGB', [schema.CoordinateReferenceSystem], 1))
+
+        self.assertEqual([], fulltext.find(self.connection, ' % '))
+        self.assertEqual([], fulltext.find(self.connection, 'OSGB', []))
+        with self.assertRaises(ValueError):
+            fulltext.find(self.connection, 'OSGB', [schema.Identifier])
+
+    def testFindScanned(self):
+        # the index and a scan of the tables match the same objects
+        for text in ('british national grid', 'Airy', 'geodesy', 'OSGB 1936', 'onshore'):
+            terms = fulltext.getTerms(text)
+            self.assertEqual(sorted(fulltext.findIndexed(self.connection, terms)),
+                             sorted(fulltext.findScanned(self.connection, terms)))
+
+        # results are ordered by name
+        self.assertEqual(['urn:ogc:def:crs:EPSG::4277', 'urn:ogc:def:crs:EPSG::27700'],
+                         fulltext.findScanned(self.connection, ['OSGB'], ['GeodeticCRS', 'ProjectedCRS']))
+        self.assertEqual([], fulltext.findScanned(self.connection, ['%']))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
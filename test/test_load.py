@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import os
 from epsg import load, schema
 from test import unittest, getTestFile
 
@@ -16,17 +17,163 @@ class TestXML(unittest.TestCase):
     def testContains(self):
         self.assertTrue('urn:ogc:def:datum:EPSG::6277' in self.xml)
 
+    def testNamespaces(self):
+        self.assertEqual(self.xml.ns['gml'], 'http://www.opengis.net/gml')
+        self.assertEqual(self.xml.ns['gmd'], 'http://www.isotc211.org/2005/gmd')
+
+    def testGetNamespaces(self):
+        self.assertEqual(self.xml.getNamespaces(), self.xml.ns)
+
+    def testCreateMapping(self):
+        mapping = self.xml.createMapping()
+        self.assertEqual(sorted(mapping.keys()), sorted(self.xml.keys()))
+        self.assertEqual(mapping['urn:ogc:def:datum:EPSG::6277'].localName, 'GeodeticDatum')
+
+    def testStats(self):
+        stats = self.xml.stats
+        self.assertEqual(sum(stats.values()), 46)
+        self.assertEqual(stats['AreaOfUse'], 5)
+        self.assertEqual(stats['CoordinateSystemAxis'], 10)
+        self.assertEqual(stats['ProjectedCRS'], 1)
+
+    def testDatasetVersion(self):
+        self.assertEqual('release-7.9.6', self.xml.identifier)
+        self.assertEqual('7.9.6', load.getDatasetVersion(self.xml))
+        self.assertIsNone(load.getDatasetVersion({}))
+
     def testGetItem(self):
         from xml.dom.minidom import Element
         value = self.xml['urn:ogc:def:datum:EPSG::6277']
         self.assertIsInstance(value, Element)
 
+class TestStreamingXML(TestXML):
+
+    def setUp(self):
+        self.xml = load.StreamingXML.FromFile(getTestFile())
+
+    def testChunks(self):
+        # entries spanning many small chunks should be indexed intact
+        with open(getTestFile(), 'rb') as fh:
+            gml = fh.read()
+        chunks = [gml[i:i+100] for i in xrange(0, len(gml), 100)]
+        xml = load.StreamingXML(chunks)
+        self.assertEqual(sorted(xml.keys()), sorted(self.xml.keys()))
+
+        value = xml['urn:ogc:def:axis:EPSG::106']
+        self.assertEqual(value.localName, 'CoordinateSystemAxis')
+
+    def testEntries(self):
+        # only the position of the entries in the file is retained
+        for entry in self.xml.entries:
+            self.assertIsInstance(entry, tuple)
+        self.assertEqual(self.xml['urn:ogc:def:axis:EPSG::106'].localName, 'CoordinateSystemAxis')
+
+    def testUnqualifiedElements(self):
+        gml = '''<?xml version="1.0" encoding="UTF-8"?>
+<Dictionary xmlns:gml="http://www.opengis.net/gml">
+  <gml:identifier>release-1.0</gml:identifier>
+  <note>not in a namespace</note>
+  <gml:dictionaryEntry>
+    <gml:AreaOfUse><gml:identifier>urn:ogc:def:area:EPSG::1</gml:identifier><note/></gml:AreaOfUse>
+  </gml:dictionaryEntry>
+</Dictionary>'''
+        xml = load.StreamingXML.FromString(gml)
+        self.assertEqual(xml.identifier, 'release-1.0')
+        self.assertEqual(xml['urn:ogc:def:area:EPSG::1'].localName, 'AreaOfUse')
+
+class IndexedXMLMixin(object):
+    """
+    Creates an `IndexedXML` object from a temporary copy of the test data
+    """
+
+    def createIndexedXML(self):
+        import shutil, tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'test.xml')
+        shutil.copy(getTestFile(), self.path)
+        return load.IndexedXML.FromFile(self.path)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+class TestIndexedXML(IndexedXMLMixin, TestXML):
+
+    def setUp(self):
+        self.xml = self.createIndexedXML()
+
+    def testPersistentIndex(self):
+        # the index is only saved when asked to
+        self.assertEqual(os.listdir(self.tmpdir), ['test.xml'])
+
+        indexPath = os.path.join(self.tmpdir, 'test.idx')
+        load.IndexedXML.FromFile(self.path, indexPath)
+        self.assertTrue(os.path.exists(indexPath))
+
+        xml = load.IndexedXML.FromFile(self.path, indexPath)
+        self.assertEqual(xml.map, self.xml.map)
+        self.assertEqual(xml.entries, self.xml.entries)
+
+        # a stale index is rebuilt
+        with open(self.path, 'ab') as fh:
+            fh.write('\n')
+        os.utime(self.path, (0, 0))
+        xml = load.IndexedXML.FromFile(self.path, indexPath)
+        self.assertEqual(sorted(xml.keys()), sorted(self.xml.keys()))
+        self.assertEqual(xml['urn:ogc:def:datum:EPSG::6277'].localName, 'GeodeticDatum')
+
+    def testFromString(self):
+        self.assertRaises(TypeError, load.IndexedXML.FromString, '<Dictionary/>')
+
+    def testLazyLoading(self):
+        parsed = []
+        getEntry = self.xml.getEntry
+        def countingGetEntry(index):
+            parsed.append(index)
+            return getEntry(index)
+        self.xml.getEntry = countingGetEntry
+
+        loader = load.XMLLoader(self.xml)
+        obj = loader['urn:ogc:def:crs:EPSG::27700']
+        self.assertIsInstance(obj, schema.ProjectedCRS)
+        self.assertTrue(0 < len(parsed) < len(self.xml))
+
+class TestElementRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.xml = load.XML.FromFile(getTestFile())
+        element = self.xml['urn:ogc:def:cs:EPSG::6422']
+        self.record = load.ElementRecord(element, self.xml.ns)
+
+    def testLocalName(self):
+        self.assertEqual(self.record.localName, 'EllipsoidalCS')
+
+    def testGetElements(self):
+        self.assertEqual(len(self.record.getElements('axis')), 2)
+        self.assertEqual(self.record.getElements('missing'), [])
+
+    def testGetText(self):
+        # the first identifier is that of the element, not of its axes
+        self.assertEqual(self.record.getText('identifier'), 'urn:ogc:def:cs:EPSG::6422')
+        self.assertEqual(self.record.getText('type', 'epsg'), 'ellipsoidal')
+        self.assertIsNone(self.record.getText('missing'))
+
+    def testGetAttributeValue(self):
+        value = self.record.getAttributeValue('descriptionReference', 'xlink:href')
+        self.assertEqual(value, 'urn:ogc:def:axis-name:EPSG::9901')
+        self.assertIsNone(self.record.getAttributeValue('descriptionReference', 'missing'))
+        self.assertIsNone(self.record.getAttributeValue('missing', 'xlink:href'))
+
 class TestXMLLoader(unittest.TestCase):
 
     def setUp(self):
         xml = load.XML.FromFile(getTestFile())
         self.loader = load.XMLLoader(xml)
 
+    def testVersion(self):
+        self.assertEqual('7.9.6', self.loader.version)
+        self.assertIsNone(load.Loader().version)
+
     def testPrimeMeridian(self):
         obj = self.loader['urn:ogc:def:meridian:EPSG::8901']
         self.assertIsInstance(obj, schema.PrimeMeridian)
@@ -118,5 +265,72 @@ class TestXMLLoader(unittest.TestCase):
         self.assertEqual(len(self.loader.keys()), expected_length)
         self.assertEqual(len(self.loader.values()), expected_length)
 
+    def testUnloadable(self):
+        self.loader.load()
+        # the dictionary itself has no corresponding schema object
+        self.assertIn('release-7.9.6', self.loader.unloadable)
+        with self.assertRaises(KeyError):
+            self.loader['release-7.9.6']
+        with self.assertRaises(KeyError):
+            self.loader['urn:ogc:def:crs:EPSG::0']
+
+    def testResolve(self):
+        created = self.loader.resolve('urn:ogc:def:crs:EPSG::27700')
+        self.assertEqual(created[-1], 'urn:ogc:def:crs:EPSG::27700')
+        self.assertEqual(len(created), len(set(created)))
+
+        # references are created before the objects referring to them
+        position = dict((key, i) for i, key in enumerate(created))
+        for key in created:
+            for dependency in self.loader.dependencies[key]:
+                self.assertLess(position[dependency], position[key])
+
+        # resolving again creates nothing
+        self.assertEqual(self.loader.resolve('urn:ogc:def:crs:EPSG::27700'), [])
+
+    def testCyclicReference(self):
+        with open(getTestFile(), 'rb') as fh:
+            gml = fh.read()
+        # make the datum of urn:ogc:def:crs:EPSG::4277 refer back to it
+        gml = gml.replace('<ellipsoid xlink:href="urn:ogc:def:ellipsoid:EPSG::7001"/>',
+                          '<ellipsoid xlink:href="urn:ogc:def:crs:EPSG::4277"/>')
+        loader = load.XMLLoader(load.XML.FromString(gml))
+        with self.assertRaises(ValueError):
+            loader['urn:ogc:def:crs:EPSG::4277']
+
+    def testGetLevels(self):
+        self.loader.load()
+        levels = self.loader.getLevels()
+        self.assertEqual(sum(len(level) for level in levels), len(self.loader))
+
+        depth = {}
+        for i, level in enumerate(levels):
+            for key in level:
+                depth[key] = i
+        for key in self.loader:
+            for dependency in self.loader.dependencies[key]:
+                if dependency in self.loader:
+                    self.assertLess(depth[dependency], depth[key])
+
+class TestStreamingXMLLoader(TestXMLLoader):
+
+    def setUp(self):
+        xml = load.StreamingXML.FromFile(getTestFile())
+        self.loader = load.XMLLoader(xml)
+
+    def testEquivalence(self):
+        # the objects should be the same as those loaded from the DOM
+        loader = load.XMLLoader(load.XML.FromFile(getTestFile()))
+        loader.load()
+        self.loader.load()
+        self.assertEqual(sorted(self.loader.keys()), sorted(loader.keys()))
+        for key, value in loader.items():
+            self.assertEqual(self.loader[key], value)
+
+class TestIndexedXMLLoader(IndexedXMLMixin, TestStreamingXMLLoader):
+
+    def setUp(self):
+        self.loader = load.XMLLoader(self.createIndexedXML())
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+from sqlalchemy.exc import OperationalError
+from epsg import Registry, published
+from test import unittest, LoaderTestCase
+
+class TestPublishedRegistry(LoaderTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'registry.sqlite')
+        Registry.Publish(self.path, self.loader)
+        self.registry = Registry.FromFile(self.path)
+
+    def tearDown(self):
+        self.registry.session.close()
+        self.registry.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def testPublish(self):
+        self.assertEqual(sorted(self.loader.keys()), sorted(self.registry))
+        self.assertEqual(u'OSGB 1936 / British National Grid', self.registry['EPSG:27700'].name)
+
+        # readers create no journal or WAL files alongside the registry
+        self.assertEqual(['registry.sqlite'], os.listdir(self.directory))
+
+        connection = self.registry.engine.connect()
+        try:
+            self.assertEqual('delete', connection.execute('PRAGMA journal_mode').scalar())
+            self.assertEqual(1, connection.execute('PRAGMA query_only').scalar())
+        finally:
+            connection.close()
+
+    def testReadOnly(self):
+        self.assertTrue(self.registry.readOnly)
+        with self.assertRaises(ValueError):
+            self.registry.init(self.loader)
+        with self.assertRaises(OperationalError):
+            del self.registry['urn:ogc:def:crs:EPSG::27700']
+        self.registry.session.expunge_all()
+        self.assertIn('urn:ogc:def:crs:EPSG::27700', self.registry)
+
+    def testUninitialised(self):
+        with self.assertRaises(IOError):
+            Registry.FromFile(os.path.join(self.directory, 'missing.sqlite'))
+
+        path = os.path.join(self.directory, 'empty.sqlite')
+        open(path, 'wb').close()
+        with self.assertRaises(ValueError):
+            Registry.FromFile(path)
+        with self.assertRaises(ValueError):
+            Registry(Registry.CreateEngine('sqlite:///%s' % path), self.loader, readOnly=True)
+
+    def testThreadSafe(self):
+        from sqlalchemy.pool import QueuePool
+
+        registry = Registry.FromFile(self.path, threadSafe=True)
+        self.assertIsInstance(registry.engine.pool, QueuePool)
+        self.assertIn('EPSG:27700', registry)
+        registry.engine.dispose()
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'os.fork is not available')
+    def testFork(self):
+        key = 'urn:ogc:def:crs:EPSG::27700'
+        self.assertIn(key, self.registry)  # open a pooled connection
+
+        pid = os.fork()
+        if not pid:
+            # the child looks up objects using its own connection
+            status = 1
+            try:
+                self.registry.session.expunge_all()
+                if self.registry[key].name == u'OSGB 1936 / British National Grid':
+                    status = 0
+            finally:
+                os._exit(status)
+
+        self.assertEqual(0, os.waitpid(pid, 0)[1])
+        self.assertIn(key, self.registry)
+
+class TestProcessCheck(unittest.TestCase):
+
+    def testCheckProcess(self):
+        from sqlalchemy.exc import DisconnectionError
+
+        class Record(object):
+            def __init__(self):
+                self.info = {}
+                self.connection = object()
+
+        record, proxy = Record(), Record()
+        published.setProcess(record.connection, record)
+        published.checkProcess(record.connection, record, proxy)
+        self.assertIsNotNone(record.connection)
+
+        record.info['pid'] = -1
+        with self.assertRaises(DisconnectionError):
+            published.checkProcess(record.connection, record, proxy)
+        self.assertIsNone(record.connection)
+        self.assertIsNone(proxy.connection)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
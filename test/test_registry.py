@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
-from epsg import Registry, schema, load
-from test import unittest, getTestFile, SchemaBuilder
+import os
+import shutil
+import tempfile
+import threading
+from epsg import Registry, schema, load, bulk, spatial, fulltext
+from test import unittest, LoaderTestCase, getTestFile, SchemaBuilder, StatementRecorder, walk, explain
 
 class TestRegistryInit(unittest.TestCase):
 
@@ -28,6 +32,79 @@ class TestRegistryInit(unittest.TestCase):
         # check the loading of children is working
         self.assertIsInstance(geodetic_datum.domainOfValidity, schema.AreaOfUse)
 
+    def testInitObjects(self):
+        self.registry.init(self.loader)
+        for key, value in self.loader.items():
+            self.assertEqual(value, self.registry[key])
+
+        # the order of collections is preserved
+        cs = self.registry['urn:ogc:def:cs:EPSG::6404']
+        self.assertEqual([axis.identifier for axis in cs.axes],
+                         [axis.identifier for axis in self.loader['urn:ogc:def:cs:EPSG::6404'].axes])
+
+    def testInitFromRegistry(self):
+        self.registry.init(self.loader)
+        registry = Registry(loader=self.registry)
+        self.assertEqual(len(registry), len(self.registry))
+
+    def testBulkInsert(self):
+        # referenced objects are inserted along with the values
+        self.registry.bulkInsert([self.loader['urn:ogc:def:crs:EPSG::27700']])
+        crs = self.registry['urn:ogc:def:crs:EPSG::27700']
+        self.assertEqual(crs, self.loader['urn:ogc:def:crs:EPSG::27700'])
+        self.assertIn('urn:ogc:def:ellipsoid:EPSG::7001', self.registry)
+        self.assertNotIn('urn:ogc:def:crs:EPSG::3855', self.registry)
+
+class TestRegistryMetadata(LoaderTestCase):
+
+    def setUp(self):
+        self.registry = Registry(loader=self.loader)
+
+    def setSchemaVersion(self, version):
+        table = schema.metadata_table
+        self.registry.engine.execute(table.update().values(schemaVersion=version))
+
+    def testMetadata(self):
+        from datetime import datetime
+
+        metadata = self.registry.getMetadata()
+        self.assertEqual(schema.MODEL_VERSION, metadata['schemaVersion'])
+        self.assertEqual('7.9.6', metadata['datasetVersion'])
+        self.assertIsInstance(metadata['loaded'], datetime)
+        self.assertEqual(bulk.getDigest(bulk.getObjects(self.loader.values())), metadata['contentHash'])
+
+        # the hash does not depend on the order of the objects
+        values = self.loader.values()
+        self.assertEqual(bulk.getDigest(bulk.getObjects(values)),
+                         bulk.getDigest(bulk.getObjects(reversed(values))))
+
+        # the hash depends on the content
+        self.registry.init(False)
+        metadata = self.registry.getMetadata()
+        self.assertIsNone(metadata['datasetVersion'])
+        self.assertNotEqual(bulk.getDigest(bulk.getObjects(self.loader.values())), metadata['contentHash'])
+
+    def testIsInitialised(self):
+        # startup checks the registry using a single query
+        statements = StatementRecorder(self.registry.engine)
+        self.assertTrue(self.registry.isInitialised())
+        self.assertEqual(1, len(statements))
+
+        schema.metadata_table.drop(self.registry.engine)
+        self.assertIsNone(self.registry.getMetadata())
+        self.assertFalse(self.registry.isInitialised())
+
+    def testOutdatedSchema(self):
+        registry = Registry(self.registry.engine, loader=False)
+        self.assertEqual(len(self.loader), len(registry))
+
+        # a registry built by another model version is rebuilt
+        self.setSchemaVersion(schema.MODEL_VERSION - 1)
+        self.assertFalse(self.registry.isInitialised())
+        registry = Registry(self.registry.engine, loader=False)
+        self.assertEqual(0, len(registry))
+        self.assertEqual(schema.MODEL_VERSION, registry.getMetadata()['schemaVersion'])
+
 class TestRegistry(unittest.TestCase):
 
     def setUp(self):
@@ -41,6 +118,9 @@ class TestRegistry(unittest.TestCase):
         self.assertIsInstance(value, schema.ProjectedCRS)
 
         with self.assertRaises(TypeError):
+            self.registry[4.2]
+
+        with self.assertRaises(KeyError):
             self.registry[42]
 
         with self.assertRaises(KeyError):
@@ -52,9 +132,59 @@ class TestRegistry(unittest.TestCase):
         value = builder.buildAreaOfUse()
         value.identifier = key  # replace the id with one not in the test database
 
+        statements = StatementRecorder(self.registry.engine)
         self.registry[key] = value
         self.assertEqual(value, self.registry[key])
 
+        # the classes of existing objects are only looked up when the
+        # counts are maintained
+        self.assertFalse([statement for statement in statements.statements if ' IN (' in statement])
+
+    def testGetMany(self):
+        keys = ['urn:ogc:def:crs:EPSG::27700', 'bad key', 'urn:ogc:def:area:EPSG::1264', 'urn:ogc:def:crs:EPSG::27700']
+        values = self.registry.getMany(keys)
+        self.assertEqual([keys[0], keys[2], keys[0]], [value.identifier for value in values])
+        self.assertIsInstance(values[0], schema.ProjectedCRS)
+        self.assertIs(values[0], values[2])
+
+        values = self.registry.getMany(keys, missing=None)
+        self.assertEqual(4, len(values))
+        self.assertIsNone(values[1])
+
+        with self.assertRaises(KeyError):
+            self.registry.getMany(keys, missing='raise')
+        with self.assertRaises(ValueError):
+            self.registry.getMany(keys, missing='ignore')
+        with self.assertRaises(TypeError):
+            self.registry.getMany([None])
+
+        self.assertEqual([], self.registry.getMany([]))
+
+    def testGetManyEagerLoading(self):
+        from sqlalchemy.orm import object_mapper
+
+        statements = StatementRecorder(self.registry.engine)
+        keys = ['urn:ogc:def:crs:EPSG::27700', 'urn:ogc:def:crs:EPSG::7423', 'urn:ogc:def:crs:EPSG::5800']
+        values = self.registry.getMany(keys)
+        count = len(statements)
+
+        # walking the object graph does not query the database
+        visited = set()
+        for value in values:
+            walk(value, visited)
+        self.assertEqual(count, len(statements))
+
+        # one query per level of references, plus the association tables
+        self.assertLess(count, 15)
+
+        # the objects are identical to those loaded individually
+        registry = Registry(loader=self.registry)
+        for key in visited:
+            self.assertEqual(registry[key], self.registry[key])
+        cs = self.registry['urn:ogc:def:cs:EPSG::4400']
+        self.assertEqual([axis.identifier for axis in cs.axes],
+                         [axis.identifier for axis in registry['urn:ogc:def:cs:EPSG::4400'].axes])
+
     def testDelItem(self):
         del self.registry['urn:ogc:def:crs:EPSG::27700']
         with self.assertRaises(KeyError):
@@ -63,6 +193,155 @@ class TestRegistry(unittest.TestCase):
     def testLen(self):
         self.assertEqual(45, len(self.registry))
 
+    def testNormalisedKeys(self):
+        crs = self.registry['urn:ogc:def:crs:EPSG::27700']
+        for key in ('urn:ogc:def:crs:EPSG:6.3:27700', 'http://www.opengis.net/def/crs/EPSG/0/27700',
+                    'EPSG:27700', '27700', 27700):
+            self.assertIs(crs, self.registry[key])
+            self.assertIn(key, self.registry)
+
+        self.assertIsInstance(self.registry['EPSG:1264'], schema.AreaOfUse)
+        self.assertNotIn(4.2, self.registry)
+        self.assertNotIn('EPSG:99999', self.registry)
+        with self.assertRaises(KeyError) as context:
+            self.registry['EPSG:99999']
+        self.assertEqual('EPSG:99999', context.exception.args[0])
+
+        values = self.registry.getMany([27700, 'EPSG:99999', 'EPSG:1264'], missing=None)
+        self.assertEqual([crs.identifier, None, 'urn:ogc:def:area:EPSG::1264'],
+                         [value and value.identifier for value in values])
+
+    def testPaddedCode(self):
+        # codes are resolved from the stored identifiers as written
+        value = SchemaBuilder().buildAreaOfUse()
+        value.identifier = 'urn:ogc:def:area:EPSG::0001'
+        self.registry[value.identifier] = value
+        self.assertEqual(value.identifier, self.registry[1].identifier)
+        self.assertEqual(value.identifier, self.registry['EPSG:1'].identifier)
+        self.assertIn(1, self.registry)
+
+    def testMixedCaseKeys(self):
+        # identifiers are matched exactly, whatever the case of their
+        # object type
+        value = SchemaBuilder().buildAreaOfUse()
+        value.identifier = 'urn:ogc:def:Area:EPSG::1'
+        self.registry[value.identifier] = value
+        self.assertIn(value.identifier, list(self.registry))
+        self.assertIn(value.identifier, self.registry)
+        self.assertEqual(value.identifier, self.registry[value.identifier].identifier)
+        self.assertEqual(value.identifier, self.registry['URN:OGC:DEF:Area:EPSG::1'].identifier)
+        self.assertNotIn('urn:ogc:def:area:EPSG::1', self.registry)
+
+    def testAmbiguousCode(self):
+        value = SchemaBuilder().buildAreaOfUse()
+        value.identifier = 'urn:ogc:def:area:EPSG::27700'
+        self.registry[value.identifier] = value
+
+        # coordinate reference systems are preferred
+        self.assertIsInstance(self.registry[27700], schema.ProjectedCRS)
+        del self.registry['urn:ogc:def:crs:EPSG::27700']
+        self.assertIsInstance(self.registry[27700], schema.AreaOfUse)
+
+    def testGetRange(self):
+        values = self.registry.getRange('crs', 4000, 6000)
+        self.assertEqual(['urn:ogc:def:crs:EPSG::4258', 'urn:ogc:def:crs:EPSG::4277',
+                          'urn:ogc:def:crs:EPSG::5621', 'urn:ogc:def:crs:EPSG::5800'],
+                         [value.identifier for value in values])
+        self.assertEqual(('crs', 4258), (values[0].objectType, values[0].code))
+        self.assertEqual([], self.registry.getRange('ellipsoid', 4000, 6000))
+        self.assertEqual([], self.registry.getRange('crs', 6000, 4000))
+
+        # the codes are scanned using an index
+        statements = StatementRecorder(self.registry.engine)
+        self.registry.getRange('crs', 32601, 32660)
+        plan = explain(self.registry.engine, statements.statements[0], statements.parameters[0])
+        self.assertIn('USING INDEX ix_Identifier_objectType_code', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def testFindByLocation(self):
+        values = self.registry.findByLocation(-1.5, 52.5, types=[schema.ProjectedCRS, schema.GeodeticDatum])
+        self.assertEqual(['urn:ogc:def:crs:EPSG::27700', 'urn:ogc:def:datum:EPSG::6258',
+                          'urn:ogc:def:datum:EPSG::6277'],
+                         [value.identifier for value in values])
+        self.assertIsInstance(values[0], schema.ProjectedCRS)
+
+        # only the world wide objects cover the south pole
+        self.assertEqual(['urn:ogc:def:crs:EPSG::3855', 'urn:ogc:def:datum:EPSG::1027'],
+                         [value.identifier for value in self.registry.findByLocation(0, -90)])
+
+        # locations on the bounds are included
+        values = self.registry.findByLocation(1.83, 60.89, types=[schema.ProjectedCRS])
+        self.assertEqual(['urn:ogc:def:crs:EPSG::27700'], [value.identifier for value in values])
+
+    def testFindByBBox(self):
+        # the bounding box crosses the antimeridian
+        values = self.registry.findByBBox(170, -50, -60, -40, types=[schema.CoordinateReferenceSystem])
+        self.assertEqual(['urn:ogc:def:crs:EPSG::3855', 'urn:ogc:def:crs:EPSG::5800'],
+                         [value.identifier for value in values])
+        values = self.registry.findByBBox(170, -50, -70, -40, types=[schema.CoordinateReferenceSystem])
+        self.assertEqual(['urn:ogc:def:crs:EPSG::3855'], [value.identifier for value in values])
+
+        # as does an area of use
+        area = self.registry['urn:ogc:def:area:EPSG::1265']
+        area.westBoundLongitude, area.eastBoundLongitude = 170, -170
+        for box in [(175, -46, 175, -46), (-175, -46, -175, -46), (160, -50, -175, -40)]:
+            values = self.registry.findByBBox(*box, types=[schema.EngineeringCRS])
+            self.assertEqual(['urn:ogc:def:crs:EPSG::5800'], [value.identifier for value in values])
+        self.assertEqual([], self.registry.findByLocation(-68, -46, types=[schema.EngineeringCRS]))
+
+        with self.assertRaises(ValueError):
+            self.registry.findByBBox(10, 60, -10, 40)
+        with self.assertRaises(ValueError):
+            self.registry.findByLocation(0, 0, types=[schema.AreaOfUse])
+
+    def testFindByBBoxWithoutRTree(self):
+        expected = [value.identifier for value in self.registry.findByBBox(-10, 40, 10, 60)]
+        spatial.dropRTree(self.registry.engine)
+        self.assertEqual(expected, [value.identifier for value in self.registry.findByBBox(-10, 40, 10, 60)])
+
+    def testSearch(self):
+        values = self.registry.search('OSGB', types=[schema.CoordinateReferenceSystem])
+        self.assertEqual(['urn:ogc:def:crs:EPSG::4277', 'urn:ogc:def:crs:EPSG::27700'],
+                         [value.identifier for value in values])
+        self.assertIsInstance(values[1], schema.ProjectedCRS)
+        self.assertEqual(['urn:ogc:def:ellipsoid:EPSG::7001'],
+                         [value.identifier for value in self.registry.search('airy', limit=1)])
+        self.assertEqual([], self.registry.search('unknown'))
+
+        # changes are searchable
+        self.registry['urn:ogc:def:ellipsoid:EPSG::7001'].name = 'Changed'
+        self.assertEqual([], self.registry.search('airy'))
+        self.assertEqual(1, len(self.registry.search('changed')))
+
+    def testSearchProfile(self):
+        # without a profile the results are loaded in a single query,
+        # after checking for the index and searching it
+        statements = StatementRecorder(self.registry.engine)
+        values = self.registry.search('OSGB')
+        self.assertEqual(3, len(statements))
+        self.assertTrue(values)
+
+        statements = StatementRecorder(self.registry.engine)
+        self.assertEqual([value.identifier for value in values],
+                         [value.identifier for value in self.registry.search('OSGB', profile='full')])
+        self.assertLess(3, len(statements))
+
+    def testSearchWithoutIndex(self):
+        fulltext.dropIndex(self.registry.engine)
+        values = self.registry.search('OSGB', types=[schema.CoordinateReferenceSystem])
+        self.assertEqual(['urn:ogc:def:crs:EPSG::4277', 'urn:ogc:def:crs:EPSG::27700'],
+                         [value.identifier for value in values])
+
+    def testStats(self):
+        stats = self.registry.stats()
+        self.assertEqual(17, len(stats))
+        self.assertEqual(1, stats['ProjectedCRS'])
+        self.assertEqual(10, stats['CoordinateSystemAxis'])
+        self.assertEqual(45, sum(stats.values()))
+
+        del self.registry['urn:ogc:def:crs:EPSG::27700']
+        self.assertNotIn('ProjectedCRS', self.registry.stats())
+
     def testUpdate(self):
         registry2 = Registry(loader=False)
         registry2.update(self.registry)
@@ -72,6 +351,12 @@ class TestRegistry(unittest.TestCase):
         self.assertIn('urn:ogc:def:crs:EPSG::27700', self.registry)
         self.assertNotIn('invalid key', self.registry)
 
+        # existence is checked without loading the object
+        statements = StatementRecorder(self.registry.engine)
+        self.assertIn('urn:ogc:def:crs:EPSG::27700', self.registry)
+        self.assertEqual(1, len(statements))
+        self.assertNotIn('FROM "ProjectedCRS"', statements.statements[0])
+
     def testIter(self):
         count = 0
         for key in self.registry:
@@ -97,5 +382,462 @@ class TestRegistry(unittest.TestCase):
             count += 1
         self.assertEqual(45, count)
 
+    def upsert(self, mapping, native=None):
+        if native is None:
+            self.registry.upsertMany(mapping)
+        else:
+            with self.registry.session.begin(subtransactions=True):
+                bulk.upsert(self.registry.session.connection(), mapping.itervalues(), native=native)
+            self.registry.session.expire_all()
+
+    def checkUpsert(self, native):
+        builder = SchemaBuilder()
+        crs = builder.buildCompoundCRS()
+        crs.name = 'Updated name'
+        crs.componentReferenceSystems.reverse()
+        crs.domainOfValidity.identifier = 'urn:ogc:def:area:EPSG::0001'
+        self.upsert({crs.identifier: crs}, native)
+
+        # existing objects are updated and new ones inserted
+        value = self.registry[crs.identifier]
+        self.assertEqual('Updated name', value.name)
+        self.assertEqual(['urn:ogc:def:crs:EPSG::3855', 'urn:ogc:def:crs:EPSG::4277'],
+                         [component.identifier for component in value.componentReferenceSystems])
+        self.assertEqual('urn:ogc:def:area:EPSG::0001', value.domainOfValidity.identifier)
+        self.assertEqual(46, len(self.registry))
+
+        # upserting unchanged objects is idempotent
+        self.upsert({crs.identifier: crs}, native)
+        self.assertEqual(46, len(self.registry))
+        self.assertEqual(2, len(self.registry[crs.identifier].componentReferenceSystems))
+
+    def testUpsertMany(self):
+        self.checkUpsert(None)
+
+    def testUpsertManyNative(self):
+        if not bulk.supportsNativeUpsert(self.registry.engine.dialect):
+            self.skipTest('native upserts are not supported')
+        self.checkUpsert(True)
+
+    def testUpsertManyGeneric(self):
+        self.checkUpsert(False)
+
+    def testUpsertManyChangedClass(self):
+        builder = SchemaBuilder()
+        key = 'urn:ogc:def:ellipsoid:EPSG::7001'
+        value = builder.buildAreaOfUse()
+        value.identifier = key
+
+        self.registry.upsertMany({key: value})
+        self.assertIsInstance(self.registry[key], schema.AreaOfUse)
+        self.assertEqual(0, self.registry.session.query(schema.Ellipsoid).filter_by(identifier=key).count())
+
+    def testUpsertManyInvalid(self):
+        value = SchemaBuilder().buildAreaOfUse()
+        with self.assertRaises(ValueError):
+            self.registry.upsertMany({'bad key': value})
+        with self.assertRaises(ValueError):
+            self.registry.upsertMany({value.identifier: 42})
+
+class TestRegistryProfiles(LoaderTestCase):
+
+    key = 'urn:ogc:def:crs:EPSG::27700'
+
+    def walk(self, profile):
+        """
+        Return the statements executed looking up and walking a ProjectedCRS
+        """
+        registry = Registry(loader=self.loader, profile=profile)
+        statements = StatementRecorder(registry.engine)
+        value = registry[self.key]
+        lookup = len(statements)
+        walk(value)
+        return lookup, len(statements)
+
+    def testShallow(self):
+        lookup, total = self.walk('shallow')
+        self.assertEqual(1, lookup)
+        self.assertGreater(total, 15)
+        self.assertEqual((lookup, total), self.walk(None))
+
+    def testDefinition(self):
+        lookup, total = self.walk('definition')
+        self.assertLess(lookup, 10)
+        # only the areas of use and axis names are loaded lazily
+        self.assertLess(total - lookup, 10)
+        self.assertLess(total, self.walk('shallow')[1])
+
+    def testFull(self):
+        lookup, total = self.walk('full')
+        self.assertLess(lookup, 10)
+        self.assertEqual(lookup, total)
+
+    def testGetMany(self):
+        registry = Registry(loader=self.loader)
+        statements = StatementRecorder(registry.engine)
+        value, = registry.getMany([self.key], profile='shallow')
+        self.assertEqual(1, len(statements))
+        walk(value)
+        self.assertGreater(len(statements), 10)
+
+        registry = Registry(loader=self.loader, profile='definition')
+        statements = StatementRecorder(registry.engine)
+        value, = registry.getMany([self.key])
+        count = len(statements)
+        value.baseGeodeticCRS.geodeticDatum.ellipsoid
+        self.assertEqual(count, len(statements))
+        value.domainOfValidity
+        self.assertEqual(count + 1, len(statements))
+
+    def testUnknownProfile(self):
+        with self.assertRaises(ValueError):
+            Registry(loader=False, profile='deep')
+        registry = Registry(loader=self.loader)
+        with self.assertRaises(ValueError):
+            registry.getMany([self.key], profile='deep')
+
+class TestRegistryPolymorphic(LoaderTestCase):
+
+    def lookup(self, polymorphic, key):
+        """
+        Return the statements executed looking up an object's columns
+        """
+        from sqlalchemy.orm import object_mapper
+
+        registry = Registry(loader=self.loader, polymorphic=polymorphic)
+        statements = StatementRecorder(registry.engine)
+        value = registry[key]
+        lookup = len(statements)
+        for prop in object_mapper(value).column_attrs:
+            getattr(value, prop.key)
+        total = len(statements)
+        self.assertEqual(self.loader[key], value)
+        return lookup, total
+
+    def testSelect(self):
+        lookup, total = self.lookup('select', 'urn:ogc:def:crs:EPSG::27700')
+        self.assertEqual(1, lookup)
+        self.assertEqual(2, total)
+
+    def testJoined(self):
+        self.assertEqual((1, 1), self.lookup('joined', 'urn:ogc:def:crs:EPSG::27700'))
+
+    def testDiscriminator(self):
+        self.assertEqual((2, 2), self.lookup('discriminator', 'urn:ogc:def:crs:EPSG::27700'))
+
+        registry = Registry(loader=self.loader, polymorphic='discriminator')
+        with self.assertRaises(KeyError):
+            registry['bad key']
+
+        for key, value in self.loader.items():
+            self.assertEqual(value, registry[key])
+
+        values = list(registry.itervalues())
+        self.assertEqual(len(self.loader), len(values))
+        self.assertEqual(sorted(self.loader.keys()), sorted(value.identifier for value in values))
+
+        keys = self.loader.keys()
+        self.assertEqual(keys, [value.identifier for value in registry.getMany(keys)])
+
+    def testUnknownMode(self):
+        with self.assertRaises(ValueError):
+            Registry(loader=False, polymorphic='subquery')
+
+class TestCachedRegistry(unittest.TestCase):
+
+    def setUp(self):
+        xml = load.XML.FromFile(getTestFile())
+        loader = load.XMLLoader(xml)
+        loader.load()
+        self.registry = Registry(loader=loader, cacheSize=10)
+        self.statements = StatementRecorder(self.registry.engine)
+
+    def testGetItem(self):
+        key = 'urn:ogc:def:crs:EPSG::27700'
+        value = self.registry[key]
+        count = len(self.statements)
+
+        # repeated lookups never query the database
+        self.assertIs(value, self.registry[key])
+        self.assertIn(key, self.registry)
+        self.assertEqual(count, len(self.statements))
+        self.assertEqual((2, 1), (self.registry.cache.hits, self.registry.cache.misses))
+
+    def testMissingKey(self):
+        for i in xrange(2):
+            with self.assertRaises(KeyError):
+                self.registry['bad key']
+        self.assertNotIn('bad key', self.registry)
+        self.assertEqual(1, len(self.statements))
+
+    def testGetMany(self):
+        keys = ['urn:ogc:def:crs:EPSG::27700', 'bad key']
+        self.assertEqual(1, len(self.registry.getMany(keys)))
+        count = len(self.statements)
+        self.assertEqual(1, len(self.registry.getMany(keys)))
+        self.assertNotIn('bad key', self.registry)
+        self.assertEqual(count, len(self.statements))
+
+    def testSetItem(self):
+        builder = SchemaBuilder()
+        key = 'urn:ogc:def:area:EPSG::0001'
+        self.assertNotIn(key, self.registry)
+
+        value = builder.buildAreaOfUse()
+        value.identifier = key
+        self.registry[key] = value
+        self.assertIn(key, self.registry)
+
+    def testDelItem(self):
+        key = 'urn:ogc:def:crs:EPSG::27700'
+        self.assertIn(key, self.registry)
+        del self.registry[key]
+        self.assertNotIn(key, self.registry)
+
+    def testClear(self):
+        key = 'urn:ogc:def:crs:EPSG::27700'
+        self.assertIn(key, self.registry)
+        self.registry.clear()
+        self.assertNotIn(key, self.registry)
+
+    def testInit(self):
+        key = 'urn:ogc:def:crs:EPSG::27700'
+        self.assertIn(key, self.registry)
+        self.registry.init(False)
+        self.assertNotIn(key, self.registry)
+
+class TestThreadSafeRegistry(LoaderTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        url = 'sqlite:///%s' % os.path.join(self.directory, 'registry.sqlite')
+        engine = Registry.CreateEngine(url, threadSafe=True)
+        self.registry = Registry(engine, loader=self.loader, cacheSize=10, threadSafe=True)
+
+    def tearDown(self):
+        self.registry.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def inThreads(self, func, count=4):
+        """
+        Return the results of calling a function concurrently in threads
+        """
+        results, errors = [None] * count, []
+        def run(i):
+            try:
+                results[i] = func()
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(i,)) for i in xrange(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        return results
+
+    def testCreateEngine(self):
+        from sqlalchemy.pool import QueuePool, StaticPool
+
+        self.assertIsInstance(self.registry.engine.pool, QueuePool)
+        engine = Registry.CreateEngine(threadSafe=True)
+        self.assertIsInstance(engine.pool, StaticPool)
+        self.assertNotIsInstance(Registry.CreateEngine().pool, StaticPool)
+
+        # in-memory registries are shared between threads
+        registry = Registry(loader=self.loader, threadSafe=True)
+        self.assertEqual([len(self.loader)] * 4, self.inThreads(lambda: len(registry)))
+
+    def testSessions(self):
+        key = 'urn:ogc:def:crs:EPSG::27700'
+        value = self.registry[key]
+
+        def lookup():
+            obj = self.registry[key]
+            walk(obj)
+            return obj, self.registry.session()
+
+        results = self.inThreads(lookup)
+        sessions = set([self.registry.session()] + [session for obj, session in results])
+        self.assertEqual(5, len(sessions))
+        for obj, session in results:
+            self.assertEqual(value, obj)
+            self.assertIsNot(value, obj)
+            self.assertIn(obj, session)
+
+    def testConcurrentLookups(self):
+        keys = sorted(self.loader.keys())
+        def lookup():
+            return [(key, self.registry[key].identifier, key in self.registry) for key in keys]
+        expected = [(key, key, True) for key in keys]
+        self.assertEqual([expected] * 8, self.inThreads(lookup, 8))
+
+    def testCounts(self):
+        self.registry.engine.dispose()
+        self.registry = Registry(self.registry.engine, cacheKeys=True, cacheCounts=True, threadSafe=True)
+        self.assertIsInstance(self.registry.lock, type(threading.RLock()))
+        expected = self.registry.stats()
+        value = self.registry['urn:ogc:def:crs:EPSG::27700']
+
+        # concurrent updates of the counts are not lost
+        def update():
+            for i in xrange(200):
+                self.registry.updateCounts([value], 1)
+        self.inThreads(update, 8)
+        expected['ProjectedCRS'] += 1600
+        self.assertEqual(expected, self.registry.stats())
+
+    def testWrites(self):
+        key = 'urn:ogc:def:crs:EPSG::27700'
+        self.inThreads(lambda: self.registry[key])
+        del self.registry[key]
+
+        # writes are seen by every thread
+        self.assertEqual([False] * 4, self.inThreads(lambda: key in self.registry))
+
+class TestKeySetRegistry(unittest.TestCase):
+
+    def setUp(self):
+        xml = load.XML.FromFile(getTestFile())
+        self.loader = load.XMLLoader(xml)
+        self.loader.load()
+        self.registry = Registry(loader=self.loader, cacheKeys=True)
+        self.statements = StatementRecorder(self.registry.engine)
+
+    def testNormalisedKeys(self):
+        self.assertIn('EPSG:27700', self.registry)
+        self.assertIsInstance(self.registry[1264], schema.AreaOfUse)
+        self.assertNotIn('EPSG:99999', self.registry)
+        self.assertEqual(1, len(self.statements))
+
+    def testPaddedCode(self):
+        # codes are resolved from the stored identifiers as written
+        value = SchemaBuilder().buildAreaOfUse()
+        value.identifier = 'urn:ogc:def:area:EPSG::0001'
+        self.registry[value.identifier] = value
+        self.assertEqual(value.identifier, self.registry[1].identifier)
+        self.assertEqual(value.identifier, self.registry['EPSG:1'].identifier)
+        self.assertIn(1, self.registry)
+
+    def testContains(self):
+        self.assertEqual(set(self.loader.keys()), self.registry.keySet)
+        self.assertIn('urn:ogc:def:crs:EPSG::27700', self.registry)
+        self.assertNotIn('bad key', self.registry)
+        self.assertNotIn(42, self.registry)
+        with self.assertRaises(KeyError):
+            self.registry['bad key']
+        self.assertEqual([], self.registry.getMany(['bad key']))
+        self.assertEqual(0, len(self.statements))
+
+    def testSetItem(self):
+        value = SchemaBuilder().buildGeodeticDatum()
+        value.identifier = 'urn:ogc:def:datum:EPSG::0001'
+        value.domainOfValidity.identifier = 'urn:ogc:def:area:EPSG::0001'
+        self.registry[value.identifier] = value
+
+        # referenced objects are added too
+        self.assertIn('urn:ogc:def:datum:EPSG::0001', self.registry)
+        self.assertIn('urn:ogc:def:area:EPSG::0001', self.registry)
+        self.assertIsInstance(self.registry['urn:ogc:def:area:EPSG::0001'], schema.AreaOfUse)
+
+    def testDelItem(self):
+        del self.registry['urn:ogc:def:crs:EPSG::27700']
+        self.assertNotIn('urn:ogc:def:crs:EPSG::27700', self.registry)
+
+    def testClear(self):
+        self.registry.clear()
+        self.assertNotIn('urn:ogc:def:crs:EPSG::27700', self.registry)
+
+    def testInit(self):
+        self.registry.init(False)
+        self.assertNotIn('urn:ogc:def:crs:EPSG::27700', self.registry)
+        self.registry.bulkInsert([self.loader['urn:ogc:def:crs:EPSG::27700']])
+        self.assertIn('urn:ogc:def:crs:EPSG::27700', self.registry)
+        self.assertIn('urn:ogc:def:ellipsoid:EPSG::7001', self.registry)
+
+    def testUpsertMany(self):
+        value = SchemaBuilder().buildAreaOfUse()
+        value.identifier = 'urn:ogc:def:area:EPSG::0001'
+        self.registry.upsertMany({value.identifier: value})
+        self.assertIn(value.identifier, self.registry)
+
+class TestCountedRegistry(unittest.TestCase):
+
+    def setUp(self):
+        xml = load.XML.FromFile(getTestFile())
+        self.loader = load.XMLLoader(xml)
+        self.loader.load()
+        self.registry = Registry(loader=self.loader, cacheCounts=True)
+        self.statements = StatementRecorder(self.registry.engine)
+
+    def checkCounts(self):
+        counts = self.registry.stats()
+        self.registry.counts = None
+        self.assertEqual(self.registry.stats(), counts)
+        self.assertEqual(len(self.registry), sum(counts.values()))
+
+    def testLen(self):
+        # the counts are maintained when the registry is initialised
+        self.assertEqual(45, len(self.registry))
+        self.assertEqual(1, self.registry.stats()['ProjectedCRS'])
+        self.assertEqual(0, len(self.statements))
+        self.checkCounts()
+
+    def testSetItem(self):
+        value = SchemaBuilder().buildAreaOfUse()
+        value.identifier = 'urn:ogc:def:area:EPSG::0001'
+        self.registry[value.identifier] = value
+        count = len(self.statements)
+        self.assertEqual(46, len(self.registry))
+        self.assertEqual(6, self.registry.stats()['AreaOfUse'])
+        self.assertEqual(count, len(self.statements))
+        self.checkCounts()
+
+        # replacing an object with references
+        crs = self.loader['urn:ogc:def:crs:EPSG::27700']
+        self.registry[crs.identifier] = crs
+        count = len(self.statements)
+        self.assertEqual(46, len(self.registry))
+        self.assertEqual(1, self.registry.stats()['ProjectedCRS'])
+        self.assertEqual(count, len(self.statements))
+        self.checkCounts()
+
+    def testDelItem(self):
+        del self.registry['urn:ogc:def:crs:EPSG::27700']
+        count = len(self.statements)
+        self.assertEqual(44, len(self.registry))
+        self.assertNotIn('ProjectedCRS', self.registry.stats())
+        self.assertEqual(count, len(self.statements))
+        self.checkCounts()
+
+    def testClear(self):
+        self.registry.clear()
+        self.assertEqual(0, len(self.registry))
+        self.checkCounts()
+
+    def testBulkInsert(self):
+        self.registry.init(False)
+        self.registry.bulkInsert([self.loader['urn:ogc:def:crs:EPSG::27700']])
+        self.assertEqual(1, self.registry.stats()['ProjectedCRS'])
+        self.checkCounts()
+
+    def testUpsertMany(self):
+        value = SchemaBuilder().buildAreaOfUse()
+        value.identifier = 'urn:ogc:def:ellipsoid:EPSG::7001'
+        self.registry.upsertMany({value.identifier: value})
+        count = len(self.statements)
+        self.assertEqual(1, self.registry.stats()['Ellipsoid'])
+        self.assertEqual(45, len(self.registry))
+        self.assertEqual(count, len(self.statements))
+        self.checkCounts()
+
+        # new objects are counted
+        value = SchemaBuilder().buildAreaOfUse()
+        value.identifier = 'urn:ogc:def:area:EPSG::0001'
+        self.registry.upsertMany({value.identifier: value})
+        self.assertEqual(46, len(self.registry))
+        self.assertEqual(7, self.registry.stats()['AreaOfUse'])
+        self.checkCounts()
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -2,8 +2,8 @@
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from epsg import schema
-from test import unittest, SchemaBuilder
+from epsg import schema, urn
+from test import unittest, SchemaBuilder, explain
 
 class TestDictionaryEntry(unittest.TestCase):
     """
@@ -57,6 +57,15 @@ class TestDictionaryEntry(unittest.TestCase):
         obj = results[0]
         self.assertInsert(obj)
 
+    def testIdentifierComponents(self):
+        self.assertEqual(urn.parse(self.obj.identifier), (self.obj.objectType, self.obj.code))
+
+        # the components follow changes to the identifier
+        self.obj.identifier = 'urn:ogc:def:crs:EPSG:6.3:4326'
+        self.assertEqual(('crs', 4326), (self.obj.objectType, self.obj.code))
+        self.obj.identifier = 'unique:urn'
+        self.assertEqual((None, None), (self.obj.objectType, self.obj.code))
+
 class TestPrimeMeridian(TestDictionaryEntry):
     pass
 
@@ -134,5 +143,28 @@ class TestEngineeringCRS(TestDictionaryEntry):
 class TestCompoundCRS(TestDictionaryEntry):
     pass
 
+class TestIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        schema.Base.metadata.create_all(self.engine)
+
+    def checkPlan(self, statement, parameters=()):
+        plan = explain(self.engine, statement, parameters)
+        self.assertIn('USING', plan)
+        self.assertNotRegexpMatches(plan, r'\bSCAN\b')
+        return plan
+
+    def testForeignKeys(self):
+        # reverse lookups through every foreign key use an index
+        for table in schema.Base.metadata.sorted_tables:
+            for column in table.columns:
+                if column.foreign_keys and not column.primary_key:
+                    self.checkPlan('SELECT * FROM "%s" WHERE "%s" = ?' % (table.name, column.name), ('key',))
+
+    def testColumns(self):
+        self.checkPlan('SELECT identifier FROM "DictionaryEntry" WHERE name = ?', ('OSGB 1936',))
+        self.checkPlan('SELECT identifier FROM "Identifier" WHERE class = ?', ('ProjectedCRS',))
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
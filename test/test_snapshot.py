@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from sqlalchemy.orm import object_mapper
+from epsg import Registry, schema, snapshot
+from test import unittest, LoaderTestCase
+
+class TestSnapshot(LoaderTestCase):
+
+    def setUp(self):
+        self.snapshot = self.loader.snapshot()
+
+    def checkRecord(self, record, obj):
+        """
+        Check a record mirrors a schema object
+        """
+        mapper = object_mapper(obj)
+        self.assertEqual(mapper.class_.__name__, record.__class__.__name__)
+        for prop in mapper.column_attrs:
+            if not prop.key.startswith('_'):
+                self.assertEqual(getattr(obj, prop.key), getattr(record, prop.key))
+        for prop in mapper.relationships:
+            value = getattr(obj, prop.key)
+            if prop.uselist:
+                self.assertEqual([child.identifier for child in value],
+                                 [child.identifier for child in getattr(record, prop.key)])
+            elif value is None:
+                self.assertIsNone(getattr(record, prop.key))
+            else:
+                self.assertIs(self.snapshot[value.identifier], getattr(record, prop.key))
+
+    def testRecords(self):
+        self.assertEqual(sorted(self.loader.keys()), sorted(self.snapshot.keys()))
+        for key, value in self.loader.items():
+            self.checkRecord(self.snapshot[key], value)
+
+    def testRecordClasses(self):
+        crs = self.snapshot['urn:ogc:def:crs:EPSG::27700']
+        self.assertIsInstance(crs, snapshot.ProjectedCRS)
+        self.assertIsInstance(crs, snapshot.CoordinateReferenceSystem)
+        self.assertNotIsInstance(crs, schema.Identifier)
+        self.assertFalse(hasattr(crs, '__dict__'))
+        self.assertIn('baseGeodeticCRS', crs.fields)
+        self.assertEqual(('domainOfValidity', 'baseGeodeticCRS', 'cartesianCS'), crs.references)
+        self.assertEqual("<ProjectedCRS('urn:ogc:def:crs:EPSG::27700')>", repr(crs))
+
+        cs = self.snapshot['urn:ogc:def:cs:EPSG::6404']
+        self.assertIsInstance(cs.axes, tuple)
+
+    def testImmutable(self):
+        crs = self.snapshot['urn:ogc:def:crs:EPSG::27700']
+        with self.assertRaises(AttributeError):
+            crs.name = 'changed'
+        with self.assertRaises(AttributeError):
+            del crs.name
+        with self.assertRaises(AttributeError):
+            crs.other = 'value'
+
+    def testMapping(self):
+        self.assertEqual(45, len(self.snapshot))
+        self.assertIn('urn:ogc:def:crs:EPSG::27700', self.snapshot)
+        self.assertNotIn('bad key', self.snapshot)
+        with self.assertRaises(KeyError):
+            self.snapshot['bad key']
+        with self.assertRaises(TypeError):
+            self.snapshot[4.2]
+        self.assertNotIn(4.2, self.snapshot)
+
+    def testNormalisedKeys(self):
+        # keys are accepted in the same forms as by a registry
+        crs = self.snapshot['urn:ogc:def:crs:EPSG::27700']
+        for key in ('urn:ogc:def:crs:EPSG:6.3:27700', 'URN:OGC:DEF:crs:EPSG::27700',
+                    'http://www.opengis.net/def/crs/EPSG/0/27700', 'EPSG:27700', '27700', 27700):
+            self.assertIs(crs, self.snapshot[key])
+            self.assertIn(key, self.snapshot)
+        self.assertIsInstance(self.snapshot['EPSG:1264'], snapshot.AreaOfUse)
+        self.assertNotIn('EPSG:99999', self.snapshot)
+        with self.assertRaises(KeyError) as context:
+            self.snapshot['EPSG:99999']
+        self.assertEqual('EPSG:99999', context.exception.args[0])
+        self.assertEqual([crs], self.snapshot.getMany([27700, 'EPSG:99999']))
+
+    def testGetMany(self):
+        keys = ['urn:ogc:def:crs:EPSG::27700', 'bad key', 'urn:ogc:def:area:EPSG::1264']
+        self.assertEqual([keys[0], keys[2]], [value.identifier for value in self.snapshot.getMany(keys)])
+        self.assertIsNone(self.snapshot.getMany(keys, missing=None)[1])
+        with self.assertRaises(KeyError):
+            self.snapshot.getMany(keys, missing='raise')
+
+    def testRegistrySnapshot(self):
+        registry = Registry(loader=self.loader)
+        copy = registry.snapshot()
+        self.assertEqual(self.snapshot, copy)
+        self.assertEqual(registry.stats(), copy.stats())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+from epsg import Registry, schema, spatial
+from test import unittest, LoaderTestCase, SchemaBuilder
+
+class TestSpatial(LoaderTestCase):
+
+    def setUp(self):
+        self.registry = Registry(loader=self.loader)
+        self.connection = self.registry.engine.connect()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def getIndex(self):
+        # the identifier of the area and the number of the box, along
+        # with its bounds
+        query = 'SELECT k.identifier, r.id - k.id * 2, r.minX, r.maxX, r.minY, r.maxY ' \
+            'FROM "%s" r JOIN "%s" k ON k.id = r.id / 2 ORDER BY r.id' % (spatial.RTREE_TABLE, spatial.RTREE_KEY_TABLE)
+        return [tuple(row) for row in self.connection.execute(query)]
+
+    def getIdentifiers(self):
+        return sorted(set(row[0] for row in self.getIndex()))
+
+    def testSplitBBox(self):
+        self.assertEqual([(-10, 40, 10, 60)], spatial.splitBBox(-10, 40, 10, 60))
+        self.assertEqual([(170, -50, 180, -40), (-180, -50, -170, -40)], spatial.splitBBox(170, -50, -170, -40))
+        with self.assertRaises(ValueError):
+            spatial.splitBBox(-10, 60, 10, 40)
+        with self.assertRaises(TypeError):
+            spatial.splitBBox('-10', 40, 10, 60)
+
+    def testCreateRTree(self):
+        if not spatial.supportsRTree(self.connection):
+            self.skipTest('R-tree indexes are not supported')
+        self.assertTrue(spatial.hasRTree(self.connection))
+        self.assertEqual(['urn:ogc:def:area:EPSG::%d' % code for code in (1262, 1264, 1265, 1298, 3594)],
+                         self.getIdentifiers())
+
+        self.registry.init(False)
+        self.assertTrue(spatial.hasRTree(self.connection))
+        self.assertEqual([], self.getIndex())
+
+        schema.Base.metadata.drop_all(self.registry.engine)
+        self.assertFalse(spatial.hasRTree(self.connection))
+
+    def testMaintainRTree(self):
+        if not spatial.supportsRTree(self.connection):
+            self.skipTest('R-tree indexes are not supported')
+
+        # areas crossing the antimeridian are split in two
+        area = self.registry['urn:ogc:def:area:EPSG::1265']
+        area.westBoundLongitude, area.eastBoundLongitude = 170, -170
+        self.registry.session.flush()
+        key = 'urn:ogc:def:area:EPSG::1265'
+        self.assertEqual([(0, 170, 180), (1, -180, -170)],
+                         [row[1:4] for row in self.getIndex() if row[0] == key])
+
+        area = SchemaBuilder().buildAreaOfUse()
+        area.identifier = key
+        self.registry.upsertMany({area.identifier: area})
+        self.assertEqual([0], [row[1] for row in self.getIndex() if row[0] == key])
+
+        del self.registry['urn:ogc:def:area:EPSG::1264']
+        self.assertEqual(['urn:ogc:def:area:EPSG::%d' % code for code in (1262, 1265, 1298, 3594)],
+                         self.getIdentifiers())
+
+        # areas without an EPSG code are indexed too
+        area = SchemaBuilder().buildAreaOfUse()
+        area.identifier = 'urn:example:area:1'
+        self.registry[area.identifier] = area
+        self.registry.session.flush()
+        self.assertIn(area.identifier, self.getIdentifiers())
+        query = spatial.getAreaQuery(spatial.splitBBox(-1.5, 52.5, -1.5, 52.5), True)
+        self.assertIn(area.identifier, [row[0] for row in self.connection.execute(query)])
+
+    def testGetTypes(self):
+        datum, crs = schema.Datum.__table__, schema.CoordinateReferenceSystem.__table__
+        self.assertEqual({datum: None, crs: None}, spatial.getTypes(None))
+        self.assertEqual({crs: set(['ProjectedCRS'])}, spatial.getTypes([schema.ProjectedCRS]))
+        self.assertEqual({datum: set(['Datum', 'GeodeticDatum', 'VerticalDatum', 'EngineeringDatum']),
+                          crs: set(['GeodeticCRS'])},
+                         spatial.getTypes([schema.Datum, schema.GeodeticCRS]))
+        with self.assertRaises(ValueError):
+            spatial.getTypes([schema.Ellipsoid])
+
+    def testFind(self):
+        boxes = spatial.splitBBox(-68, -46, -68, -46)
+        expected = ['urn:ogc:def:crs:EPSG::3855', 'urn:ogc:def:crs:EPSG::5800',
+                    'urn:ogc:def:datum:EPSG::1027', 'urn:ogc:def:datum:EPSG::9300']
+        self.assertEqual(expected, spatial.find(self.connection, boxes))
+        self.assertEqual([], spatial.find(self.connection, boxes, []))
+
+        # the R-tree and a scan of the table give the same results
+        for box in [(-1.5, 52.5, -1.5, 52.5), (170, -50, -60, -40), (0, 0, 0, 0), (-180, -90, 180, 90)]:
+            boxes = spatial.splitBBox(*box)
+            query = spatial.getAreaQuery(boxes, True)
+            indexed = sorted(row[0] for row in self.connection.execute(query))
+            scanned = sorted(row[0] for row in self.connection.execute(spatial.getAreaQuery(boxes)))
+            self.assertEqual(scanned, indexed)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
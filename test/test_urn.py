@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from epsg import urn
+from test import unittest
+
+class TestURN(unittest.TestCase):
+
+    def testParse(self):
+        self.assertEqual(('crs', 27700), urn.parse('urn:ogc:def:crs:EPSG::27700'))
+        self.assertEqual(('axis-name', 9901), urn.parse('urn:ogc:def:axis-name:EPSG::9901'))
+        self.assertEqual(('crs', 4326), urn.parse('urn:ogc:def:crs:EPSG:6.3:4326'))
+
+    def testParseInvalid(self):
+        for identifier in ('unique:urn', 'urn:ogc:def:crs:EPSG::', 'urn:ogc:def:crs:OGC:1.3:84', '', None):
+            self.assertEqual((None, None), urn.parse(identifier))
+
+    def testNormalise(self):
+        for key in ('urn:ogc:def:crs:EPSG::4326', 'urn:ogc:def:crs:EPSG:6.3:4326',
+                    'urn:x-ogc:def:crs:EPSG::4326', 'URN:OGC:DEF:crs:epsg::4326',
+                    'http://www.opengis.net/def/crs/EPSG/0/4326', ' urn:ogc:def:crs:EPSG::4326 '):
+            self.assertEqual(('urn:ogc:def:crs:EPSG::4326', 4326), urn.normalise(key))
+
+        for key in ('EPSG:4326', 'epsg:4326', 'EPSG::4326', '4326', 4326, 4326L):
+            self.assertEqual((None, 4326), urn.normalise(key))
+
+        # the case of object types is kept
+        self.assertEqual(('urn:ogc:def:coordinateOperation:EPSG::19916', 19916),
+                         urn.normalise('urn:ogc:def:coordinateOperation:EPSG::19916'))
+        self.assertEqual(('urn:ogc:def:Area:EPSG::1', 1), urn.normalise('URN:OGC:DEF:Area:EPSG::1'))
+
+        # codes are not reformatted
+        self.assertEqual(('urn:ogc:def:area:EPSG::0001', 1), urn.normalise('urn:ogc:def:area:EPSG::0001'))
+
+    def testNormaliseInvalid(self):
+        for key in ('unique:urn', 'EPSG:', 'urn:ogc:def:crs:OGC:1.3:CRS84', -1, True, 4.2, None, [1]):
+            self.assertIsNone(urn.normalise(key))
+
+    def testNormaliseMemoised(self):
+        key = 'http://www.opengis.net/def/crs/EPSG/0/27700'
+        self.assertIs(urn.normalise(key), urn.normalise(key))
+
+        # canonical keys are returned as is
+        key = 'urn:ogc:def:crs:EPSG::%d' % 31337
+        self.assertIs(key, urn.normalise(key)[0])
+
+    def testChoose(self):
+        self.assertEqual('urn:ogc:def:crs:EPSG::1', urn.choose(['urn:ogc:def:area:EPSG::1', 'urn:ogc:def:crs:EPSG::1']))
+        self.assertEqual('urn:ogc:def:datum:EPSG::1', urn.choose(['urn:ogc:def:other:EPSG::1', 'urn:ogc:def:datum:EPSG::1']))
+        self.assertEqual('urn:ogc:def:a:EPSG::1', urn.choose(['urn:ogc:def:b:EPSG::1', 'urn:ogc:def:a:EPSG::1']))
+        self.assertIsNone(urn.choose([]))
+
+    def testIndexCodes(self):
+        identifiers = ['urn:ogc:def:crs:EPSG::1', 'urn:ogc:def:area:EPSG::0001', 'urn:ogc:def:crs:EPSG::2', 'other']
+        self.assertEqual({1: identifiers[:2], 2: identifiers[2:3]}, urn.indexCodes(identifiers))
+
+    def testFormat(self):
+        self.assertEqual('urn:ogc:def:crs:EPSG::27700', urn.format('crs', 27700))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)